@@ -4,7 +4,7 @@ Contiene ajustes para la base de datos, aplicaciones instaladas, middleware,
 archivos estáticos, autenticación y configuración de Django REST Framework.
 """
 from pathlib import Path
-from decouple import config, UndefinedValueError
+from decouple import Csv, config, UndefinedValueError
 import dj_database_url
 import os
 
@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # Búsqueda de texto completo y por trigramas
     'rest_framework', # Django REST Framework
     'corsheaders',    # Para manejar CORS en la API
     'books',          # Tu aplicación principal
@@ -43,13 +44,15 @@ INSTALLED_APPS = [
 
 # Middleware utilizado para procesar solicitudes y respuestas.
 MIDDLEWARE = [
+    'books.instrumentacion.InstrumentacionMiddleware', # Mide consultas SQL y tiempos (cabecera Server-Timing)
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware', # Para servir archivos estáticos en producción
+    'books.estaticos.WhiteNoiseAsincronoMiddleware', # Archivos estáticos en producción (WhiteNoise, compatible con ASGI)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',      # Debe ir después de SessionMiddleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'books.replicas.ReplicasMiddleware', # Lecturas en réplicas y lectura de las propias escrituras
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -62,8 +65,16 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'], # Directorio para plantillas globales del proyecto
-        'APP_DIRS': True, # Permite a las aplicaciones buscar sus propias plantillas
         'OPTIONS': {
+            # Las plantillas se compilan una vez por proceso y se reutilizan (cargador en caché).
+            # Se buscan en DIRS y después en las aplicaciones; en desarrollo el autoreloader
+            # vacía la caché al modificar una plantilla.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -86,7 +97,8 @@ try:
         'default': dj_database_url.config(
             default=DATABASE_URL,
             conn_max_age=600, # Mantener conexiones persistentes por 10 minutos
-            ssl_require=True  # Requerir SSL para la conexión a la base de datos (común en Heroku)
+            # Requerir SSL para la conexión a la base de datos (común en Heroku); SQLite no lo admite.
+            ssl_require=DATABASE_URL.startswith('postgres'),
         )
     }
 except UndefinedValueError:
@@ -102,6 +114,105 @@ except UndefinedValueError:
         }
     }
 
+# Réplicas de solo lectura (p. ej. followers de Heroku Postgres), como URLs separadas
+# por comas en DATABASE_REPLICA_URLS. Las vistas de lectura del catálogo consultan
+# una de ellas y el resto de la aplicación usa la principal (ver books/replicas.py).
+DATABASE_REPLICAS = []
+for numero, url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv()), start=1):
+    DATABASES[f'replica{numero}'] = dj_database_url.parse(
+        url, conn_max_age=600, ssl_require=url.startswith('postgres'),
+    )
+    DATABASE_REPLICAS.append(f'replica{numero}')
+DATABASE_ROUTERS = ['books.replicas.ReplicaRouter']
+# Segundos que las lecturas de un usuario van a la principal después de modificar datos.
+# Debe superar el retraso habitual de las réplicas.
+REPLICAS_FIJAR_SEGUNDOS = config('REPLICAS_FIJAR_SEGUNDOS', default=5, cast=int)
+
+
+# Configuración de la caché.
+# En producción se usa Redis (REDIS_URL, p. ej. del complemento Heroku Key-Value Store);
+# en desarrollo y pruebas, una caché en memoria local del proceso.
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'biblioteca',
+        }
+    }
+
+# Difusión de los cambios de stock por Server-Sent Events (ver books/eventos.py). Con
+# REDIS_URL los cambios se reparten entre procesos por Redis pub/sub; si no, solo
+# dentro del proceso que los confirma.
+EVENTOS_CENTRAL = 'books.eventos.CentralRedis' if REDIS_URL else 'books.eventos.CentralLocal'
+# Espera tras un cambio para enviar juntos los que llegan seguidos.
+EVENTOS_AGRUPAR_SEGUNDOS = config('EVENTOS_AGRUPAR_SEGUNDOS', default=0.5, cast=float)
+# Intervalo de los latidos que mantienen abierta una conexión sin cambios.
+EVENTOS_LATIDO_SEGUNDOS = config('EVENTOS_LATIDO_SEGUNDOS', default=15, cast=float)
+# Espera que indica al navegador antes de reconectar (campo `retry` de SSE).
+EVENTOS_REINTENTO_MS = config('EVENTOS_REINTENTO_MS', default=3000, cast=int)
+# Conexiones al flujo de eventos que puede mantener abiertas a la vez cada usuario (o IP).
+EVENTOS_CONEXIONES_POR_CLIENTE = config('EVENTOS_CONEXIONES_POR_CLIENTE', default=5, cast=int)
+
+# Límite de peticiones por coste (ver books/limites.py): unidades por cliente y por
+# ventana deslizante de LIMITE_VENTANA_SEGUNDOS, para usuarios autenticados y por IP
+# para las peticiones anónimas, y coste de cada tipo de petición.
+LIMITE_VENTANA_SEGUNDOS = config('LIMITE_VENTANA_SEGUNDOS', default=60, cast=int)
+LIMITE_USUARIO = config('LIMITE_USUARIO', default=600, cast=int)
+LIMITE_IP = config('LIMITE_IP', default=300, cast=int)
+LIMITE_COSTES = {
+    'peticion': 1,
+    'prestamo': 10, # Préstamo, devolución o reserva: una transacción de escritura.
+    'operacion_lote': 5, # Por cada operación de un lote, que comparten una transacción.
+}
+
+# Segundos que se conservan las respuestas cacheadas del catálogo. Las claves están
+# versionadas, así que este valor solo limita la memoria usada, no la frescura de los datos.
+CATALOGO_CACHE_TIMEOUT = config('CATALOGO_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Segundos que se conserva en la caché el usuario de una sesión.
+USUARIO_CACHE_TIMEOUT = config('USUARIO_CACHE_TIMEOUT', default=300, cast=int)
+
+# Días desde la devolución tras los cuales un préstamo se mueve al archivo
+# (comando 'archivar_prestamos').
+PRESTAMOS_ARCHIVO_DIAS = config('PRESTAMOS_ARCHIVO_DIAS', default=365, cast=int)
+
+# Instrumentación por petición (ver 'books.instrumentacion'): cabecera Server-Timing (opcional),
+# log de peticiones lentas o con consultas repetidas y percentiles por ruta en /api/metricas/.
+INSTRUMENTACION_ACTIVA = config('INSTRUMENTACION_ACTIVA', default=True, cast=bool)
+# La cabecera Server-Timing revela el tiempo de base de datos y el nº de consultas de
+# cada respuesta: por defecto solo se envía en desarrollo.
+INSTRUMENTACION_CABECERA = config('INSTRUMENTACION_CABECERA', default=DEBUG, cast=bool)
+INSTRUMENTACION_UMBRAL_LENTO_MS = config('INSTRUMENTACION_UMBRAL_LENTO_MS', default=500, cast=float)
+# Veces que debe repetirse una misma consulta en una petición para considerarla un N+1.
+INSTRUMENTACION_UMBRAL_REPETIDAS = config('INSTRUMENTACION_UMBRAL_REPETIDAS', default=5, cast=int)
+# Muestras recientes que se conservan por ruta para calcular los percentiles.
+INSTRUMENTACION_MUESTRAS = config('INSTRUMENTACION_MUESTRAS', default=1000, cast=int)
+
+# Tokens de acceso a la API (ver 'books.tokens'): validez por defecto y segundos que
+# cada proceso conserva en memoria el usuario de un token ya verificado.
+TOKEN_DURACION_DIAS = config('TOKEN_DURACION_DIAS', default=30, cast=int)
+TOKEN_CACHE_SEGUNDOS = config('TOKEN_CACHE_SEGUNDOS', default=30, cast=int)
+
+# Los registros de la aplicación se escriben en la salida estándar (Heroku los recoge de ahí).
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'books': {'handlers': ['console'], 'level': config('BOOKS_LOG_LEVEL', default='WARNING')},
+    },
+}
+
 
 # Configuración de internacionalización.
 LANGUAGE_CODE = 'es-es'
@@ -126,6 +237,17 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Modelo de usuario personalizado.
 AUTH_USER_MODEL = 'books.Usuario'
 
+# El usuario de la sesión se lee de la caché (ver 'books.backends'). ModelBackend se
+# mantiene para que las sesiones abiertas antes de este cambio sigan siendo válidas.
+AUTHENTICATION_BACKENDS = [
+    'books.backends.UsuarioCacheBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+# Sesiones en la caché con respaldo en la base de datos: las lecturas no consultan
+# la tabla de sesiones mientras la sesión siga en la caché.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 # URLs de login y logout para el sistema de autenticación de Django.
 LOGIN_URL = 'books:login' # Nombre de la URL para el login.
 LOGIN_REDIRECT_URL = 'books:listar_libros' # Redirección después de login exitoso.
@@ -142,20 +264,36 @@ CORS_ALLOWED_ORIGINS = [
     "https://prueba-django-2db3239ec097.herokuapp.com", 
 ]
 
+def renderizadores_api(debug: bool) -> list[str]:
+    """
+    Renderizadores de la API. La API navegable solo se ofrece en desarrollo: en
+    producción renderiza formularios y plantillas HTML en cada petición desde un navegador.
+    """
+    renderizadores = [
+        'books.renderers.JSONRapidoRenderer', # JSON con orjson (misma salida que JSONRenderer, más rápido).
+    ]
+    if debug:
+        renderizadores.append('rest_framework.renderers.BrowsableAPIRenderer')
+    return renderizadores
+
 # Configuración de Django REST Framework.
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        # Tokens emitidos en /api/tokens/; sustituyen a BasicAuthentication, que
+        # calculaba el hash PBKDF2 de la contraseña en cada petición. Va primero para
+        # que las peticiones sin credenciales reciban 401 con WWW-Authenticate: Bearer.
+        'books.authentication.TokenAutenticacion',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
-        # Puedes añadir 'rest_framework.authentication.TokenAuthentication' si implementas tokens.
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         # Permiso global por defecto: permite lectura a todos, escritura solo a autenticados.
         # Las vistas específicas de la API sobrescriben esto con permisos más granulares.
         'rest_framework.permissions.IsAuthenticatedOrReadOnly', 
     ],
-    'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
-        'rest_framework.renderers.BrowsableAPIRenderer', # Útil para depuración en el navegador.
+    'DEFAULT_THROTTLE_CLASSES': [
+        # Límite por coste en la caché compartida (ver books/limites.py). Las vistas de
+        # préstamos y de lotes usan subclases con un coste mayor.
+        'books.limites.LimiteCoste',
     ],
+    'DEFAULT_RENDERER_CLASSES': renderizadores_api(DEBUG),
 }
@@ -1,6 +1,129 @@
+import json
+from datetime import datetime, timedelta
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Usuario, Libro, Prestamo
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Exists, Max, Min, Q, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .filtros import FiltrosCatalogo, facetas
+from .models import Usuario, Autor, Libro, Prestamo, PrestamoArchivado, Reserva, TokenAcceso, normalizar_autor
+from .search import buscar_libros
+
+class PaginadorEstimado(Paginator):
+    """
+    Paginador que, en PostgreSQL, toma el número de filas de la estimación del
+    planificador (EXPLAIN) en lugar de ejecutar COUNT(*), que en tablas de decenas
+    de millones de filas recorre la tabla entera. Si la estimación es pequeña se
+    cuenta con exactitud, porque entonces COUNT(*) es barato.
+    """
+    conteo_exacto_hasta = 50_000
+
+    @cached_property
+    def count(self) -> int:
+        queryset = self.object_list
+        if connections[queryset.db].vendor != 'postgresql':
+            return super().count
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        estimacion = int(plan[0]['Plan']['Plan Rows'])
+        return estimacion if estimacion > self.conteo_exacto_hasta else super().count
+
+class FechasIndexadasQuerySet(QuerySet):
+    """
+    QuerySet del listado del admin cuyo `datetimes()` (la navegación por fechas de
+    `date_hierarchy`) no agrupa toda la tabla con DISTINCT: toma el rango con MIN y
+    MAX y comprueba en una sola consulta, con un EXISTS por cada año, mes o día
+    candidato, cuáles tienen filas. Cada EXISTS se resuelve sobre el índice de la fecha.
+    """
+    def datetimes(self, field_name, kind, order='ASC', tzinfo=None):
+        if kind not in ('year', 'month', 'day'):
+            return super().datetimes(field_name, kind, order, tzinfo)
+        rango = self.aggregate(primera=Min(field_name), ultima=Max(field_name))
+        if rango['primera'] is None:
+            return []
+        zona = tzinfo or timezone.get_current_timezone()
+        inicio = self._truncar(timezone.localtime(rango['primera'], zona), kind)
+        ultima = timezone.localtime(rango['ultima'], zona)
+        candidatos = {}
+        while inicio <= ultima:
+            siguiente = self._siguiente(inicio, kind)
+            rango_periodo = {f'{field_name}__gte': inicio, f'{field_name}__lt': siguiente}
+            candidatos[f'periodo_{len(candidatos)}'] = (inicio, Exists(self.order_by().filter(**rango_periodo)))
+            inicio = siguiente
+        # Los EXISTS se evalúan sobre una sola fila del propio queryset (no vacío, por el MIN).
+        existen = self.order_by().annotate(
+            **{nombre: existe for nombre, (_, existe) in candidatos.items()}
+        ).values(*candidatos)[0]
+        periodos = [inicio for nombre, (inicio, _) in candidatos.items() if existen[nombre]]
+        return periodos if order == 'ASC' else periodos[::-1]
+
+    @staticmethod
+    def _truncar(momento: datetime, kind: str) -> datetime:
+        momento = momento.replace(hour=0, minute=0, second=0, microsecond=0)
+        if kind in ('year', 'month'):
+            momento = momento.replace(day=1)
+        return momento.replace(month=1) if kind == 'year' else momento
+
+    @staticmethod
+    def _siguiente(inicio: datetime, kind: str) -> datetime:
+        if kind == 'day':
+            return timezone.make_aware(inicio.replace(tzinfo=None) + timedelta(days=1), inicio.tzinfo)
+        if kind == 'month':
+            return inicio.replace(year=inicio.year + inicio.month // 12, month=inicio.month % 12 + 1)
+        return inicio.replace(year=inicio.year + 1)
+
+class GranVolumenAdmin(admin.ModelAdmin):
+    """
+    Base de los admin de tablas grandes: cuenta las filas con una estimación (ver
+    `PaginadorEstimado`), no muestra el total sin filtrar (otro COUNT(*)) y navega
+    por fechas sin recorrer la tabla (ver `FechasIndexadasQuerySet`).
+    """
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return FechasIndexadasQuerySet(self.model, query=queryset.query.chain(), using=queryset._db)
+
+class BusquedaPorUsuarioYLibroMixin:
+    """
+    Búsqueda de los admin de préstamos y reservas por nombre de usuario exacto (índice
+    único) o por título o autor del libro (búsqueda indexada de `buscar_libros`), en
+    lugar de `icontains` sobre columnas de otras tablas.
+    """
+    search_fields = ['=usuario__username', 'libro__titulo']
+    search_help_text = 'Nombre de usuario exacto, o título o autor del libro.'
+
+    def get_search_results(self, request, queryset, search_term):
+        termino = search_term.strip()
+        if not termino:
+            return queryset, False
+        libros = buscar_libros(Libro.objects.all(), termino).values('pk')
+        return queryset.filter(Q(usuario__username=termino) | Q(libro__in=libros)), False
+
+class DecadaFilter(admin.SimpleListFilter):
+    """
+    Filtro por década de publicación. Las opciones salen de las facetas cacheadas
+    del catálogo, en lugar de un DISTINCT sobre toda la tabla de libros.
+    """
+    title = 'década de publicación'
+    parameter_name = 'decada'
+
+    def lookups(self, request, model_admin):
+        return [(faceta['decada'], f'{faceta["decada"]}–{faceta["decada"] + 9}')
+                for faceta in facetas(FiltrosCatalogo())['decadas']]
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        try:
+            decada = int(self.value())
+        except ValueError:
+            return queryset.none()
+        return queryset.filter(ano_publicacion__gte=decada, ano_publicacion__lte=decada + 9)
 
 @admin.register(Usuario)
 class UsuarioAdmin(UserAdmin):
@@ -15,21 +138,106 @@ class UsuarioAdmin(UserAdmin):
     )
 
 @admin.register(Libro)
-class LibroAdmin(admin.ModelAdmin):
+class LibroAdmin(GranVolumenAdmin):
     """
     Configuración del panel de administración para el modelo Libro.
     Define cómo se muestran y se pueden buscar los libros en el admin.
+    El autor se busca con el buscador en lugar de con un filtro, cuyas opciones
+    serían un DISTINCT sobre todos los libros.
     """
     list_display = ['titulo', 'autor', 'ano_publicacion', 'stock']
-    list_filter = ['ano_publicacion', 'autor']
+    list_filter = [DecadaFilter]
     search_fields = ['titulo', 'autor']
+    
+    def get_queryset(self, request):
+        # El vector de búsqueda no se muestra y es la columna más pesada de la fila.
+        return super().get_queryset(request).defer('busqueda')
+    
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Usa la búsqueda indexada de `buscar_libros` en lugar de `icontains` sobre cada campo.
+        """
+        if not search_term.strip():
+            return queryset, False
+        return buscar_libros(queryset, search_term), False
+
+@admin.register(Autor)
+class AutorAdmin(admin.ModelAdmin):
+    """
+    Autores normalizados. Corregir la grafía de un autor la copia en sus libros.
+    La búsqueda compara el principio de la clave normalizada (índice único).
+    """
+    list_display = ['nombre', 'clave']
+    readonly_fields = ['clave']
+    search_fields = ['nombre']
+    search_help_text = 'Principio del nombre, sin importar tildes ni mayúsculas.'
+    
+    def get_search_results(self, request, queryset, search_term):
+        clave = normalizar_autor(search_term)
+        if not clave:
+            return queryset, False
+        return queryset.filter(clave__startswith=clave), False
 
 @admin.register(Prestamo)
-class PrestamoAdmin(admin.ModelAdmin):
+class PrestamoAdmin(BusquedaPorUsuarioYLibroMixin, GranVolumenAdmin):
     """
     Configuración del panel de administración para el modelo Prestamo.
     Permite visualizar y filtrar los registros de préstamos de libros.
+    El usuario y el libro de cada fila se leen en la misma consulta (JOIN) y se
+    eligen en el formulario con autocompletado en lugar de un desplegable con todas las filas.
     """
     list_display = ['usuario', 'libro', 'fecha_prestamo', 'fecha_devolucion', 'activo']
     list_filter = ['activo', 'fecha_prestamo']
-    search_fields = ['usuario__username', 'libro__titulo']
+    list_select_related = ['usuario', 'libro']
+    autocomplete_fields = ['usuario', 'libro']
+    date_hierarchy = 'fecha_prestamo'
+    # Coincide con el índice (fecha_prestamo, id), también al navegar por fechas.
+    ordering = ['-fecha_prestamo', '-id']
+
+@admin.register(Reserva)
+class ReservaAdmin(BusquedaPorUsuarioYLibroMixin, GranVolumenAdmin):
+    """
+    Configuración del panel de administración para las reservas de libros sin stock.
+    """
+    list_display = ['usuario', 'libro', 'creada', 'atendida', 'activa']
+    list_filter = ['activa', 'creada']
+    list_select_related = ['usuario', 'libro']
+    autocomplete_fields = ['usuario', 'libro']
+
+@admin.register(PrestamoArchivado)
+class PrestamoArchivadoAdmin(BusquedaPorUsuarioYLibroMixin, GranVolumenAdmin):
+    """
+    Configuración del panel de administración para los préstamos archivados.
+    Muestra el historial antiguo con las mismas columnas que los préstamos; es de solo lectura.
+    No se combina con el listado de `PrestamoAdmin`: el listado del admin necesita un
+    queryset de un modelo (filtros, búsqueda, recuento y navegación por fechas), y una
+    UNION de ambas tablas no admite filtros tras combinarse. El historial combinado se
+    lee en "Mis libros" (`books.archivo.historial_usuario`) y en `export_prestamos`.
+    """
+    list_display = ['id', 'usuario', 'libro', 'fecha_prestamo', 'fecha_devolucion', 'archivado']
+    list_filter = ['fecha_prestamo']
+    list_select_related = ['usuario', 'libro']
+    date_hierarchy = 'fecha_prestamo'
+    ordering = ['-fecha_prestamo', '-id']
+    
+    def has_add_permission(self, request) -> bool:
+        return False
+    
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
+
+@admin.register(TokenAcceso)
+class TokenAccesoAdmin(admin.ModelAdmin):
+    """
+    Configuración del panel de administración para los tokens de acceso a la API.
+    Los tokens se emiten desde la API; aquí solo se consultan y se revocan (eliminándolos).
+    """
+    list_display = ['prefijo', 'usuario', 'nombre', 'creado', 'expira']
+    list_select_related = ['usuario']
+    search_fields = ['usuario__username', 'prefijo', 'nombre']
+    
+    def has_add_permission(self, request) -> bool:
+        return False
+    
+    def has_change_permission(self, request, obj=None) -> bool:
+        return False
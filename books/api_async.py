@@ -0,0 +1,282 @@
+"""
+Versiones asíncronas de los endpoints del catálogo y de préstamos de la API.
+Con un servidor ASGI (ver `Procfile`), una petición que espera a la base de datos o
+a un cliente lento no ocupa un worker completo: el bucle de eventos atiende otras
+peticiones mientras tanto. Las respuestas son las mismas que las de `api_views`
+(en JSON): el detalle, las peticiones condicionales y los listados ya cacheados se
+resuelven con el ORM y la caché asíncronos; los préstamos y devoluciones llaman al
+mismo servicio transaccional (el ORM asíncrono no admite transacciones), y los
+listados sin cachear y las escrituras de administradores se delegan en las vistas
+síncronas de `api_views`.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.authentication import CSRFCheck, get_authorization_header
+
+from . import api_views, services
+from .authentication import TokenAutenticacion
+from .cache import aclave_detalle, aclave_listado, timeout_catalogo
+from .condicional import (
+    aplicar_validadores, avalidadores_catalogo, avalidadores_libro, es_condicional,
+    etag_libro, respuesta_no_modificada,
+)
+from .eventos import obtener_central
+from .limites import (
+    PETICION, PRESTAMO, abrir_conexion, aconsumir, cerrar_conexion, identidad, marcar_consumido,
+    renovar_conexiones,
+)
+from .models import Libro
+from .renderers import JSONRapidoRenderer
+from .replicas import aactivar_replica
+from .serializers import LibroSerializer
+from .services import PrestamoError
+from .tokens import ausuario_de_token
+
+_vista_listado = api_views.LibroListCreateView.as_view()
+_vista_detalle = api_views.LibroDetailView.as_view()
+
+
+def respuesta_json(datos, estado: int = status.HTTP_200_OK) -> HttpResponse:
+    """
+    Respuesta JSON con el mismo formato que el renderizador de la API.
+    """
+    return HttpResponse(JSONRapidoRenderer().render(datos), status=estado, content_type='application/json')
+
+
+def respuesta_error(exc: exceptions.APIException) -> HttpResponse:
+    """
+    Respuesta de error equivalente a la del manejador de excepciones de DRF.
+    """
+    respuesta = respuesta_json({'detail': exc.detail}, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        respuesta.headers['WWW-Authenticate'] = TokenAutenticacion().authenticate_header(None)
+    if isinstance(exc, exceptions.Throttled) and exc.wait is not None:
+        respuesta.headers['Retry-After'] = str(exc.wait)
+    return respuesta
+
+
+async def limitar(request, usuario, tipo: str) -> None:
+    """
+    Aplica el límite por coste de `books.limites` como `LimiteCoste` en las vistas
+    síncronas; lanza `Throttled` si se supera. Si la petición se delega después en
+    una vista síncrona, esta ya no vuelve a descontarla.
+    """
+    marcar_consumido(request)
+    clave, limite = identidad(request, usuario)
+    espera = await aconsumir(clave, limite, settings.LIMITE_COSTES[tipo])
+    if espera is not None:
+        raise exceptions.Throttled(espera)
+
+
+async def autenticar(request):
+    """
+    Resuelve el usuario como lo hacen las clases de autenticación configuradas:
+    primero el token (`Authorization: Bearer`) y después la sesión, comprobando en
+    ese caso el token CSRF de las peticiones que modifican datos.
+    Devuelve el usuario o None; lanza `APIException` si las credenciales no son válidas.
+    """
+    partes = get_authorization_header(request).split()
+    if partes and partes[0].lower() == TokenAutenticacion.palabra_clave.lower().encode():
+        if len(partes) != 2:
+            raise exceptions.AuthenticationFailed('Cabecera de token inválida.')
+        try:
+            usuario = await ausuario_de_token(partes[1].decode())
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Cabecera de token inválida.')
+        if usuario is None:
+            raise exceptions.AuthenticationFailed('Token inválido o expirado.')
+        # Como hace DRF, para que el middleware sepa quién hizo la petición.
+        request.user = usuario
+        return usuario
+
+    usuario = await request.auser()
+    if not usuario.is_authenticated or not usuario.is_active:
+        return None
+    if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+        comprobacion = CSRFCheck(lambda request: None)
+        comprobacion.process_request(request)
+        motivo = comprobacion.process_view(request, None, (), {})
+        if motivo:
+            raise exceptions.PermissionDenied(f'CSRF Failed: {motivo}')
+    return usuario
+
+
+@csrf_exempt
+async def listar_libros(request):
+    """
+    Versión asíncrona de `LibroListCreateView`. Las lecturas cacheadas y las
+    peticiones condicionales no usan hilos; el resto se delega en la vista síncrona.
+    """
+    if request.method != 'GET':
+        return await sync_to_async(_vista_listado)(request)
+    try:
+        usuario = await autenticar(request)
+        await limitar(request, usuario, PETICION)
+    except exceptions.APIException as exc:
+        return respuesta_error(exc)
+    await aactivar_replica(usuario)
+
+    if es_condicional(request):
+        no_modificada = respuesta_no_modificada(request, *await avalidadores_catalogo(request))
+        if no_modificada is not None:
+            return no_modificada
+
+    entrada = await cache.aget(await aclave_listado('api-lista', request.build_absolute_uri()))
+    if entrada is None:
+        # La vista síncrona calcula la página y la guarda bajo la misma clave.
+        return await sync_to_async(_vista_listado)(request)
+    return aplicar_validadores(respuesta_json(entrada['datos']), entrada['etag'], entrada['modificado'])
+
+
+@csrf_exempt
+async def detalle_libro(request, pk: int):
+    """
+    Versión asíncrona de `LibroDetailView`. La edición y el borrado se delegan en la vista síncrona.
+    """
+    if request.method != 'GET':
+        return await sync_to_async(_vista_detalle)(request, pk=pk)
+    try:
+        usuario = await autenticar(request)
+        await limitar(request, usuario, PETICION)
+    except exceptions.APIException as exc:
+        return respuesta_error(exc)
+    await aactivar_replica(usuario)
+
+    if es_condicional(request):
+        validadores = await avalidadores_libro(pk)
+        no_modificada = validadores and respuesta_no_modificada(request, *validadores)
+        if no_modificada:
+            return no_modificada
+
+    clave = await aclave_detalle('api-detalle', pk)
+    entrada = await cache.aget(clave)
+    if entrada is None:
+        try:
+            libro = await aget_object_or_404(Libro, pk=pk)
+        except Http404 as exc:
+            return respuesta_error(exceptions.NotFound(*exc.args))
+        entrada = {'datos': LibroSerializer(libro).data, 'etag': etag_libro(libro), 'modificado': libro.actualizado}
+        await cache.aset(clave, entrada, timeout=timeout_catalogo())
+    return aplicar_validadores(respuesta_json(entrada['datos']), entrada['etag'], entrada['modificado'])
+
+
+async def _operacion_prestamo(request, pk: int, operacion, mensaje: str, estado: int) -> HttpResponse:
+    """
+    Autentica y autoriza como `IsAuthenticated` + `IsRegularUser`, aplica el
+    límite de `LimitePrestamo` y ejecuta `operacion`.
+    """
+    if request.method != 'POST':
+        return respuesta_error(exceptions.MethodNotAllowed(request.method))
+    try:
+        usuario = await autenticar(request)
+        if usuario is None:
+            raise exceptions.NotAuthenticated()
+        if usuario.rol != 'regular':
+            raise exceptions.PermissionDenied()
+        await limitar(request, usuario, PRESTAMO)
+        try:
+            libro = await aget_object_or_404(Libro, pk=pk)
+        except Http404 as exc:
+            raise exceptions.NotFound(*exc.args)
+    except exceptions.APIException as exc:
+        return respuesta_error(exc)
+
+    try:
+        await sync_to_async(operacion)(usuario, libro)
+    except PrestamoError as e:
+        return respuesta_json({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+    return respuesta_json({'message': mensaje.format(titulo=libro.titulo)}, estado)
+
+
+@csrf_exempt
+async def prestar_libro(request, pk: int):
+    """
+    Versión asíncrona de `api_views.prestar_libro`.
+    """
+    return await _operacion_prestamo(
+        request, pk, services.prestar_libro, 'Has prestado "{titulo}" exitosamente.', status.HTTP_201_CREATED,
+    )
+
+
+@csrf_exempt
+async def devolver_libro(request, pk: int):
+    """
+    Versión asíncrona de `api_views.devolver_libro`.
+    """
+    return await _operacion_prestamo(
+        request, pk, services.devolver_libro, 'Has devuelto "{titulo}" exitosamente.', status.HTTP_200_OK,
+    )
+
+
+# Máximo de libros que puede seguir una conexión de `eventos_stock`.
+MAXIMO_LIBROS_SEGUIDOS = 100
+
+
+async def eventos_stock(request):
+    """
+    Flujo Server-Sent Events con el stock de los libros indicados en `libros`
+    (ids separados por comas). Al conectar se envía el stock actual y después
+    un evento `stock` ({"id": stock, ...}) por cada ráfaga de cambios confirmados;
+    sin cambios, se envía un comentario cada `EVENTOS_LATIDO_SEGUNDOS` para que los
+    proxies no cierren la conexión. Cada conexión abierta ocupa solo una tarea del
+    bucle de eventos, así que requiere el servidor ASGI: con WSGI se responde 501,
+    porque el worker quedaría ocupado por la conexión hasta que el cliente la cerrara.
+    Cada petición consume el límite por coste como una lectura, y cada cliente puede
+    tener a la vez `EVENTOS_CONEXIONES_POR_CLIENTE` conexiones abiertas (429 si no).
+    """
+    if request.method != 'GET':
+        return respuesta_error(exceptions.MethodNotAllowed(request.method))
+    if not isinstance(request, ASGIRequest):
+        return respuesta_json(
+            {'error': 'El flujo de eventos requiere el servidor ASGI.'}, status.HTTP_501_NOT_IMPLEMENTED,
+        )
+    try:
+        usuario = await autenticar(request)
+        await limitar(request, usuario, PETICION)
+    except exceptions.APIException as exc:
+        return respuesta_error(exc)
+    try:
+        libro_ids = {int(pk) for pk in request.GET.get('libros', '').split(',') if pk.strip()}
+    except ValueError:
+        libro_ids = set()
+    if not 0 < len(libro_ids) <= MAXIMO_LIBROS_SEGUIDOS:
+        return respuesta_json(
+            {'error': f'Indica entre 1 y {MAXIMO_LIBROS_SEGUIDOS} ids de libro en "libros", separados por comas.'},
+            status.HTTP_400_BAD_REQUEST,
+        )
+    clave, _ = identidad(request, usuario)
+    maximo = settings.EVENTOS_CONEXIONES_POR_CLIENTE
+    if not await sync_to_async(abrir_conexion, thread_sensitive=False)(clave, maximo):
+        return respuesta_error(exceptions.Throttled(detail=f'Ya tienes {maximo} conexiones de eventos abiertas.'))
+
+    async def flujo():
+        # La suscripción se crea antes de leer el stock actual: un cambio confirmado
+        # entre ambos pasos no se pierde y, por su versión, nunca se sustituye por uno anterior.
+        suscripcion = obtener_central().suscribir(libro_ids)
+        try:
+            yield f'retry: {settings.EVENTOS_REINTENTO_MS}\n\n'
+            consulta = Libro.objects.filter(pk__in=libro_ids).values_list('id', 'stock', 'actualizado')
+            suscripcion.recibir({pk: (stock, actualizado.timestamp()) async for pk, stock, actualizado in consulta})
+            while True:
+                cambios = await suscripcion.esperar(settings.EVENTOS_LATIDO_SEGUNDOS, settings.EVENTOS_AGRUPAR_SEGUNDOS)
+                if cambios:
+                    datos = JSONRapidoRenderer().render({pk: stock for pk, (stock, _) in cambios.items()})
+                    yield f'event: stock\ndata: {datos.decode()}\n\n'
+                else:
+                    yield ': latido\n\n'
+                await sync_to_async(renovar_conexiones, thread_sensitive=False)(clave)
+        finally:
+            suscripcion.cancelar()
+            # Sin await: una segunda cancelación no puede dejar la conexión contada.
+            cerrar_conexion(clave)
+
+    respuesta = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    respuesta.headers['Cache-Control'] = 'no-cache'
+    respuesta.headers['X-Accel-Buffering'] = 'no' # Sin búfer en proxies inversos (nginx)
+    return respuesta
@@ -3,7 +3,7 @@ Definiciones de URL para la API REST de la aplicación 'books'.
 Gestiona las rutas para los endpoints de la API relacionados con libros y préstamos.
 """
 from django.urls import path
-from . import api_views
+from . import api_async, api_views
 
 app_name = 'api' # Define el espacio de nombres de la aplicación para URL inversas de la API
 
@@ -11,6 +11,9 @@ urlpatterns = [
     # Endpoints para listar y crear libros (accesible en /api/libros/)
     path('libros/', api_views.LibroListCreateView.as_view(), name='libro-list-create'),
     
+    # Endpoint con el número de libros por autor, década y disponibilidad (accesible en /api/libros/facetas/)
+    path('libros/facetas/', api_views.facetas, name='libro-facetas'),
+    
     # Endpoints para obtener detalles, actualizar o eliminar un libro específico (accesible en /api/libros/<id>/)
     path('libros/<int:pk>/', api_views.LibroDetailView.as_view(), name='libro-detail'),
     
@@ -19,4 +22,32 @@ urlpatterns = [
     
     # Endpoint para devolver un libro (accesible en /api/libros/<id>/devolver/)
     path('libros/<int:pk>/devolver/', api_views.devolver_libro, name='devolver-libro'),
+    
+    # Endpoint para reservar un libro sin stock o cancelar la reserva (accesible en /api/libros/<id>/reservar/)
+    path('libros/<int:pk>/reservar/', api_views.reservar_libro, name='reservar-libro'),
+    
+    # Endpoint con las reservas en espera del usuario y su posición en la cola (accesible en /api/reservas/)
+    path('reservas/', api_views.reservas, name='reservas'),
+    
+    # Endpoint para prestar y devolver varios libros en una sola transacción (accesible en /api/prestamos/batch/)
+    path('prestamos/batch/', api_views.procesar_lote, name='prestamos-batch'),
+    
+    # Endpoint de estadísticas de popularidad y uso (accesible en /api/estadisticas/)
+    path('estadisticas/', api_views.estadisticas, name='estadisticas'),
+    
+    # Endpoint de métricas de rendimiento por ruta, solo administradores (accesible en /api/metricas/)
+    path('metricas/', api_views.metricas_rutas, name='metricas'),
+    
+    # Endpoints para emitir, listar y revocar tokens de acceso (accesible en /api/tokens/)
+    path('tokens/', api_views.tokens, name='tokens'),
+    path('tokens/<int:pk>/', api_views.revocar, name='token-revocar'),
+    
+    # Versiones asíncronas (ASGI) del catálogo y de los préstamos (accesibles en /api/async/...)
+    path('async/libros/', api_async.listar_libros, name='async-libro-list-create'),
+    path('async/libros/<int:pk>/', api_async.detalle_libro, name='async-libro-detail'),
+    path('async/libros/<int:pk>/prestar/', api_async.prestar_libro, name='async-prestar-libro'),
+    path('async/libros/<int:pk>/devolver/', api_async.devolver_libro, name='async-devolver-libro'),
+    
+    # Flujo Server-Sent Events con los cambios de stock de los libros indicados (accesible en /api/eventos/stock/)
+    path('eventos/stock/', api_async.eventos_stock, name='eventos-stock'),
 ]
@@ -1,25 +1,123 @@
 from rest_framework import generics, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.exceptions import NotAuthenticated, ValidationError
+from rest_framework.permissions import AllowAny, IsAuthenticated
 
+from django.contrib.auth import authenticate
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
-from .models import Libro, Prestamo
-from .serializers import LibroSerializer, PrestamoSerializer
-from .permissions import IsAdminUserOrReadOnly, IsRegularUser
+from . import services
+from .cache import clave_detalle, clave_listado, obtener_o_calcular
+from .condicional import (
+    aplicar_validadores, es_condicional, etag_libro, respuesta_no_modificada,
+    validadores_catalogo, validadores_libro,
+)
+from .contadores import estadisticas as calcular_estadisticas
+from .filtros import FiltroInvalido, facetas as calcular_facetas, leer_filtros
+from .instrumentacion import metricas
+from .limites import LimiteLote, LimitePrestamo
+from .models import Libro, TokenAcceso
+from .pagination import LibroKeysetPagination
+from .serializers import (
+    EmisionTokenSerializer, LibroSerializer, LoteSerializer, ReservaSerializer, TokenAccesoSerializer,
+)
+from .permissions import IsAdminRole, IsAdminUserOrReadOnly, IsRegularUser
+from .replicas import METODOS_SEGUROS, activar_replica
+from .search import buscar_libros
+from .services import PrestamoError
+from .tokens import emitir_token, revocar_token
 
-class LibroListCreateView(generics.ListCreateAPIView):
+class LecturaEnReplicaMixin:
+    """
+    Mixin para que las lecturas (GET) de una vista de la API se consulten en una réplica.
+    Se activa tras la autenticación, que determina si el usuario debe leer de la principal.
+    """
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in METODOS_SEGUROS:
+            activar_replica(request.user)
+
+def filtros_solicitados(request):
+    """
+    Lee los filtros del catálogo de la petición. Un valor no válido produce un error 400.
+    """
+    try:
+        return leer_filtros(request.query_params)
+    except FiltroInvalido as e:
+        raise ValidationError({e.parametro: [str(e)]})
+
+class LibroListCreateView(LecturaEnReplicaMixin, generics.ListCreateAPIView):
     """
     Vista de API para listar todos los libros y crear nuevos libros.
     Permite lectura a todos, pero la creación está restringida a usuarios administradores.
+    El listado se pagina por cursor (ver `LibroKeysetPagination`), admite
+    búsqueda por título o autor con el parámetro `q`, los filtros de `books.filtros`
+    (`autor`, `ano_desde`, `ano_hasta` y `disponible`) y permite pedir solo algunos
+    campos con `fields` (p. ej. `?fields=id,titulo`).
     """
     queryset = Libro.objects.all()
     serializer_class = LibroSerializer
     permission_classes = [IsAdminUserOrReadOnly]
+    pagination_class = LibroKeysetPagination
+    
+    def get_queryset(self):
+        """
+        Aplica los filtros y la búsqueda `q`, si se indica, ordenando los resultados por relevancia.
+        """
+        queryset = filtros_solicitados(self.request).aplicar(super().get_queryset())
+        texto = self.request.query_params.get('q', '')
+        return buscar_libros(queryset, texto) if texto.strip() else queryset
+    
+    def list(self, request, *args, **kwargs):
+        """
+        Sirve el listado desde la caché versionada del catálogo cuando es posible.
+        Las peticiones condicionales se responden con 304 tras una sola consulta
+        (el máximo de `Libro.actualizado`) si el cliente ya tiene la versión vigente.
+        """
+        campos = self.campos_solicitados()
+        if es_condicional(request):
+            no_modificada = respuesta_no_modificada(request, *validadores_catalogo(request))
+            if no_modificada is not None:
+                return no_modificada
+        
+        def calcular():
+            # Los validadores se obtienen antes que los datos para que nunca sean más recientes que ellos.
+            etag, modificado = validadores_catalogo(request)
+            return {'datos': self.listar_valores(campos), 'etag': etag, 'modificado': modificado}
+        
+        entrada = obtener_o_calcular(clave_listado('api-lista', request.build_absolute_uri()), calcular)
+        return aplicar_validadores(Response(entrada['datos']), entrada['etag'], entrada['modificado'])
+    
+    def campos_solicitados(self) -> tuple[str, ...]:
+        """
+        Devuelve los campos pedidos con `fields`, en el orden del serializador,
+        o todos si no se indica. Un campo desconocido produce un error 400.
+        """
+        disponibles = LibroSerializer.Meta.fields
+        pedidos = {campo.strip() for campo in self.request.query_params.get('fields', '').split(',') if campo.strip()}
+        desconocidos = pedidos - set(disponibles)
+        if desconocidos:
+            raise ValidationError({'fields': [
+                f'Campos desconocidos: {", ".join(sorted(desconocidos))}. Disponibles: {", ".join(disponibles)}.'
+            ]})
+        return tuple(campo for campo in disponibles if campo in pedidos) if pedidos else tuple(disponibles)
+    
+    def listar_valores(self, campos: tuple[str, ...]) -> dict:
+        """
+        Calcula la página con `values()` en lugar de instanciar un `Libro` y pasar
+        por `LibroSerializer` en cada fila: los campos del listado son columnas
+        simples, así que los diccionarios ya tienen la representación del serializador.
+        La consulta incluye además la columna de orden y el id, que necesita el cursor.
+        """
+        orden = self.paginator.get_ordering(self.request)
+        columnas = dict.fromkeys([*campos, orden.lstrip('-'), 'id'])
+        filas = self.paginate_queryset(self.filter_queryset(self.get_queryset()).values(*columnas))
+        datos = [{campo: fila[campo] for campo in campos} for fila in filas]
+        return self.get_paginated_response(datos).data
 
-class LibroDetailView(generics.RetrieveUpdateDestroyAPIView):
+class LibroDetailView(LecturaEnReplicaMixin, generics.RetrieveUpdateDestroyAPIView):
     """
     Vista de API para recuperar, actualizar o eliminar un libro específico.
     Permite lectura a todos, pero la actualización y eliminación están restringidas a administradores.
@@ -27,9 +125,43 @@ class LibroDetailView(generics.RetrieveUpdateDestroyAPIView):
     queryset = Libro.objects.all()
     serializer_class = LibroSerializer
     permission_classes = [IsAdminUserOrReadOnly]
+    
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Sirve el detalle desde la caché versionada del libro cuando es posible.
+        Las peticiones condicionales se responden con 304 tras una búsqueda por clave primaria.
+        """
+        if es_condicional(request):
+            validadores = validadores_libro(kwargs['pk'])
+            no_modificada = validadores and respuesta_no_modificada(request, *validadores)
+            if no_modificada:
+                return no_modificada
+        
+        def calcular():
+            libro = self.get_object()
+            return {
+                'datos': self.get_serializer(libro).data,
+                'etag': etag_libro(libro),
+                'modificado': libro.actualizado,
+            }
+        
+        entrada = obtener_o_calcular(clave_detalle('api-detalle', kwargs['pk']), calcular)
+        return aplicar_validadores(Response(entrada['datos']), entrada['etag'], entrada['modificado'])
+
+@api_view(['GET'])
+def facetas(request):
+    """
+    Endpoint de API con el número de libros por autor, por década y por disponibilidad
+    para los filtros y la búsqueda `q` indicados (los mismos parámetros que el listado).
+    """
+    filtros = filtros_solicitados(request)
+    activar_replica(request.user)
+    datos = calcular_facetas(filtros, request.query_params.get('q', ''))
+    return Response(datos, status=status.HTTP_200_OK)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsRegularUser])
+@throttle_classes([LimitePrestamo])
 def prestar_libro(request, pk: int):
     """
     Endpoint de API para que un usuario regular preste un libro.
@@ -37,37 +169,19 @@ def prestar_libro(request, pk: int):
     """
     libro = get_object_or_404(Libro, pk=pk)
     
-    # Verifica si el usuario ya tiene este libro prestado activamente.
-    prestamo_activo = Prestamo.objects.filter(
-        usuario=request.user, 
-        libro=libro, 
-        activo=True
-    ).exists()
-    
-    if prestamo_activo:
-        return Response(
-            {'error': 'Ya tienes este libro prestado. Por favor, devuélvelo antes de intentar prestarlo de nuevo.'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    try:
+        services.prestar_libro(request.user, libro)
+    except PrestamoError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    if libro.stock > 0:
-        # Crea un nuevo registro de préstamo con estado activo.
-        Prestamo.objects.create(usuario=request.user, libro=libro, activo=True)
-        libro.stock -= 1
-        libro.save()
-        
-        return Response(
-            {'message': f'Has prestado "{libro.titulo}" exitosamente.'}, 
-            status=status.HTTP_201_CREATED
-        )
-    else:
-        return Response(
-            {'error': 'No hay stock disponible para este libro.'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
+    return Response(
+        {'message': f'Has prestado "{libro.titulo}" exitosamente.'}, 
+        status=status.HTTP_201_CREATED
+    )
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated, IsRegularUser])
+@throttle_classes([LimitePrestamo])
 def devolver_libro(request, pk: int):
     """
     Endpoint de API para que un usuario regular devuelva un libro.
@@ -76,27 +190,122 @@ def devolver_libro(request, pk: int):
     libro = get_object_or_404(Libro, pk=pk)
     
     try:
-        # Busca el préstamo activo que el usuario tiene para este libro.
-        prestamo = Prestamo.objects.get(
-            usuario=request.user, 
-            libro=libro, 
-            activo=True
-        )
-        
-        prestamo.fecha_devolucion = timezone.now()
-        prestamo.activo = False # Marca el préstamo como inactivo.
-        prestamo.save()
-        
-        libro.stock += 1
-        libro.save()
-        
-        return Response(
-            {'message': f'Has devuelto "{libro.titulo}" exitosamente.'}, 
-            status=status.HTTP_200_OK
-        )
-    except Prestamo.DoesNotExist:
+        services.devolver_libro(request.user, libro)
+    except PrestamoError as e:
         # Si no se encuentra un préstamo activo, el libro no está prestado o ya ha sido devuelto.
-        return Response(
-            {'error': 'Este libro no está prestado por ti o ya ha sido devuelto.'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(
+        {'message': f'Has devuelto "{libro.titulo}" exitosamente.'}, 
+        status=status.HTTP_200_OK
+    )
+
+@api_view(['POST', 'DELETE'])
+@permission_classes([IsAuthenticated, IsRegularUser])
+@throttle_classes([LimitePrestamo])
+def reservar_libro(request, pk: int):
+    """
+    Endpoint de API para reservar un libro sin stock (POST) o cancelar la reserva (DELETE).
+    Al devolverse un ejemplar, la primera reserva de la cola se convierte en préstamo.
+    Requiere autenticación y rol 'regular'.
+    """
+    libro = get_object_or_404(Libro, pk=pk)
+    
+    try:
+        if request.method == 'DELETE':
+            services.cancelar_reserva(request.user, libro)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        reserva = services.reservar_libro(request.user, libro)
+    except PrestamoError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    reserva = services.reservas_con_posicion(request.user).get(pk=reserva.pk)
+    return Response(ReservaSerializer(reserva).data, status=status.HTTP_201_CREATED)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated, IsRegularUser])
+def reservas(request):
+    """
+    Endpoint de API con las reservas en espera del usuario y su posición en cada cola.
+    Requiere autenticación y rol 'regular'.
+    """
+    datos = ReservaSerializer(services.reservas_con_posicion(request.user), many=True).data
+    return Response(datos, status=status.HTTP_200_OK)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated, IsRegularUser])
+@throttle_classes([LimiteLote])
+def procesar_lote(request):
+    """
+    Endpoint de API para prestar y devolver varios libros en una sola petición.
+    Recibe {"operaciones": [{"libro_id": 1, "accion": "prestar"}, ...]} y devuelve
+    el resultado de cada operación en el mismo orden. Requiere autenticación y rol 'regular'.
+    """
+    serializer = LoteSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    resultados = services.procesar_lote(request.user, serializer.validated_data['operaciones'])
+    return Response({'resultados': resultados}, status=status.HTTP_200_OK)
+
+@api_view(['GET'])
+def estadisticas(request):
+    """
+    Endpoint de API con los libros más prestados y los de mayor uso actual.
+    Se lee de los contadores desnormalizados, sin agregar la tabla de préstamos.
+    El parámetro `n` (por defecto 10, máximo 100) limita cada lista; los administradores
+    reciben además los usuarios con más préstamos activos.
+    """
+    try:
+        n = min(max(int(request.query_params.get('n', 10)), 1), 100)
+    except ValueError:
+        return Response({'error': 'El parámetro "n" debe ser un número entero.'}, status=status.HTTP_400_BAD_REQUEST)
+    es_admin = request.user.is_authenticated and request.user.rol == 'admin'
+    return Response(calcular_estadisticas(n, incluir_usuarios=es_admin), status=status.HTTP_200_OK)
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated, IsAdminRole])
+def metricas_rutas(request):
+    """
+    Endpoint de API con los percentiles de duración y consultas por ruta que recoge
+    `InstrumentacionMiddleware` en este proceso. DELETE reinicia las muestras.
+    Requiere autenticación y rol 'admin'.
+    """
+    if request.method == 'DELETE':
+        metricas.reiniciar()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response({'rutas': metricas.resumen()}, status=status.HTTP_200_OK)
+
+@api_view(['GET', 'POST'])
+@permission_classes([AllowAny])
+def tokens(request):
+    """
+    Endpoint de API para los tokens de acceso del usuario.
+    GET lista los tokens vigentes del usuario autenticado (sin su valor).
+    POST emite un token nuevo para el usuario autenticado o, si la petición no lo
+    está, para el dueño de las credenciales `username` y `password` del cuerpo.
+    El token se devuelve una sola vez y se envía en `Authorization: Bearer <token>`.
+    """
+    if request.method == 'GET':
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        vigentes = request.user.tokens.filter(expira__gt=timezone.now()).order_by('-creado')
+        return Response(TokenAccesoSerializer(vigentes, many=True).data, status=status.HTTP_200_OK)
+    
+    serializer = EmisionTokenSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    datos = serializer.validated_data
+    usuario = request.user if request.user.is_authenticated else authenticate(
+        request, username=datos.get('username'), password=datos.get('password')
+    )
+    if usuario is None:
+        return Response({'error': 'Credenciales inválidas.'}, status=status.HTTP_400_BAD_REQUEST)
+    token, registro = emitir_token(usuario, datos['nombre'], datos.get('dias'))
+    return Response({'token': token, **TokenAccesoSerializer(registro).data}, status=status.HTTP_201_CREATED)
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def revocar(request, pk: int):
+    """
+    Endpoint de API para revocar uno de los tokens del usuario autenticado.
+    """
+    revocar_token(get_object_or_404(TokenAcceso, pk=pk, usuario=request.user))
+    return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,90 @@
+"""
+Archivo de préstamos devueltos.
+El historial de préstamos crece sin límite, pero las operaciones frecuentes solo
+usan los préstamos activos. Los préstamos devueltos hace más de
+`PRESTAMOS_ARCHIVO_DIAS` días se mueven por lotes a `PrestamoArchivado`; cada lote
+es una transacción corta, por lo que los bloqueos duran poco. Las lecturas del
+historial de un usuario combinan ambas tablas y se paginan por cursor.
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import F, Q, QuerySet
+
+from .models import Prestamo, PrestamoArchivado, Usuario
+from .pagination import CursorInvalido, PaginaKeyset, codificar_cursor, decodificar_cursor
+
+# Columnas comunes a `Prestamo` y `PrestamoArchivado` que se copian al archivar.
+CAMPOS_ARCHIVO = ['id', 'usuario_id', 'libro_id', 'fecha_prestamo', 'fecha_devolucion']
+# Orden del historial, servido en ambas tablas por el índice (usuario, -fecha_prestamo).
+ORDEN_HISTORIAL = '-fecha_prestamo'
+HISTORIAL_POR_PAGINA = 50
+
+
+def archivar_lote(limite: datetime, tamano: int) -> int:
+    """
+    Mueve al archivo hasta `tamano` préstamos devueltos antes de `limite`.
+    Las filas se bloquean con SKIP LOCKED para no esperar a otras transacciones
+    (y que varias ejecuciones puedan convivir). Devuelve cuántos préstamos se movieron.
+    """
+    with transaction.atomic():
+        filas = list(
+            Prestamo.objects.select_for_update(skip_locked=True)
+            .filter(activo=False, fecha_devolucion__lt=limite)
+            .order_by('fecha_devolucion', 'id')
+            .values(*CAMPOS_ARCHIVO)[:tamano]
+        )
+        if not filas:
+            return 0
+        PrestamoArchivado.objects.bulk_create(
+            [PrestamoArchivado(**fila) for fila in filas],
+            ignore_conflicts=True,
+        )
+        Prestamo.objects.filter(pk__in=[fila['id'] for fila in filas]).delete()
+    return len(filas)
+
+
+def historial_usuario(usuario: Usuario, antes: tuple[datetime, int] | None = None) -> QuerySet:
+    """
+    Devuelve los préstamos (activos, devueltos y archivados) de `usuario`, del más
+    reciente al más antiguo, como diccionarios con los datos del libro incluidos.
+    Con `antes` (fecha de préstamo e id de la última fila vista) empieza a continuación.
+    La condición se aplica a cada tabla antes de combinarlas, así que quien corte
+    el resultado lee solo las filas de ambos índices que necesita.
+    """
+    campos = ['id', 'libro_id', 'fecha_prestamo', 'fecha_devolucion', 'activo', 'titulo', 'autor']
+    condicion = Q(usuario=usuario)
+    if antes is not None:
+        fecha, pk = antes
+        condicion &= Q(fecha_prestamo__lt=fecha) | Q(fecha_prestamo=fecha, id__lt=pk)
+    recientes = (
+        Prestamo.objects.filter(condicion)
+        .annotate(titulo=F('libro__titulo'), autor=F('libro__autor'))
+        .values(*campos)
+    )
+    archivados = (
+        PrestamoArchivado.objects.filter(condicion)
+        .annotate(titulo=F('libro__titulo'), autor=F('libro__autor'))
+        .values(*campos)
+    )
+    return recientes.union(archivados, all=True).order_by(ORDEN_HISTORIAL, '-id')
+
+
+def paginar_historial(usuario: Usuario, cursor: str | None, tamano: int = HISTORIAL_POR_PAGINA) -> PaginaKeyset:
+    """
+    Devuelve la página de `tamano` préstamos del historial de `usuario` que sigue
+    a `cursor` (ver `books.pagination`). Solo se avanza hacia préstamos más antiguos.
+    """
+    antes = None
+    if cursor:
+        valor, pk, _ = decodificar_cursor(cursor, ORDEN_HISTORIAL)
+        try:
+            antes = (datetime.fromisoformat(valor), pk)
+        except ValueError:
+            raise CursorInvalido(cursor)
+    filas = list(historial_usuario(usuario, antes)[:tamano + 1])
+    siguiente = None
+    if len(filas) > tamano:
+        ultima = filas[tamano - 1]
+        siguiente = codificar_cursor(ORDEN_HISTORIAL, ultima['fecha_prestamo'].isoformat(), ultima['id'])
+    return PaginaKeyset(objetos=filas[:tamano], siguiente=siguiente, anterior=None)
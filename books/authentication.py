@@ -0,0 +1,33 @@
+"""
+Autenticación por token para la API REST de la aplicación 'books'.
+"""
+from rest_framework import authentication, exceptions
+
+from .tokens import usuario_de_token
+
+
+class TokenAutenticacion(authentication.BaseAuthentication):
+    """
+    Autentica las peticiones con la cabecera `Authorization: Bearer <token>`.
+    Los tokens se emiten en POST /api/tokens/ (ver `books.tokens`).
+    """
+    palabra_clave = 'Bearer'
+
+    def authenticate(self, request):
+        partes = authentication.get_authorization_header(request).split()
+        if not partes or partes[0].lower() != self.palabra_clave.lower().encode():
+            return None
+        if len(partes) != 2:
+            raise exceptions.AuthenticationFailed('Cabecera de token inválida.')
+        try:
+            token = partes[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Cabecera de token inválida.')
+        usuario = usuario_de_token(token)
+        if usuario is None:
+            raise exceptions.AuthenticationFailed('Token inválido o expirado.')
+        return usuario, token
+
+    def authenticate_header(self, request) -> str:
+        # Permite que DRF responda 401 (y no 403) a las peticiones sin credenciales.
+        return f'{self.palabra_clave} realm="api"'
@@ -0,0 +1,81 @@
+"""
+Autores normalizados de los libros.
+Cada libro apunta a un `Autor` identificado por su nombre normalizado
+(`models.normalizar_autor`), de modo que las distintas grafías de un mismo autor
+comparten registro y los filtros y facetas por autor se resuelven con una clave
+entera. Los formularios, la API y la importación siguen recibiendo el nombre:
+al guardar un libro se busca (o se crea) su autor, y `Libro.autor` pasa a ser
+una copia del nombre del autor.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Autor, Libro, normalizar_autor
+
+
+def resolver_autores(nombres) -> dict:
+    """
+    Devuelve los autores de `nombres` por su clave, creando los que no existen.
+    Basta una consulta si ya existen todos. Los autores creados a la vez por
+    otra transacción se ignoran al insertar (clave única) y se leen después.
+    """
+    pendientes = {}
+    for nombre in nombres:
+        clave = normalizar_autor(nombre)
+        if clave:
+            pendientes.setdefault(clave, nombre.strip())
+    autores = {autor.clave: autor for autor in Autor.objects.filter(clave__in=pendientes)}
+    nuevos = [Autor(nombre=nombre, clave=clave) for clave, nombre in pendientes.items() if clave not in autores]
+    if nuevos:
+        Autor.objects.bulk_create(nuevos, ignore_conflicts=True)
+        autores.update(
+            (autor.clave, autor)
+            for autor in Autor.objects.filter(clave__in=[autor.clave for autor in nuevos])
+        )
+    return autores
+
+
+def asignar_autores(libros) -> None:
+    """
+    Asigna a cada libro su autor normalizado a partir de `Libro.autor` y copia
+    en este la grafía del autor. Pensado para cargas masivas con `bulk_create`.
+    """
+    autores = resolver_autores([libro.autor for libro in libros])
+    for libro in libros:
+        autor = autores.get(normalizar_autor(libro.autor))
+        libro.autor_normalizado = autor
+        if autor is not None:
+            libro.autor = autor.nombre
+
+
+def rellenar_autores(tamano: int = 1000) -> int:
+    """
+    Asigna el autor normalizado a los libros que aún no lo tienen, en lotes de
+    `tamano` libros por orden de id. Cada lote es una transacción corta que solo
+    bloquea sus filas, así que el catálogo admite escrituras mientras tanto; si se
+    interrumpe, basta con volver a ejecutarlo. Devuelve cuántos libros se actualizaron.
+    """
+    ultimo = total = 0
+    while True:
+        with transaction.atomic():
+            libros = list(
+                Libro.objects.select_for_update()
+                .filter(pk__gt=ultimo, autor_normalizado__isnull=True)
+                .order_by('pk').only('id', 'autor')[:tamano]
+            )
+            if not libros:
+                return total
+            ultimo = libros[-1].pk
+            originales = {libro.pk: libro.autor for libro in libros}
+            asignar_autores(libros)
+            # Los libros cuyo nombre cambia a la grafía del autor se marcan como
+            # modificados para invalidar sus tarjetas y validadores HTTP.
+            renombrados = [libro for libro in libros if libro.autor != originales[libro.pk]]
+            ahora = timezone.now()
+            for libro in renombrados:
+                libro.actualizado = ahora
+            asignados = [libro for libro in libros if libro.autor_normalizado is not None]
+            Libro.objects.bulk_update(asignados, ['autor_normalizado'])
+            if renombrados:
+                Libro.objects.bulk_update(renombrados, ['autor', 'actualizado'])
+            total += len(asignados)
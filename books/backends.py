@@ -0,0 +1,41 @@
+"""
+Backend de autenticación con caché del usuario de la sesión.
+`AuthenticationMiddleware` resuelve el usuario de la sesión en cada petición
+autenticada, aunque las vistas y los permisos solo lean su `rol`. Este backend
+guarda el usuario en la caché (con los campos de `CAMPOS_USUARIO_CACHE`), de modo
+que, junto con las sesiones `cached_db`, una lectura autenticada cuya respuesta
+también esté cacheada no ejecuta ninguna consulta SQL. La entrada se invalida al
+confirmarse el guardado o la eliminación del usuario (ver `books.signals`), de modo
+que una petición simultánea no puede volver a cachear la fila anterior a un cambio
+de contraseña.
+"""
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .cache import clave_usuario
+from .models import Usuario
+
+# Campos necesarios para verificar la sesión (password, para su hash) y para las
+# comprobaciones de rol y permisos. El resto se carga bajo demanda si se accede a él.
+CAMPOS_USUARIO_CACHE = [
+    'id', 'username', 'password', 'rol', 'is_active', 'is_staff', 'is_superuser',
+    'first_name', 'last_name', 'email',
+]
+
+
+class UsuarioCacheBackend(ModelBackend):
+    """
+    `ModelBackend` que sirve `get_user` desde la caché.
+    Django sigue comparando el hash de sesión con el del usuario cacheado, así que
+    un cambio de contraseña (que invalida la entrada) cierra las sesiones anteriores.
+    """
+    def get_user(self, user_id):
+        clave = clave_usuario(user_id)
+        usuario = cache.get(clave)
+        if usuario is None:
+            usuario = Usuario.objects.filter(pk=user_id).only(*CAMPOS_USUARIO_CACHE).first()
+            if usuario is None:
+                return None
+            cache.set(clave, usuario, timeout=settings.USUARIO_CACHE_TIMEOUT)
+        return usuario if self.user_can_authenticate(usuario) else None
@@ -0,0 +1,208 @@
+"""
+Caché versionada del catálogo de libros.
+Las respuestas se guardan bajo claves que incluyen una versión: la del catálogo
+completo para los listados y la de cada libro para los detalles. Cualquier
+cambio en un libro (guardado, borrado o cambio de stock por préstamo o
+devolución) incrementa ambas versiones, de modo que las entradas antiguas dejan
+de consultarse sin necesidad de borrarlas.
+
+Los fragmentos HTML de cada libro (las tarjetas del catálogo) se versionan con
+`Libro.actualizado`, que cambia en las mismas ocasiones y llega en la propia fila.
+"""
+import hashlib
+import time
+from datetime import datetime
+from typing import Any, Callable, Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .replicas import replica_actual
+
+CLAVE_VERSION_CATALOGO = 'libros:version:catalogo'
+CLAVE_ULTIMA_BAJA = 'libros:ultima-baja'
+
+
+def _clave_version_libro(pk: int) -> str:
+    return f'libros:version:libro:{pk}'
+
+
+def _obtener_version(clave: str) -> int:
+    """
+    Devuelve la versión guardada en `clave`, inicializándola si no existe.
+    La versión inicial se toma del reloj para que, si la caché la descarta,
+    nunca se reutilice un número de versión anterior.
+    """
+    version = cache.get(clave)
+    if version is None:
+        cache.add(clave, time.time_ns(), timeout=None)
+        version = cache.get(clave)
+    return version
+
+
+async def _aobtener_version(clave: str) -> int:
+    version = await cache.aget(clave)
+    if version is None:
+        await cache.aadd(clave, time.time_ns(), timeout=None)
+        version = await cache.aget(clave)
+    return version
+
+
+def _incrementar_version(clave: str) -> None:
+    try:
+        cache.incr(clave)
+    except ValueError:
+        # La clave no existía (o la caché la descartó): se inicializa de nuevo.
+        cache.set(clave, time.time_ns(), timeout=None)
+
+
+def version_catalogo() -> int:
+    """
+    Versión actual del catálogo completo (listados y búsquedas).
+    """
+    return _obtener_version(CLAVE_VERSION_CATALOGO)
+
+
+def version_libro(pk: int) -> int:
+    """
+    Versión actual de un libro concreto.
+    """
+    return _obtener_version(_clave_version_libro(pk))
+
+
+async def aversion_catalogo() -> int:
+    return await _aobtener_version(CLAVE_VERSION_CATALOGO)
+
+
+async def aversion_libro(pk: int) -> int:
+    return await _aobtener_version(_clave_version_libro(pk))
+
+
+def invalidar_catalogo() -> None:
+    """
+    Invalida todos los listados del catálogo (p. ej. tras una importación masiva).
+    """
+    _incrementar_version(CLAVE_VERSION_CATALOGO)
+
+
+def invalidar_libro(pk: int) -> None:
+    """
+    Invalida el detalle de un libro y todos los listados del catálogo.
+    """
+    _incrementar_version(_clave_version_libro(pk))
+    _incrementar_version(CLAVE_VERSION_CATALOGO)
+
+
+def invalidar_libros(pks) -> None:
+    """
+    Invalida varios libros y el catálogo en pocas operaciones (cargas masivas).
+    Borrar la versión de un libro equivale a cambiarla: se reinicializa con el reloj.
+    """
+    cache.delete_many([_clave_version_libro(pk) for pk in pks])
+    _incrementar_version(CLAVE_VERSION_CATALOGO)
+
+
+def registrar_baja() -> None:
+    """
+    Guarda el momento de la última eliminación de un libro. Un borrado no cambia
+    el máximo de `Libro.actualizado`, así que se usa para el Last-Modified del catálogo.
+    """
+    cache.set(CLAVE_ULTIMA_BAJA, timezone.now(), timeout=None)
+
+
+def ultima_baja() -> datetime | None:
+    """
+    Momento de la última eliminación de un libro, si se conoce.
+    """
+    return cache.get(CLAVE_ULTIMA_BAJA)
+
+
+async def aultima_baja() -> datetime | None:
+    return await cache.aget(CLAVE_ULTIMA_BAJA)
+
+
+def clave_usuario(pk) -> str:
+    """
+    Clave del usuario de la sesión cacheado por `UsuarioCacheBackend`.
+    """
+    return f'usuarios:{pk}'
+
+
+def invalidar_usuario(pk) -> None:
+    """
+    Descarta el usuario cacheado (tras cambiar su rol, contraseña o estado).
+    """
+    cache.delete(clave_usuario(pk))
+
+
+def clave_listado(prefijo: str, *partes: Any) -> str:
+    """
+    Construye la clave de un listado a partir de la versión del catálogo y de los
+    parámetros que determinan su contenido (orden, cursor, búsqueda...).
+    """
+    resumen = hashlib.md5(repr(partes).encode()).hexdigest()
+    return f'libros:{prefijo}:{version_catalogo()}:{resumen}'
+
+
+async def aclave_listado(prefijo: str, *partes: Any) -> str:
+    """
+    Versión asíncrona de `clave_listado` (ver `books.api_async`).
+    """
+    resumen = hashlib.md5(repr(partes).encode()).hexdigest()
+    return f'libros:{prefijo}:{await aversion_catalogo()}:{resumen}'
+
+
+def clave_detalle(prefijo: str, pk: int) -> str:
+    """
+    Construye la clave del detalle de un libro a partir de su versión.
+    """
+    return f'libros:{prefijo}:{pk}:{version_libro(pk)}'
+
+
+async def aclave_detalle(prefijo: str, pk: int) -> str:
+    return f'libros:{prefijo}:{pk}:{await aversion_libro(pk)}'
+
+
+def timeout_catalogo() -> int:
+    """
+    Segundos que se conserva una entrada del catálogo calculada en la petición en curso.
+    Si se calculó en una réplica, pudo leer datos anteriores al cambio que la invalidó,
+    así que se conserva solo `REPLICAS_FIJAR_SEGUNDOS` en lugar de hasta el siguiente cambio.
+    """
+    return settings.REPLICAS_FIJAR_SEGUNDOS if replica_actual() else settings.CATALOGO_CACHE_TIMEOUT
+
+
+def obtener_o_calcular(clave: str, calcular: Callable[[], Any]) -> Any:
+    """
+    Devuelve el valor guardado en `clave` o lo calcula y lo guarda.
+    """
+    valor = cache.get(clave)
+    if valor is None:
+        valor = calcular()
+        cache.set(clave, valor, timeout=timeout_catalogo())
+    return valor
+
+
+def clave_fragmento(prefijo: str, libro) -> str:
+    """
+    Construye la clave del fragmento HTML de un libro a partir de su id y de su
+    última modificación (la misma versión que su ETag).
+    """
+    return f'libros:{prefijo}:{libro.pk}:{libro.actualizado.timestamp():.6f}'
+
+
+def fragmentos_libros(prefijo: str, libros: Iterable, renderizar: Callable[[Any], str]) -> list[str]:
+    """
+    Devuelve el fragmento de cada libro, en el mismo orden. Todos se leen de la
+    caché en una sola operación y solo se renderizan (y guardan) los que faltan,
+    que suelen ser los de los libros modificados desde la última visita.
+    """
+    libros = list(libros)
+    claves = [clave_fragmento(prefijo, libro) for libro in libros]
+    fragmentos = cache.get_many(claves)
+    nuevos = {clave: renderizar(libro) for clave, libro in zip(claves, libros) if clave not in fragmentos}
+    if nuevos:
+        cache.set_many(nuevos, timeout=settings.CATALOGO_CACHE_TIMEOUT)
+        fragmentos.update(nuevos)
+    return [fragmentos[clave] for clave in claves]
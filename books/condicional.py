@@ -0,0 +1,97 @@
+"""
+Peticiones HTTP condicionales (ETag / Last-Modified) para la API de libros.
+Los validadores se obtienen con una única consulta indexada sobre
+`Libro.actualizado`, de modo que un cliente con la copia vigente recibe un 304
+sin que se serialice el resultado.
+"""
+import hashlib
+from datetime import datetime
+
+from django.db.models import Max
+from django.http import HttpResponseBase
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import aultima_baja, aversion_catalogo, ultima_baja, version_catalogo
+from .models import Libro
+
+
+def es_condicional(request) -> bool:
+    """
+    Indica si la petición trae cabeceras de validación (If-None-Match / If-Modified-Since).
+    """
+    return 'HTTP_IF_NONE_MATCH' in request.META or 'HTTP_IF_MODIFIED_SINCE' in request.META
+
+
+def etag_libro(libro: Libro) -> str:
+    """
+    ETag de un libro, derivado de su id y de su última modificación.
+    """
+    return quote_etag(f'{libro.pk}-{libro.actualizado.timestamp():.6f}')
+
+
+def validadores_libro(pk: int) -> tuple[str, datetime] | None:
+    """
+    Devuelve (ETag, Last-Modified) de un libro, o None si no existe.
+    """
+    libro = Libro.objects.filter(pk=pk).only('id', 'actualizado').first()
+    if libro is None:
+        return None
+    return etag_libro(libro), libro.actualizado
+
+
+def validadores_catalogo(request) -> tuple[str, datetime | None]:
+    """
+    Devuelve (ETag, Last-Modified) de un listado del catálogo.
+    El ETag combina la última modificación de cualquier libro, la versión del catálogo
+    (que cambia también al eliminar libros) y la URL, ya que cada página es distinta.
+    """
+    actualizado = Libro.objects.aggregate(maximo=Max('actualizado'))['maximo']
+    return _validadores_catalogo(request, actualizado, ultima_baja(), version_catalogo())
+
+
+def _validadores_catalogo(request, actualizado, baja, version) -> tuple[str, datetime | None]:
+    modificado = max(filter(None, [actualizado, baja]), default=None)
+    marca = modificado.timestamp() if modificado else 0
+    resumen = hashlib.md5(f'{marca}:{version}:{request.get_full_path()}'.encode()).hexdigest()
+    return quote_etag(resumen), modificado
+
+
+async def avalidadores_libro(pk: int) -> tuple[str, datetime] | None:
+    """
+    Versión asíncrona de `validadores_libro` (ver `books.api_async`).
+    """
+    libro = await Libro.objects.filter(pk=pk).only('id', 'actualizado').afirst()
+    if libro is None:
+        return None
+    return etag_libro(libro), libro.actualizado
+
+
+async def avalidadores_catalogo(request) -> tuple[str, datetime | None]:
+    """
+    Versión asíncrona de `validadores_catalogo` (ver `books.api_async`).
+    """
+    actualizado = (await Libro.objects.aaggregate(maximo=Max('actualizado')))['maximo']
+    return _validadores_catalogo(request, actualizado, await aultima_baja(), await aversion_catalogo())
+
+
+def respuesta_no_modificada(request, etag: str, modificado: datetime | None) -> HttpResponseBase | None:
+    """
+    Devuelve una respuesta 304 (o 412) si las cabeceras condicionales de la petición
+    coinciden con los validadores; None si hay que generar la respuesta completa.
+    """
+    marca = int(modificado.timestamp()) if modificado else None
+    respuesta = get_conditional_response(request, etag=etag, last_modified=marca)
+    if respuesta is not None:
+        aplicar_validadores(respuesta, etag, modificado)
+    return respuesta
+
+
+def aplicar_validadores(respuesta: HttpResponseBase, etag: str, modificado: datetime | None) -> HttpResponseBase:
+    """
+    Añade las cabeceras ETag y Last-Modified a `respuesta`.
+    """
+    respuesta.headers['ETag'] = etag
+    if modificado:
+        respuesta.headers['Last-Modified'] = http_date(modificado.timestamp())
+    return respuesta
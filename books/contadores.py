@@ -0,0 +1,114 @@
+"""
+Contadores de préstamos desnormalizados.
+`Libro.total_prestamos`, `Libro.prestamos_activos` y `Usuario.prestamos_activos`
+se mantienen en los mismos UPDATE del servicio de préstamos, de modo que las
+estadísticas de popularidad y uso se leen con una consulta indexada en lugar de
+agregar toda la tabla de préstamos. La reconciliación recalcula los contadores
+por bloques y corrige los que se hayan desviado (p. ej. tras cambios manuales).
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Libro, Prestamo, PrestamoArchivado, Usuario
+
+
+def _bloques(modelo, tamano: int):
+    """
+    Genera los ids de `modelo` en bloques consecutivos de `tamano`, en orden de id.
+    """
+    ultimo = 0
+    while True:
+        ids = list(modelo.objects.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:tamano])
+        if not ids:
+            return
+        yield ids
+        ultimo = ids[-1]
+
+
+def _conteos(modelo, campo: str, ids: list[int], **filtros) -> dict[int, int]:
+    """
+    Cuenta las filas de `modelo` agrupadas por `campo` para los ids indicados.
+    """
+    filas = (
+        modelo.objects.filter(**{f'{campo}__in': ids}, **filtros)
+        .values(campo)
+        .annotate(total=Count('id'))
+        .values_list(campo, 'total')
+    )
+    return dict(filas)
+
+
+def reconciliar_libros(tamano: int = 1000) -> int:
+    """
+    Recalcula los contadores de todos los libros y corrige los desviados.
+    Cada bloque se bloquea (en orden de id, como el servicio de préstamos) mientras
+    se cuenta, para que ningún préstamo simultáneo quede fuera del recuento.
+    Devuelve el número de libros corregidos.
+    """
+    corregidos = 0
+    for ids in _bloques(Libro, tamano):
+        with transaction.atomic():
+            libros = list(
+                Libro.objects.select_for_update().filter(pk__in=ids).order_by('pk')
+                .only('id', 'total_prestamos', 'prestamos_activos')
+            )
+            activos = _conteos(Prestamo, 'libro_id', ids, activo=True)
+            recientes = _conteos(Prestamo, 'libro_id', ids)
+            archivados = _conteos(PrestamoArchivado, 'libro_id', ids)
+            desviados = []
+            for libro in libros:
+                total = recientes.get(libro.pk, 0) + archivados.get(libro.pk, 0)
+                activo = activos.get(libro.pk, 0)
+                if (libro.total_prestamos, libro.prestamos_activos) != (total, activo):
+                    libro.total_prestamos, libro.prestamos_activos = total, activo
+                    desviados.append(libro)
+            Libro.objects.bulk_update(desviados, ['total_prestamos', 'prestamos_activos'])
+            corregidos += len(desviados)
+    return corregidos
+
+
+def reconciliar_usuarios(tamano: int = 1000) -> int:
+    """
+    Recalcula los préstamos activos de todos los usuarios y corrige los desviados.
+    Devuelve el número de usuarios corregidos.
+    """
+    corregidos = 0
+    for ids in _bloques(Usuario, tamano):
+        with transaction.atomic():
+            usuarios = list(
+                Usuario.objects.select_for_update().filter(pk__in=ids).order_by('pk').only('id', 'prestamos_activos')
+            )
+            activos = _conteos(Prestamo, 'usuario_id', ids, activo=True)
+            desviados = []
+            for usuario in usuarios:
+                activo = activos.get(usuario.pk, 0)
+                if usuario.prestamos_activos != activo:
+                    usuario.prestamos_activos = activo
+                    desviados.append(usuario)
+            Usuario.objects.bulk_update(desviados, ['prestamos_activos'])
+            corregidos += len(desviados)
+    return corregidos
+
+
+def estadisticas(n: int, incluir_usuarios: bool = False) -> dict:
+    """
+    Devuelve los `n` libros más prestados, los `n` con más préstamos activos (con
+    su porcentaje de uso) y, opcionalmente, los `n` usuarios con más préstamos activos.
+    Cada lista es una consulta sobre un índice de los contadores.
+    """
+    campos = ['id', 'titulo', 'autor', 'stock', 'total_prestamos', 'prestamos_activos']
+    mas_prestados = list(Libro.objects.order_by('-total_prestamos', 'id').values(*campos)[:n])
+    mas_en_uso = list(
+        Libro.objects.filter(prestamos_activos__gt=0).order_by('-prestamos_activos', 'id').values(*campos)[:n]
+    )
+    for libro in mas_en_uso:
+        # Ejemplares prestados sobre el total de ejemplares (prestados + disponibles).
+        ejemplares = libro['prestamos_activos'] + libro['stock']
+        libro['uso'] = round(libro['prestamos_activos'] / ejemplares, 4) if ejemplares else 0
+    datos = {'mas_prestados': mas_prestados, 'mas_en_uso': mas_en_uso}
+    if incluir_usuarios:
+        datos['usuarios'] = list(
+            Usuario.objects.filter(prestamos_activos__gt=0).order_by('-prestamos_activos', 'id')
+            .values('id', 'username', 'prestamos_activos')[:n]
+        )
+    return datos
@@ -0,0 +1,30 @@
+"""
+Servicio de archivos estáticos compatible con ASGI.
+`WhiteNoiseMiddleware` solo es síncrono: con un servidor ASGI, Django tendría que
+ejecutar en un hilo toda la cadena de middleware de cada petición (también las de
+las vistas asíncronas de `books.api_async`). Esta subclase atiende los estáticos
+igual que WhiteNoise y pasa el resto de peticiones sin salir del bucle de eventos.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class WhiteNoiseAsincronoMiddleware(WhiteNoiseMiddleware):
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        static_file = self.find_file(request.path_info) if self.autorefresh else self.files.get(request.path_info)
+        if static_file is not None:
+            return self.serve(static_file, request)
+        return await self.get_response(request)
@@ -0,0 +1,206 @@
+"""
+Difusión en tiempo real de los cambios de stock por Server-Sent Events.
+Cuando se confirma una transacción que cambia el stock de unos libros, se publica
+su stock actual en la central de eventos (`EVENTOS_CENTRAL`), que lo reparte entre
+las conexiones abiertas en `/api/eventos/stock/` (ver `books.api_async`).
+
+Cada cambio lleva como versión `Libro.actualizado`, de modo que si llegan varios
+cambios de un libro, o llegan desordenados, solo se conserva el más reciente: una
+ráfaga de préstamos se envía al navegador como un único evento.
+
+`CentralLocal` reparte los cambios dentro del proceso (desarrollo y pruebas);
+`CentralRedis` los reparte además entre procesos con Redis pub/sub.
+"""
+import asyncio
+import json
+import logging
+import threading
+from typing import Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .models import Libro
+
+logger = logging.getLogger(__name__)
+
+# Cambios de stock por libro: {id: (stock, versión)}.
+Cambios = dict[int, tuple[int, float]]
+
+_central = None
+_bloqueo_central = threading.Lock()
+
+
+class Suscripcion:
+    """
+    Libros seguidos por una conexión y cambios pendientes de enviarle.
+    Los métodos se ejecutan en el bucle de eventos de la conexión.
+    """
+    def __init__(self, central: 'CentralLocal', libro_ids: Iterable[int]):
+        self.central = central
+        self.libro_ids = frozenset(libro_ids)
+        self.bucle = asyncio.get_running_loop()
+        self.pendientes: Cambios = {}
+        self.aviso = asyncio.Event()
+
+    def recibir(self, cambios: Cambios) -> None:
+        """
+        Acumula los cambios de los libros seguidos, conservando el más reciente de cada uno.
+        """
+        for pk, cambio in cambios.items():
+            if pk in self.libro_ids:
+                anterior = self.pendientes.get(pk)
+                if anterior is None or cambio[1] >= anterior[1]:
+                    self.pendientes[pk] = cambio
+        if self.pendientes:
+            self.aviso.set()
+
+    async def esperar(self, espera: float, agrupar: float) -> Cambios:
+        """
+        Espera hasta `espera` segundos a que haya cambios y los devuelve (vacío si no
+        llega ninguno). Tras el primero se esperan `agrupar` segundos más, de modo que
+        los cambios que llegan seguidos se envían juntos.
+        """
+        try:
+            await asyncio.wait_for(self.aviso.wait(), espera)
+        except asyncio.TimeoutError:
+            return {}
+        await asyncio.sleep(agrupar)
+        self.aviso.clear()
+        cambios, self.pendientes = self.pendientes, {}
+        return cambios
+
+    def cancelar(self) -> None:
+        self.central.retirar(self)
+
+
+class CentralLocal:
+    """
+    Central de eventos de un solo proceso: los cambios publicados se reparten entre
+    las suscripciones del mismo proceso. Es la base de las centrales entre procesos.
+    """
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self._por_libro: dict[int, set[Suscripcion]] = {}
+
+    def suscribir(self, libro_ids: Iterable[int]) -> Suscripcion:
+        """
+        Crea una suscripción a los cambios de `libro_ids` en el bucle de eventos actual.
+        """
+        suscripcion = Suscripcion(self, libro_ids)
+        with self._bloqueo:
+            for pk in suscripcion.libro_ids:
+                self._por_libro.setdefault(pk, set()).add(suscripcion)
+        return suscripcion
+
+    def retirar(self, suscripcion: Suscripcion) -> None:
+        with self._bloqueo:
+            for pk in suscripcion.libro_ids:
+                suscripciones = self._por_libro.get(pk, set())
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    self._por_libro.pop(pk, None)
+
+    def interesa(self, libro_ids: Iterable[int]) -> bool:
+        """
+        Indica si algún suscriptor puede recibir cambios de `libro_ids`. Permite
+        no consultar el stock cuando nadie lo está siguiendo.
+        """
+        with self._bloqueo:
+            return any(pk in self._por_libro for pk in libro_ids)
+
+    def publicar(self, cambios: Cambios) -> None:
+        self.difundir(cambios)
+
+    def difundir(self, cambios: Cambios) -> None:
+        """
+        Entrega `cambios` a las suscripciones de este proceso. Puede llamarse desde
+        cualquier hilo: cada suscripción los recibe en su propio bucle de eventos.
+        """
+        with self._bloqueo:
+            destinos = {suscripcion for pk in cambios for suscripcion in self._por_libro.get(pk, ())}
+        for suscripcion in destinos:
+            try:
+                suscripcion.bucle.call_soon_threadsafe(suscripcion.recibir, cambios)
+            except RuntimeError:
+                # El bucle de la conexión ya se cerró.
+                self.retirar(suscripcion)
+
+
+class CentralRedis(CentralLocal):
+    """
+    Central de eventos entre procesos: los cambios se publican en un canal de Redis
+    (`REDIS_URL`) y cada proceso los escucha con una única tarea por bucle de eventos,
+    que los reparte entre sus suscripciones locales.
+    """
+    canal = 'biblioteca:eventos:stock'
+
+    def __init__(self):
+        super().__init__()
+        import redis
+
+        self._cliente = redis.Redis.from_url(settings.REDIS_URL)
+        self._escuchas = {}
+
+    def interesa(self, libro_ids: Iterable[int]) -> bool:
+        # Los suscriptores de otros procesos no se conocen desde aquí.
+        return True
+
+    def publicar(self, cambios: Cambios) -> None:
+        self._cliente.publish(self.canal, json.dumps({pk: list(cambio) for pk, cambio in cambios.items()}))
+
+    def suscribir(self, libro_ids: Iterable[int]) -> Suscripcion:
+        suscripcion = super().suscribir(libro_ids)
+        escucha = self._escuchas.get(suscripcion.bucle)
+        if escucha is None or escucha.done():
+            self._escuchas[suscripcion.bucle] = suscripcion.bucle.create_task(self.escuchar())
+        return suscripcion
+
+    async def escuchar(self) -> None:
+        """
+        Reparte los mensajes del canal entre las suscripciones locales. Si se pierde
+        la conexión con Redis, se reintenta tras una breve espera.
+        """
+        import redis.asyncio
+
+        while True:
+            try:
+                async with redis.asyncio.Redis.from_url(settings.REDIS_URL) as cliente:
+                    async with cliente.pubsub() as pubsub:
+                        await pubsub.subscribe(self.canal)
+                        async for mensaje in pubsub.listen():
+                            if mensaje['type'] == 'message':
+                                datos = json.loads(mensaje['data'])
+                                self.difundir({int(pk): tuple(cambio) for pk, cambio in datos.items()})
+            except redis.RedisError:
+                logger.warning('Conexión con Redis perdida; se reintenta la escucha de eventos de stock.')
+                await asyncio.sleep(1)
+
+
+def obtener_central() -> CentralLocal:
+    """
+    Devuelve la central de eventos del proceso, creándola la primera vez.
+    """
+    global _central
+    with _bloqueo_central:
+        if _central is None:
+            _central = import_string(settings.EVENTOS_CENTRAL)()
+        return _central
+
+
+def publicar_stock(libro_ids: Iterable[int]) -> None:
+    """
+    Publica el stock de `libro_ids` cuando se confirme la transacción en curso.
+    Un fallo al publicar se registra en el log sin afectar a la operación.
+    """
+    libro_ids = list(libro_ids)
+    transaction.on_commit(lambda: _publicar(libro_ids), robust=True)
+
+
+def _publicar(libro_ids: list[int]) -> None:
+    central = obtener_central()
+    if not central.interesa(libro_ids):
+        return
+    filas = Libro.objects.filter(pk__in=libro_ids).values_list('id', 'stock', 'actualizado')
+    central.publicar({pk: (stock, actualizado.timestamp()) for pk, stock, actualizado in filas})
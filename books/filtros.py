@@ -0,0 +1,117 @@
+"""
+Filtros y facetas del catálogo de libros.
+Los filtros (autor, rango de años y disponibilidad) se leen de los parámetros de la
+petición y se aplican igual en el catálogo web y en `/api/libros/`; el autor se
+compara por su autor normalizado (ver `books.autores`), así que no importan las
+tildes ni las mayúsculas. Las facetas cuentan los libros por autor, por década y
+por disponibilidad con una consulta agrupada cada una, y se guardan en la caché versionada del catálogo por combinación
+de filtros, de modo que cualquier cambio en un libro las invalida.
+"""
+from dataclasses import dataclass
+
+from django.db.models import Count, F, Q, QuerySet
+
+from .cache import clave_listado, obtener_o_calcular
+from .models import Libro, normalizar_autor
+from .search import buscar_libros
+
+# Autores que se muestran en la faceta de autores (los de más libros).
+MAXIMO_AUTORES = 20
+
+# Valores del parámetro `disponible`.
+DISPONIBILIDAD = {'si': True, 'no': False, 'todos': None}
+
+
+class FiltroInvalido(ValueError):
+    """
+    Un parámetro de filtrado no tiene un valor válido.
+    """
+    def __init__(self, parametro: str, mensaje: str):
+        super().__init__(mensaje)
+        self.parametro = parametro
+
+
+@dataclass(frozen=True)
+class FiltrosCatalogo:
+    """
+    Filtros del catálogo. Los campos vacíos (None o '') no filtran.
+    """
+    autor: str = ''
+    ano_desde: int | None = None
+    ano_hasta: int | None = None
+    disponible: bool | None = None
+
+    def aplicar(self, queryset: QuerySet, excepto: tuple[str, ...] = ()) -> QuerySet:
+        """
+        Filtra `queryset`, omitiendo los filtros de `excepto` ('autor', 'ano' o 'disponible').
+        """
+        if self.autor and 'autor' not in excepto:
+            queryset = queryset.filter(autor_normalizado__clave=normalizar_autor(self.autor))
+        if 'ano' not in excepto:
+            if self.ano_desde is not None:
+                queryset = queryset.filter(ano_publicacion__gte=self.ano_desde)
+            if self.ano_hasta is not None:
+                queryset = queryset.filter(ano_publicacion__lte=self.ano_hasta)
+        if self.disponible is not None and 'disponible' not in excepto:
+            queryset = queryset.filter(stock__gt=0) if self.disponible else queryset.filter(stock__lte=0)
+        return queryset
+
+
+def _leer_ano(parametros, nombre: str) -> int | None:
+    valor = parametros.get(nombre, '').strip()
+    if not valor:
+        return None
+    try:
+        return int(valor)
+    except ValueError:
+        raise FiltroInvalido(nombre, f'El parámetro "{nombre}" debe ser un año (número entero).')
+
+
+def leer_filtros(parametros, disponible: bool | None = None) -> FiltrosCatalogo:
+    """
+    Lee los filtros de los parámetros de una petición (`autor`, `ano_desde`,
+    `ano_hasta` y `disponible`: 'si', 'no' o 'todos'). `disponible` es el valor
+    que se usa si no se indica el parámetro. Lanza `FiltroInvalido` si alguno no es válido.
+    """
+    ano_desde, ano_hasta = _leer_ano(parametros, 'ano_desde'), _leer_ano(parametros, 'ano_hasta')
+    if ano_desde is not None and ano_hasta is not None and ano_desde > ano_hasta:
+        raise FiltroInvalido('ano_desde', 'El parámetro "ano_desde" no puede ser posterior a "ano_hasta".')
+    valor = parametros.get('disponible', '').strip()
+    if valor:
+        if valor not in DISPONIBILIDAD:
+            raise FiltroInvalido('disponible', 'El parámetro "disponible" debe ser "si", "no" o "todos".')
+        disponible = DISPONIBILIDAD[valor]
+    return FiltrosCatalogo(parametros.get('autor', '').strip(), ano_desde, ano_hasta, disponible)
+
+
+def facetas(filtros: FiltrosCatalogo, busqueda: str = '') -> dict:
+    """
+    Cuenta los libros que cumplen `filtros` (y la búsqueda, si se indica) por autor,
+    por década y por disponibilidad. Cada faceta aplica todos los filtros salvo el
+    suyo, para mostrar cuántos libros habría al cambiar ese filtro.
+    Se calcula con tres consultas agrupadas y se guarda en la caché del catálogo.
+    """
+    def calcular():
+        base = Libro.objects.all()
+        if busqueda:
+            base = base.filter(pk__in=buscar_libros(Libro.objects.all(), busqueda).values('pk'))
+        autores = (
+            filtros.aplicar(base, excepto=('autor',)).filter(autor_normalizado__isnull=False)
+            .values('autor_normalizado', 'autor_normalizado__nombre')
+            .annotate(total=Count('id')).order_by('-total', 'autor_normalizado__nombre')[:MAXIMO_AUTORES]
+        )
+        decadas = (
+            filtros.aplicar(base, excepto=('ano',))
+            .values(decada=F('ano_publicacion') / 10 * 10).annotate(total=Count('id')).order_by('decada')
+        )
+        disponibilidad = filtros.aplicar(base, excepto=('disponible',)).aggregate(
+            disponibles=Count('id', filter=Q(stock__gt=0)),
+            agotados=Count('id', filter=Q(stock__lte=0)),
+        )
+        autores = [
+            {'autor': fila['autor_normalizado__nombre'], 'total': fila['total']}
+            for fila in autores
+        ]
+        return {'autores': autores, 'decadas': list(decadas), 'disponibilidad': disponibilidad}
+
+    return obtener_o_calcular(clave_listado('facetas', filtros, busqueda.strip()), calcular)
@@ -0,0 +1,232 @@
+"""
+Instrumentación por petición: consultas SQL, tiempo de base de datos y tiempo total.
+`InstrumentacionMiddleware` mide el SQL con un `execute_wrapper` instalado en cada
+conexión al abrirla, que anota las consultas en el registro de la petición en curso
+(una ContextVar). Así se cuentan también las consultas de las vistas síncronas que
+un servidor ASGI ejecuta en otro hilo, con sus propias conexiones. Añade la cabecera
+`Server-Timing` (solo con `INSTRUMENTACION_CABECERA`), registra en el log las peticiones lentas y las consultas repetidas (firma típica de un N+1) y acumula
+muestras por ruta para calcular percentiles. El coste por consulta es una llamada
+y dos lecturas del reloj, por lo que puede mantenerse activo en producción.
+"""
+import json
+import logging
+import math
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class RegistroConsultas:
+    """
+    Envoltorio para `execute_wrapper` que cuenta las consultas, suma su duración y
+    agrupa las repetidas por su SQL parametrizado.
+    """
+    __slots__ = ('consultas', 'duracion', 'firmas')
+
+    def __init__(self):
+        self.consultas = 0
+        self.duracion = 0.0
+        self.firmas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duracion += time.perf_counter() - inicio
+            self.consultas += 1
+            self.firmas[sql] += 1
+
+    def repetidas(self, minimo: int) -> list[tuple[str, int]]:
+        """
+        Consultas ejecutadas al menos `minimo` veces, de la más a la menos repetida.
+        """
+        return [(sql, veces) for sql, veces in self.firmas.most_common() if veces >= minimo]
+
+
+# Registro de la petición en curso. `sync_to_async` copia el contexto, así que
+# también es visible en el hilo que ejecuta una vista síncrona bajo ASGI.
+_registro_actual: ContextVar[RegistroConsultas | None] = ContextVar('registro_consultas', default=None)
+
+
+def _medir_consulta(execute, sql, params, many, context):
+    """
+    Envoltorio permanente de cada conexión: anota la consulta en el registro de la
+    petición en curso, si lo hay (fuera de una petición solo añade una llamada).
+    """
+    registro = _registro_actual.get()
+    if registro is None:
+        return execute(sql, params, many, context)
+    return registro(execute, sql, params, many, context)
+
+
+def instalar_medicion(conexion) -> None:
+    """
+    Instala `_medir_consulta` en `conexion` si aún no lo tiene. Se llama al abrir
+    cada conexión, en cualquier hilo (ver `books.signals`).
+    """
+    if _medir_consulta not in conexion.execute_wrappers:
+        conexion.execute_wrappers.append(_medir_consulta)
+
+
+def percentil(ordenados: list[float], p: float) -> float:
+    """
+    Percentil `p` (0-100) de una lista ya ordenada, por el método del rango más cercano.
+    """
+    if not ordenados:
+        return 0.0
+    indice = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+
+class MetricasRutas:
+    """
+    Muestras recientes (duración total, duración de BD y nº de consultas) por ruta.
+    Cada ruta guarda como máximo `INSTRUMENTACION_MUESTRAS` peticiones, así que la
+    memoria usada está acotada. Las métricas son del proceso actual: con varios
+    workers, cada uno informa de las peticiones que ha atendido.
+    """
+    def __init__(self):
+        self._bloqueo = threading.Lock()
+        self._muestras = {}
+        self._peticiones = Counter()
+
+    def registrar(self, ruta: str, total_ms: float, db_ms: float, consultas: int) -> None:
+        with self._bloqueo:
+            muestras = self._muestras.get(ruta)
+            if muestras is None:
+                muestras = self._muestras[ruta] = deque(maxlen=settings.INSTRUMENTACION_MUESTRAS)
+            muestras.append((total_ms, db_ms, consultas))
+            self._peticiones[ruta] += 1
+
+    def resumen(self) -> dict:
+        """
+        Devuelve, por ruta, el nº de peticiones y los percentiles 50/95/99 de las muestras.
+        """
+        with self._bloqueo:
+            copia = {ruta: list(muestras) for ruta, muestras in self._muestras.items()}
+            peticiones = dict(self._peticiones)
+        resumen = {}
+        for ruta, muestras in sorted(copia.items()):
+            totales = sorted(muestra[0] for muestra in muestras)
+            bd = sorted(muestra[1] for muestra in muestras)
+            consultas = sorted(muestra[2] for muestra in muestras)
+            resumen[ruta] = {
+                'peticiones': peticiones[ruta],
+                'muestras': len(muestras),
+                'total_ms': {f'p{p}': round(percentil(totales, p), 2) for p in (50, 95, 99)},
+                'db_ms': {f'p{p}': round(percentil(bd, p), 2) for p in (50, 95, 99)},
+                'consultas': {'p50': percentil(consultas, 50), 'max': consultas[-1]},
+            }
+        return resumen
+
+    def reiniciar(self) -> None:
+        with self._bloqueo:
+            self._muestras.clear()
+            self._peticiones.clear()
+
+
+metricas = MetricasRutas()
+
+
+def nombre_ruta(request) -> str:
+    """
+    Identifica la ruta por su patrón de URL (no por la URL concreta), p. ej.
+    'GET api/libros/<int:pk>/', para que las muestras de todos los libros se agreguen juntas.
+    """
+    coincidencia = getattr(request, 'resolver_match', None)
+    patron = coincidencia.route if coincidencia is not None else '<sin ruta>'
+    return f'{request.method} {patron}'
+
+
+class InstrumentacionMiddleware:
+    """
+    Mide cada petición y publica las mediciones en el log ('books.instrumentacion'),
+    en las métricas agregadas por ruta y, con `INSTRUMENTACION_CABECERA` (por
+    defecto, solo con DEBUG), en la cabecera `Server-Timing` de la respuesta.
+    Funciona con WSGI y con ASGI (sin convertir la cadena de middleware a síncrona).
+    Se desactiva con `INSTRUMENTACION_ACTIVA = False`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTACION_ACTIVA:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with self.registrar(registro):
+            respuesta = self.get_response(request)
+        return self.medir(request, respuesta, registro, inicio)
+
+    async def __acall__(self, request):
+        registro = RegistroConsultas()
+        inicio = time.perf_counter()
+        with self.registrar(registro):
+            respuesta = await self.get_response(request)
+        return self.medir(request, respuesta, registro, inicio)
+
+    @contextmanager
+    def registrar(self, registro: RegistroConsultas):
+        """
+        Hace de `registro` el registro de la petición en curso.
+        """
+        # Las conexiones de este hilo abiertas antes de instalar el middleware.
+        for conexion in connections.all(initialized_only=True):
+            instalar_medicion(conexion)
+        token = _registro_actual.set(registro)
+        try:
+            yield
+        finally:
+            _registro_actual.reset(token)
+
+    def medir(self, request, respuesta, registro: RegistroConsultas, inicio: float):
+        total_ms = (time.perf_counter() - inicio) * 1000
+        db_ms = registro.duracion * 1000
+
+        if settings.INSTRUMENTACION_CABECERA:
+            respuesta.headers['Server-Timing'] = (
+                f'db;dur={db_ms:.1f};desc="consultas={registro.consultas}", '
+                f'app;dur={total_ms - db_ms:.1f}, total;dur={total_ms:.1f}'
+            )
+        ruta = nombre_ruta(request)
+        metricas.registrar(ruta, total_ms, db_ms, registro.consultas)
+        self.registrar_en_log(request, respuesta, ruta, registro, total_ms, db_ms)
+        return respuesta
+
+    def registrar_en_log(self, request, respuesta, ruta, registro, total_ms, db_ms) -> None:
+        """
+        Escribe un registro JSON si la petición fue lenta o repitió consultas.
+        """
+        repetidas = registro.repetidas(settings.INSTRUMENTACION_UMBRAL_REPETIDAS)
+        lenta = total_ms >= settings.INSTRUMENTACION_UMBRAL_LENTO_MS
+        if not lenta and not repetidas:
+            return
+        datos = {
+            'evento': 'peticion_lenta' if lenta else 'consultas_repetidas',
+            'ruta': ruta,
+            'path': request.path,
+            'estado': respuesta.status_code,
+            'total_ms': round(total_ms, 1),
+            'db_ms': round(db_ms, 1),
+            'consultas': registro.consultas,
+            'repetidas': [{'sql': sql[:300], 'veces': veces} for sql, veces in repetidas],
+        }
+        logger.warning(json.dumps(datos, ensure_ascii=False), extra={'instrumentacion': datos})
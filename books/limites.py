@@ -0,0 +1,197 @@
+"""
+Límite de peticiones por coste, guardado en la caché compartida.
+Cada usuario autenticado (o cada IP, para las peticiones anónimas) dispone de
+`LIMITE_USUARIO` (o `LIMITE_IP`) unidades por ventana deslizante de
+`LIMITE_VENTANA_SEGUNDOS`. Cada petición consume las unidades de su tipo según
+`LIMITE_COSTES`: una lectura cuesta poco, un préstamo o una devolución (una
+transacción de escritura en la principal) bastante más, y un lote cuesta por
+cada una de sus operaciones. Al superar el límite se responde 429 con `Retry-After`.
+
+La ventana deslizante se aproxima con un contador por ventana fija: el uso es el
+de la ventana actual más el de la anterior, ponderado por la parte de esta que
+aún cae dentro de la ventana deslizante. El contador se incrementa de forma
+atómica; con Redis, el incremento y la lectura de la ventana anterior van en una
+sola transacción (MULTI), es decir, en una única ida y vuelta por petición. Las
+peticiones rechazadas también consumen, así que un cliente que reintenta sin
+respetar `Retry-After` sigue limitado.
+
+Las conexiones abiertas del flujo de eventos (`books.api_async.eventos_stock`) se
+limitan aparte: cada cliente puede mantener a la vez `EVENTOS_CONEXIONES_POR_CLIENTE`.
+"""
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.redis import RedisCache
+from rest_framework.throttling import BaseThrottle
+
+PETICION = 'peticion'
+PRESTAMO = 'prestamo'
+OPERACION_LOTE = 'operacion_lote'
+
+
+def identidad(request, usuario=None) -> tuple[str, int]:
+    """
+    Devuelve la clave del cliente y su límite: el usuario si está autenticado y,
+    si no, la IP (con `X-Forwarded-For` según `NUM_PROXIES`, como DRF).
+    """
+    if usuario is not None and usuario.is_authenticated:
+        return f'u{usuario.pk}', settings.LIMITE_USUARIO
+    return f'ip{BaseThrottle().get_ident(request)}', settings.LIMITE_IP
+
+
+def _contar_redis(cache: RedisCache, actual: str, anterior: str, coste: int, timeout: int) -> tuple[int, int]:
+    # La API de caché de Django no agrupa operaciones (y su `incr` consulta antes
+    # si la clave existe): se usa el cliente de Redis con una transacción.
+    actual, anterior = cache.make_and_validate_key(actual), cache.make_and_validate_key(anterior)
+    with cache._cache.get_client(actual, write=True).pipeline() as pipeline:
+        pipeline.set(actual, 0, ex=timeout, nx=True)
+        pipeline.incrby(actual, coste)
+        pipeline.get(anterior)
+        _, usado, previo = pipeline.execute()
+    return usado, int(previo or 0)
+
+
+def _contar(cache, actual: str, anterior: str, coste: int, timeout: int) -> tuple[int, int]:
+    try:
+        usado = cache.incr(actual, coste)
+    except ValueError:
+        # Primera petición de la ventana. Si otra la crea a la vez, `add` falla y se incrementa.
+        usado = coste if cache.add(actual, coste, timeout=timeout) else cache.incr(actual, coste)
+    return usado, cache.get(anterior, 0)
+
+
+def consumir(clave: str, limite: int, coste: int) -> float | None:
+    """
+    Descuenta `coste` unidades del cliente `clave`. Devuelve None si la petición
+    está dentro del límite o, si lo supera, los segundos que debe esperar.
+    """
+    ventana = settings.LIMITE_VENTANA_SEGUNDOS
+    ahora = time.time()
+    numero, transcurrido = divmod(ahora, ventana)
+    actual, anterior = f'limite:{clave}:{numero:.0f}', f'limite:{clave}:{numero - 1:.0f}'
+    # `django.core.cache.cache` es un proxy: el tipo del backend se comprueba sobre la instancia.
+    cache = caches[DEFAULT_CACHE_ALIAS]
+    contar = _contar_redis if isinstance(cache, RedisCache) else _contar
+    # El contador se conserva dos ventanas: durante la siguiente hace de ventana anterior.
+    usado, previo = contar(cache, actual, anterior, coste, 2 * ventana)
+
+    fraccion = transcurrido / ventana
+    if previo * (1 - fraccion) + usado <= limite:
+        return None
+    return _espera(previo, usado, fraccion, limite - coste, ventana)
+
+
+def _espera(previo: int, usado: int, fraccion: float, disponible: int, ventana: float) -> float:
+    """
+    Segundos hasta que el uso estimado, sin nuevas peticiones, deje sitio a una
+    petición del mismo coste (`disponible` es el límite menos ese coste).
+    """
+    disponible = max(disponible, 0)
+    if usado <= disponible:
+        # Basta con que la ventana anterior pese menos.
+        return (1 - (disponible - usado) / previo - fraccion) * ventana
+    # Hay que esperar a la siguiente ventana, en la que `usado` pasa a ser el uso anterior.
+    return (1 - fraccion + 1 - disponible / usado) * ventana
+
+
+async def aconsumir(clave: str, limite: int, coste: int) -> float | None:
+    """
+    Versión asíncrona de `consumir` (ver `books.api_async`). Solo usa la caché,
+    así que no necesita el hilo compartido de las operaciones con la base de datos.
+    """
+    return await sync_to_async(consumir, thread_sensitive=False)(clave, limite, coste)
+
+
+def _clave_conexiones(clave: str) -> str:
+    return f'conexiones:{clave}'
+
+
+def _timeout_conexiones() -> int:
+    # Cada conexión renueva el contador con sus latidos: si un proceso termina sin
+    # cerrar las suyas, el contador caduca cuando el cliente deja de tener otras abiertas.
+    return max(int(3 * settings.EVENTOS_LATIDO_SEGUNDOS), 1)
+
+
+def abrir_conexion(clave: str, maximo: int) -> bool:
+    """
+    Cuenta una conexión abierta más del cliente `clave`. Si ya tenía `maximo`,
+    no la cuenta y devuelve False.
+    """
+    cache, contador = caches[DEFAULT_CACHE_ALIAS], _clave_conexiones(clave)
+    try:
+        abiertas = cache.incr(contador)
+    except ValueError:
+        abiertas = 1 if cache.add(contador, 1, timeout=_timeout_conexiones()) else cache.incr(contador)
+    if abiertas > maximo:
+        cerrar_conexion(clave)
+        return False
+    return True
+
+
+def renovar_conexiones(clave: str) -> None:
+    """
+    Evita que caduque el contador de conexiones de `clave` mientras siga alguna abierta.
+    """
+    caches[DEFAULT_CACHE_ALIAS].touch(_clave_conexiones(clave), _timeout_conexiones())
+
+
+def cerrar_conexion(clave: str) -> None:
+    """
+    Descuenta una conexión cerrada del cliente `clave`.
+    """
+    try:
+        caches[DEFAULT_CACHE_ALIAS].decr(_clave_conexiones(clave))
+    except ValueError:
+        # El contador ya había caducado.
+        pass
+
+
+def marcar_consumido(request) -> None:
+    """
+    Indica que la petición ya consumió su coste (p. ej. en una vista asíncrona que
+    delega en una síncrona), para que `LimiteCoste` no vuelva a descontarlo.
+    """
+    request.limite_consumido = True
+
+
+class LimiteCoste(BaseThrottle):
+    """
+    Límite por coste de DRF para las vistas de la API. Las subclases indican el
+    tipo de petición (`tipo`) o calculan su coste (`coste`).
+    """
+    tipo = PETICION
+
+    def coste(self, request, view) -> int:
+        return settings.LIMITE_COSTES[self.tipo]
+
+    def allow_request(self, request, view) -> bool:
+        if getattr(request._request, 'limite_consumido', False):
+            return True
+        marcar_consumido(request._request)
+        clave, limite = identidad(request, request.user)
+        self.espera = consumir(clave, limite, self.coste(request, view))
+        return self.espera is None
+
+    def wait(self) -> float | None:
+        return self.espera
+
+
+class LimitePrestamo(LimiteCoste):
+    """
+    Préstamos, devoluciones y reservas.
+    """
+    tipo = PRESTAMO
+
+
+class LimiteLote(LimiteCoste):
+    """
+    Lotes de préstamos y devoluciones: cuestan por cada operación del lote.
+    """
+    tipo = OPERACION_LOTE
+
+    def coste(self, request, view) -> int:
+        operaciones = request.data.get('operaciones') if isinstance(request.data, dict) else None
+        cantidad = len(operaciones) if isinstance(operaciones, list) else 1
+        return settings.LIMITE_COSTES[self.tipo] * max(cantidad, 1)
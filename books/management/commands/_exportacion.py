@@ -0,0 +1,67 @@
+"""
+Base común de los comandos de exportación del catálogo y de los préstamos.
+"""
+import csv
+import json
+import time
+from itertools import chain
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class ComandoExportacion(BaseCommand):
+    """
+    Exporta un queryset a CSV o JSONL leyéndolo por bloques con `.iterator()`,
+    de modo que la memoria usada no depende del tamaño de la tabla.
+    Las subclases definen `campos` y `get_queryset()` (o `get_querysets()` si las
+    filas salen de varias tablas, que se exportan una tras otra).
+    """
+    campos: list[str] = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--salida', default='-',
+                            help='Archivo de destino, o "-" para la salida estándar.')
+        parser.add_argument('--bloque', type=int, default=2000,
+                            help='Filas leídas de la base de datos por cada bloque.')
+
+    def get_queryset(self):
+        raise NotImplementedError
+
+    def get_querysets(self) -> list:
+        return [self.get_queryset()]
+
+    def handle(self, *args, **options):
+        salida = self.stdout if options['salida'] == '-' else open(options['salida'], 'w', encoding='utf-8', newline='')
+        inicio = time.perf_counter()
+        filas = chain.from_iterable(
+            queryset.values(*self.campos).iterator(chunk_size=options['bloque'])
+            for queryset in self.get_querysets()
+        )
+        try:
+            total = self.escribir(salida, filas, options['formato'])
+        finally:
+            if salida is not self.stdout:
+                salida.close()
+        duracion = time.perf_counter() - inicio
+        ritmo = total / duracion if duracion else 0
+        # El resumen va a stderr para no mezclarse con los datos exportados a stdout.
+        self.stderr.write(f'{total} filas exportadas en {duracion:.1f}s ({ritmo:.0f} filas/s).')
+
+    def escribir(self, salida, filas, formato: str) -> int:
+        """
+        Escribe las filas en `salida` y devuelve cuántas se escribieron.
+        """
+        total = 0
+        if formato == 'csv':
+            escritor = csv.DictWriter(salida, fieldnames=self.campos)
+            escritor.writeheader()
+            for fila in filas:
+                escritor.writerow(fila)
+                total += 1
+        else:
+            for fila in filas:
+                salida.write(json.dumps(fila, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                total += 1
+        return total
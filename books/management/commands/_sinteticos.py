@@ -0,0 +1,30 @@
+"""
+Datos sintéticos compartidos por los comandos de generación y de medición.
+"""
+import random
+
+PALABRAS = [
+    'sombra', 'viento', 'ciudad', 'noche', 'amor', 'guerra', 'tiempo', 'memoria', 'mar', 'jardín',
+    'silencio', 'camino', 'fuego', 'casa', 'río', 'luna', 'historia', 'secreto', 'tierra', 'sueño',
+    'invierno', 'verano', 'espejo', 'laberinto', 'isla', 'reino', 'montaña', 'desierto', 'voz', 'ceniza',
+]
+NOMBRES = ['Gabriel', 'Isabel', 'Julio', 'Laura', 'Mario', 'Carmen', 'Jorge', 'Elena', 'Pablo', 'Rosa']
+APELLIDOS = ['García', 'Allende', 'Cortázar', 'Esquivel', 'Vargas', 'Laforet', 'Borges', 'Garro', 'Neruda', 'Mistral']
+
+
+def titulo_aleatorio() -> str:
+    return f'{random.choice(PALABRAS).capitalize()} de {" ".join(random.sample(PALABRAS, 2))}'
+
+
+def autor_aleatorio() -> str:
+    return f'{random.choice(NOMBRES)} {random.choice(APELLIDOS)}'
+
+
+def errata(palabra: str) -> str:
+    """
+    Introduce un error de escritura (intercambio de dos letras) en `palabra`.
+    """
+    if len(palabra) < 4:
+        return palabra
+    i = random.randrange(1, len(palabra) - 2)
+    return palabra[:i] + palabra[i + 1] + palabra[i] + palabra[i + 2:]
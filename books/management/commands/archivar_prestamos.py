@@ -0,0 +1,40 @@
+"""
+Comando de gestión para mover al archivo los préstamos devueltos antiguos.
+Uso: python manage.py archivar_prestamos --dias 365 --lote 1000 --pausa 0.1
+Pensado para ejecutarse periódicamente (p. ej. con Heroku Scheduler).
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from books.archivo import archivar_lote
+
+
+class Command(BaseCommand):
+    help = 'Mueve por lotes los préstamos devueltos hace más de N días a la tabla de archivo.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=int, default=settings.PRESTAMOS_ARCHIVO_DIAS,
+                            help='Antigüedad mínima (desde la devolución) para archivar un préstamo.')
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Préstamos movidos por transacción.')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Segundos de espera entre lotes para repartir la carga.')
+        parser.add_argument('--max-lotes', type=int, default=None,
+                            help='Número máximo de lotes a procesar en esta ejecución.')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(days=options['dias'])
+        total = lotes = 0
+        while options['max_lotes'] is None or lotes < options['max_lotes']:
+            movidos = archivar_lote(limite, options['lote'])
+            if not movidos:
+                break
+            total += movidos
+            lotes += 1
+            self.stdout.write(f'Lote {lotes}: {movidos} préstamos archivados.')
+            time.sleep(options['pausa'])
+        self.stdout.write(self.style.SUCCESS(f'{total} préstamos archivados en {lotes} lotes.'))
@@ -0,0 +1,162 @@
+"""
+Comando de gestión para comparar la concurrencia por worker de WSGI y de ASGI.
+Uso: python manage.py bench_asgi --peticiones 200 --concurrencia 50 --latencia-ms 20
+Un worker síncrono de gunicorn atiende una petición cada vez, así que se mide
+enviándole las peticiones una tras otra. Con ASGI, un único bucle de eventos recibe
+`--concurrencia` peticiones simultáneas a los endpoints de `books.api_async`. La
+opción `--latencia-ms` añade una espera a cada consulta SQL para simular la latencia
+de red con una base de datos remota, que es cuando un worker síncrono queda bloqueado.
+"""
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from books.instrumentacion import percentil
+from books.models import Libro, Usuario
+from books.tokens import emitir_token
+
+ESCENARIOS = ('detalle', 'prestamo')
+
+
+async def peticion_asgi(aplicacion, metodo: str, ruta: str, cabeceras: dict) -> int:
+    """
+    Envía una petición HTTP a `aplicacion` siguiendo el protocolo ASGI y devuelve su código de estado.
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': metodo, 'scheme': 'http', 'path': ruta, 'raw_path': ruta.encode(),
+        'query_string': b'', 'root_path': '',
+        'headers': [(b'host', b'testserver')] + [(k.encode(), v.encode()) for k, v in cabeceras.items()],
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    cuerpo_enviado = False
+
+    async def recibir():
+        nonlocal cuerpo_enviado
+        if not cuerpo_enviado:
+            cuerpo_enviado = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # El cliente sigue conectado mientras se genera la respuesta.
+        await asyncio.Future()
+
+    mensajes = []
+
+    async def enviar(mensaje):
+        mensajes.append(mensaje)
+
+    await aplicacion(scope, recibir, enviar)
+    return mensajes[0]['status']
+
+
+class Command(BaseCommand):
+    help = 'Compara las peticiones por segundo de un worker WSGI y de un worker ASGI con peticiones concurrentes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--peticiones', type=int, default=200,
+                            help='Peticiones por escenario y servidor.')
+        parser.add_argument('--concurrencia', type=int, default=50,
+                            help='Peticiones simultáneas enviadas al worker ASGI.')
+        parser.add_argument('--latencia-ms', type=float, default=20.0,
+                            help='Espera añadida a cada consulta SQL (latencia de red simulada).')
+        parser.add_argument('--escenarios', default=','.join(ESCENARIOS),
+                            help='Escenarios a medir, separados por comas: detalle, prestamo.')
+
+    def handle(self, *args, **options):
+        escenarios = options['escenarios'].split(',')
+        if set(escenarios) - set(ESCENARIOS):
+            raise CommandError(f'Escenarios disponibles: {", ".join(ESCENARIOS)}.')
+        libro = Libro.objects.filter(stock__gt=0).order_by('pk').first()
+        if libro is None:
+            raise CommandError('No hay libros con stock; ejecuta antes seed_biblioteca.')
+        usuarios = list(Usuario.objects.filter(rol='regular').order_by('pk')[:options['concurrencia']])
+        if not usuarios:
+            raise CommandError('No hay usuarios regulares; ejecuta antes seed_biblioteca.')
+        tokens = [emitir_token(usuario, 'bench_asgi', dias=1)[0] for usuario in usuarios]
+
+        espera = options['latencia_ms'] / 1000
+
+        def retardo(execute, sql, params, many, context):
+            time.sleep(espera)
+            return execute(sql, params, many, context)
+
+        def instalar_retardo(sender, connection, **kwargs):
+            connection.execute_wrappers.append(retardo)
+
+        resultado = {'configuracion': {k: options[k] for k in ('peticiones', 'concurrencia', 'latencia_ms')}}
+        connections.close_all()
+        connection_created.connect(instalar_retardo)
+        try:
+            # El límite de peticiones se sigue comprobando, pero sin rechazar ninguna.
+            with override_settings(ALLOWED_HOSTS=['testserver'], LIMITE_USUARIO=sys.maxsize, LIMITE_IP=sys.maxsize):
+                for escenario in escenarios:
+                    wsgi = self.medir_wsgi(escenario, libro, tokens, options['peticiones'])
+                    asgi = asyncio.run(self.medir_asgi(escenario, libro, tokens, options))
+                    resultado[escenario] = {
+                        'wsgi_un_worker': wsgi,
+                        'asgi_un_worker': asgi,
+                        'aceleracion': round(asgi['rps'] / wsgi['rps'], 1) if wsgi['rps'] else None,
+                    }
+        finally:
+            connection_created.disconnect(instalar_retardo)
+            connections.close_all()
+        self.stdout.write(json.dumps(resultado, indent=2))
+
+    def rutas(self, escenario: str, libro: Libro, asincrono: bool) -> list[tuple[str, str]]:
+        prefijo = 'async-' if asincrono else ''
+        if escenario == 'detalle':
+            return [('GET', reverse(f'api:{prefijo}libro-detail', args=[libro.pk]))]
+        return [
+            ('POST', reverse(f'api:{prefijo}prestar-libro', args=[libro.pk])),
+            ('POST', reverse(f'api:{prefijo}devolver-libro', args=[libro.pk])),
+        ]
+
+    def medir_wsgi(self, escenario: str, libro: Libro, tokens: list[str], peticiones: int) -> dict:
+        cliente = Client(raise_request_exception=False)
+        rutas = self.rutas(escenario, libro, asincrono=False)
+        latencias, estados = [], []
+        inicio = time.perf_counter()
+        for _ in range(max(1, peticiones // len(rutas))):
+            for metodo, ruta in rutas:
+                antes = time.perf_counter()
+                respuesta = cliente.generic(metodo, ruta, HTTP_AUTHORIZATION=f'Bearer {tokens[0]}')
+                latencias.append((time.perf_counter() - antes) * 1000)
+                estados.append(respuesta.status_code)
+        return self.resumir(latencias, estados, time.perf_counter() - inicio)
+
+    async def medir_asgi(self, escenario: str, libro: Libro, tokens: list[str], options) -> dict:
+        aplicacion = ASGIHandler()
+        rutas = self.rutas(escenario, libro, asincrono=True)
+        latencias, estados = [], []
+        # Las rondas (un préstamo y su devolución) se reparten entre los clientes a medida que terminan.
+        rondas = iter(range(max(1, options['peticiones'] // len(rutas))))
+
+        async def cliente(token: str):
+            # Cada cliente usa su propio usuario para que los préstamos no choquen entre sí.
+            for _ in rondas:
+                for metodo, ruta in rutas:
+                    antes = time.perf_counter()
+                    estados.append(await peticion_asgi(aplicacion, metodo, ruta, {'authorization': f'Bearer {token}'}))
+                    latencias.append((time.perf_counter() - antes) * 1000)
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(tokens[i % len(tokens)]) for i in range(options['concurrencia'])))
+        return self.resumir(latencias, estados, time.perf_counter() - inicio)
+
+    def resumir(self, latencias: list[float], estados: list[int], duracion: float) -> dict:
+        latencias.sort()
+        return {
+            'peticiones': len(latencias),
+            'rps': round(len(latencias) / duracion, 1),
+            'p50_ms': round(percentil(latencias, 50), 2),
+            'p99_ms': round(percentil(latencias, 99), 2),
+            'estados': dict(Counter(str(estado) for estado in estados)),
+        }
@@ -0,0 +1,67 @@
+"""
+Comando de gestión para comparar el coste de la autenticación básica y por token.
+Uso: python manage.py bench_autenticacion --segundos 5
+Autentica repetidamente una petición de la API con cada esquema y muestra en JSON
+las peticiones por segundo y los percentiles de latencia de cada uno. Los datos
+de prueba se crean dentro de una transacción que se deshace al terminar.
+"""
+import base64
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.request import Request
+
+from books.authentication import TokenAutenticacion
+from books.instrumentacion import percentil
+from books.models import Usuario
+from books.tokens import emitir_token, vaciar_cache
+
+
+class Command(BaseCommand):
+    help = 'Compara las peticiones por segundo de la autenticación básica y de la autenticación por token.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--segundos', type=float, default=3.0,
+                            help='Duración de la medición de cada esquema.')
+
+    def handle(self, *args, **options):
+        fabrica = RequestFactory()
+        with transaction.atomic():
+            usuario = Usuario.objects.create_user('bench-autenticacion', password='clave-de-prueba')
+            token, _ = emitir_token(usuario)
+            basica = base64.b64encode(b'bench-autenticacion:clave-de-prueba').decode()
+            vaciar_cache()
+            resultados = {
+                'basic': self.medir(BasicAuthentication(), fabrica, f'Basic {basica}', options['segundos']),
+                'token': self.medir(TokenAutenticacion(), fabrica, f'Bearer {token}', options['segundos']),
+                # Sin la caché del proceso: cada verificación consulta la base de datos.
+                'token_sin_cache': self.medir(
+                    TokenAutenticacion(), fabrica, f'Bearer {token}', options['segundos'], preparar=vaciar_cache,
+                ),
+            }
+            transaction.set_rollback(True)
+        resultados['aceleracion'] = round(resultados['token']['rps'] / resultados['basic']['rps'], 1)
+        self.stdout.write(json.dumps(resultados, indent=2))
+
+    def medir(self, autenticacion, fabrica: RequestFactory, cabecera: str, segundos: float, preparar=None) -> dict:
+        latencias = []
+        inicio = fin = time.perf_counter()
+        while fin - inicio < segundos:
+            peticion = Request(fabrica.get('/api/libros/', HTTP_AUTHORIZATION=cabecera))
+            if preparar is not None:
+                preparar()
+            antes = time.perf_counter()
+            autenticacion.authenticate(peticion)
+            fin = time.perf_counter()
+            latencias.append((fin - antes) * 1000)
+        latencias.sort()
+        return {
+            'peticiones': len(latencias),
+            'rps': round(len(latencias) / (fin - inicio), 1),
+            'p50_ms': round(percentil(latencias, 50), 3),
+            'p99_ms': round(percentil(latencias, 99), 3),
+        }
@@ -0,0 +1,213 @@
+"""
+Comando de gestión para medir el rendimiento de la aplicación bajo carga concurrente.
+Uso: python manage.py seed_biblioteca --usuarios 1000 --libros 10000 --prestamos 50000
+     python manage.py bench_biblioteca --hilos 8 --peticiones 5000 --salida bench.json
+Cada hilo recorre la aplicación WSGI completa (middleware incluido) con su propio
+cliente de pruebas y un usuario generado por `seed_biblioteca`. El resultado es un
+JSON con el rendimiento, los percentiles de latencia y las consultas por petición de
+cada escenario, pensado para comparar ejecuciones entre commits.
+"""
+import json
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from books.instrumentacion import percentil
+from books.models import Libro, Usuario
+
+from ._sinteticos import PALABRAS
+
+# Peso relativo de cada escenario en la mezcla por defecto.
+MEZCLA_POR_DEFECTO = 'catalogo=25,catalogo_api=15,detalle=20,busqueda=15,prestamo=10,mis_libros=15'
+
+CONSULTAS_SERVER_TIMING = re.compile(r'desc="consultas=(\d+)"')
+
+
+def leer_mezcla(texto: str) -> dict[str, int]:
+    """
+    Convierte 'catalogo=25,detalle=20' en {'catalogo': 25, 'detalle': 20}.
+    """
+    try:
+        mezcla = {nombre: int(peso) for nombre, peso in (parte.split('=') for parte in texto.split(','))}
+    except ValueError:
+        raise CommandError('La mezcla debe tener la forma escenario=peso,escenario=peso...')
+    desconocidos = set(mezcla) - set(Escenarios.DISPONIBLES)
+    if desconocidos:
+        raise CommandError(f'Escenarios desconocidos: {", ".join(sorted(desconocidos))}.')
+    return mezcla
+
+
+class Escenarios:
+    """
+    Peticiones de cada escenario para un usuario concreto. Cada petición se mide
+    por separado y se anota en `registro` como (nombre, duración en ms, respuesta).
+    """
+    DISPONIBLES = ['catalogo', 'catalogo_api', 'detalle', 'busqueda', 'prestamo', 'mis_libros']
+
+    def __init__(self, cliente: Client, libros: list[int]):
+        self.cliente = cliente
+        self.libros = libros
+        self.registro = []
+
+    def pedir(self, nombre: str, metodo: str, url: str, datos: dict | None = None) -> None:
+        inicio = time.perf_counter()
+        respuesta = getattr(self.cliente, metodo)(url, datos)
+        self.registro.append((nombre, (time.perf_counter() - inicio) * 1000, respuesta))
+
+    def catalogo(self):
+        self.pedir('catalogo', 'get', reverse('books:listar_libros'))
+
+    def catalogo_api(self):
+        self.pedir('catalogo_api', 'get', reverse('api:libro-list-create'))
+
+    def detalle(self):
+        libro = random.choice(self.libros)
+        self.pedir('detalle', 'get', reverse('api:libro-detail', args=[libro]))
+
+    def busqueda(self):
+        texto = ' '.join(random.sample(PALABRAS, 2))
+        self.pedir('busqueda', 'get', reverse('api:libro-list-create'), {'q': texto})
+
+    def prestamo(self):
+        # Presta y devuelve el mismo libro, de modo que el stock no se agota durante la medición.
+        libro = random.choice(self.libros)
+        self.pedir('prestar', 'post', reverse('api:prestar-libro', args=[libro]))
+        self.pedir('devolver', 'post', reverse('api:devolver-libro', args=[libro]))
+
+    def mis_libros(self):
+        self.pedir('mis_libros', 'get', reverse('books:mis_libros'))
+
+
+class Command(BaseCommand):
+    help = (
+        'Ejecuta una carga concurrente sobre el catálogo, el detalle, la búsqueda, los préstamos '
+        'y "mis libros", y muestra rendimiento, percentiles y consultas por petición en JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hilos', type=int, default=8,
+                            help='Clientes concurrentes.')
+        parser.add_argument('--peticiones', type=int, default=2000,
+                            help='Escenarios ejecutados en total (repartidos entre los hilos).')
+        parser.add_argument('--calentamiento', type=int, default=50,
+                            help='Escenarios ejecutados por hilo antes de empezar a medir.')
+        parser.add_argument('--mezcla', default=MEZCLA_POR_DEFECTO,
+                            help='Peso de cada escenario, p. ej. "catalogo=50,detalle=50".')
+        parser.add_argument('--prefijo', default='lector',
+                            help='Prefijo de los usuarios generados por seed_biblioteca.')
+        parser.add_argument('--etiqueta', default='',
+                            help='Texto libre para identificar la ejecución (p. ej. el commit).')
+        parser.add_argument('--salida', default='-',
+                            help='Archivo JSON de destino, o "-" para la salida estándar.')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['semilla'])
+        mezcla = leer_mezcla(options['mezcla'])
+        usuarios = list(
+            Usuario.objects.filter(username__startswith=options['prefijo'], rol='regular')
+            .order_by('pk')[:options['hilos']]
+        )
+        if len(usuarios) < options['hilos']:
+            raise CommandError(
+                f'Hacen falta {options["hilos"]} usuarios "{options["prefijo"]}*"; ejecuta antes seed_biblioteca.'
+            )
+        libros = list(Libro.objects.filter(stock__gt=0).order_by('?').values_list('pk', flat=True)[:1000])
+        if not libros:
+            raise CommandError('No hay libros con stock; ejecuta antes seed_biblioteca.')
+
+        muestras = defaultdict(list)
+        intervalos = []
+        bloqueo = threading.Lock()
+        por_hilo = max(1, options['peticiones'] // options['hilos'])
+
+        def trabajar(usuario):
+            # Los errores del servidor se cuentan como respuestas 500 en lugar de detener la medición.
+            cliente = Client(raise_request_exception=False)
+            cliente.force_login(usuario)
+            escenarios = Escenarios(cliente, libros)
+            nombres, pesos = list(mezcla), list(mezcla.values())
+            try:
+                for _ in range(options['calentamiento']):
+                    getattr(escenarios, random.choices(nombres, pesos)[0])()
+                escenarios.registro.clear()
+                inicio = time.perf_counter()
+                for _ in range(por_hilo):
+                    getattr(escenarios, random.choices(nombres, pesos)[0])()
+                fin = time.perf_counter()
+            finally:
+                connection.close()
+            with bloqueo:
+                intervalos.append((inicio, fin))
+                for nombre, duracion, respuesta in escenarios.registro:
+                    coincidencia = CONSULTAS_SERVER_TIMING.search(respuesta.headers.get('Server-Timing', ''))
+                    consultas = int(coincidencia.group(1)) if coincidencia else None
+                    muestras[nombre].append((duracion, consultas, respuesta.status_code))
+
+        # El cliente de pruebas usa el host 'testserver', que no figura en ALLOWED_HOSTS.
+        # El límite de peticiones se sigue comprobando, pero sin rechazar ninguna. Las
+        # consultas por petición se leen de la cabecera Server-Timing.
+        with override_settings(ALLOWED_HOSTS=['testserver'], LIMITE_USUARIO=sys.maxsize, LIMITE_IP=sys.maxsize,
+                               INSTRUMENTACION_CABECERA=True):
+            with ThreadPoolExecutor(max_workers=options['hilos']) as executor:
+                list(executor.map(trabajar, usuarios))
+        # El rendimiento se calcula sobre la fase medida, sin el calentamiento.
+        duracion = max(fin for _, fin in intervalos) - min(inicio for inicio, _ in intervalos)
+
+        resultado = self.resumir(muestras, duracion, options)
+        texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+        if options['salida'] == '-':
+            self.stdout.write(texto)
+        else:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto + '\n')
+            self.stderr.write(f'Resultado guardado en {options["salida"]}.')
+
+    def resumir(self, muestras: dict, duracion: float, options) -> dict:
+        """
+        Agrega las muestras por escenario: peticiones por segundo, percentiles de
+        latencia (ms), consultas SQL por petición y códigos de estado.
+        """
+        escenarios = {}
+        for nombre, filas in sorted(muestras.items()):
+            latencias = sorted(fila[0] for fila in filas)
+            consultas = [fila[1] for fila in filas if fila[1] is not None]
+            escenarios[nombre] = {
+                'peticiones': len(filas),
+                'rps': round(len(filas) / duracion, 1),
+                'p50_ms': round(percentil(latencias, 50), 2),
+                'p95_ms': round(percentil(latencias, 95), 2),
+                'p99_ms': round(percentil(latencias, 99), 2),
+                'consultas_media': round(sum(consultas) / len(consultas), 2) if consultas else None,
+                'consultas_max': max(consultas, default=None),
+                'estados': dict(Counter(str(fila[2]) for fila in filas)),
+            }
+        total = sum(len(filas) for filas in muestras.values())
+        return {
+            'etiqueta': options['etiqueta'],
+            'fecha': timezone.now().isoformat(),
+            'python': sys.version.split()[0],
+            'base_de_datos': connection.vendor,
+            'configuracion': {
+                'hilos': options['hilos'],
+                'peticiones': options['peticiones'],
+                'mezcla': leer_mezcla(options['mezcla']),
+                'semilla': options['semilla'],
+            },
+            'total': {
+                'peticiones': total,
+                'duracion_s': round(duracion, 3),
+                'rps': round(total / duracion, 1) if duracion else 0,
+            },
+            'escenarios': escenarios,
+        }
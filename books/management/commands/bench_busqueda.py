@@ -0,0 +1,74 @@
+"""
+Comando de gestión para medir la latencia de la búsqueda de libros.
+Uso: python manage.py bench_busqueda --libros 1000000 --generar
+"""
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from books.autores import asignar_autores
+from books.models import Libro
+from books.search import buscar_libros
+
+from ._sinteticos import PALABRAS, autor_aleatorio, errata, titulo_aleatorio
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia (p50/p95/p99) de la búsqueda de libros sobre un catálogo sintético.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=1_000_000,
+                            help='Tamaño mínimo del catálogo sobre el que medir.')
+        parser.add_argument('--generar', action='store_true',
+                            help='Inserta libros sintéticos hasta alcanzar --libros.')
+        parser.add_argument('--lote', type=int, default=10_000,
+                            help='Tamaño de lote de bulk_create al generar libros.')
+        parser.add_argument('--consultas', type=int, default=200,
+                            help='Número de búsquedas a medir.')
+        parser.add_argument('--semilla', type=int, default=42)
+
+    def handle(self, *args, **options):
+        random.seed(options['semilla'])
+        existentes = Libro.objects.count()
+        faltan = options['libros'] - existentes
+        if faltan > 0:
+            if not options['generar']:
+                raise CommandError(
+                    f'El catálogo tiene {existentes} libros; usa --generar para crear {faltan} más.'
+                )
+            self.generar(faltan, options['lote'])
+
+        latencias = []
+        for _ in range(options['consultas']):
+            palabras = random.sample(PALABRAS, 2)
+            if random.random() < 0.3:
+                palabras[0] = errata(palabras[0])
+            inicio = time.perf_counter()
+            list(buscar_libros(Libro.objects.all(), ' '.join(palabras))[:20])
+            latencias.append((time.perf_counter() - inicio) * 1000)
+
+        percentiles = statistics.quantiles(latencias, n=100)
+        self.stdout.write(
+            f'{options["consultas"]} búsquedas sobre {max(existentes, options["libros"])} libros: '
+            f'p50={percentiles[49]:.1f}ms p95={percentiles[94]:.1f}ms p99={percentiles[98]:.1f}ms'
+        )
+
+    def generar(self, cantidad: int, lote: int):
+        """
+        Inserta `cantidad` libros sintéticos en lotes de `lote` filas.
+        """
+        for inicio in range(0, cantidad, lote):
+            libros = [
+                Libro(
+                    titulo=titulo_aleatorio(),
+                    autor=autor_aleatorio(),
+                    ano_publicacion=random.randint(1800, 2025),
+                    stock=random.randint(0, 10),
+                )
+                for _ in range(min(lote, cantidad - inicio))
+            ]
+            asignar_autores(libros)
+            Libro.objects.bulk_create(libros)
+            self.stdout.write(f'{min(inicio + lote, cantidad)} libros generados...')
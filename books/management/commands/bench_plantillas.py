@@ -0,0 +1,110 @@
+"""
+Comando de gestión para medir el renderizado de una página grande del catálogo.
+Uso: python manage.py bench_plantillas --libros 5000 --repeticiones 5
+Compara renderizar la tarjeta de cada libro en cada petición con componer la página
+a partir de las tarjetas cacheadas (`fragmentos_libros`), en frío y con la caché
+caliente, y mide también la carga de las plantillas con y sin el cargador en caché.
+Los libros se crean en memoria y las tarjetas se guardan en una caché local del
+proceso, de modo que solo se mide el renderizado.
+"""
+import json
+import statistics
+import time
+from datetime import datetime, timezone
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.template import Engine, engines
+from django.template.loader import get_template, render_to_string
+from django.test import RequestFactory, override_settings
+from django.utils.safestring import mark_safe
+
+from books.cache import fragmentos_libros
+from books.models import Libro
+from books.views import ListarLibrosView
+
+PLANTILLAS = ('books/listar_libros.html', 'base.html', ListarLibrosView.tarjeta_template_name)
+
+
+class Command(BaseCommand):
+    help = 'Compara el tiempo de renderizar una página grande del catálogo con y sin las tarjetas cacheadas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=5000,
+                            help='Libros de la página a renderizar.')
+        parser.add_argument('--repeticiones', type=int, default=5,
+                            help='Repeticiones de cada medición (se muestra la mediana).')
+
+    def handle(self, *args, **options):
+        actualizado = datetime.now(timezone.utc)
+        libros = [
+            Libro(pk=i, titulo=f'Libro {i}', autor=f'Autor {i % 100}', ano_publicacion=1900 + i % 120,
+                  stock=i % 5 + 1, actualizado=actualizado)
+            for i in range(1, options['libros'] + 1)
+        ]
+        repeticiones = options['repeticiones']
+        cache_local = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'bench_plantillas',
+            'OPTIONS': {'MAX_ENTRIES': options['libros'] * 2},
+        }}
+        with override_settings(CACHES=cache_local):
+            sin_cache = self.medir(lambda: self.renderizar(libros, cacheadas=False), repeticiones)
+            en_frio = self.medir(lambda: self.renderizar(libros, cacheadas=True), repeticiones, antes=cache.clear)
+            en_caliente = self.medir(lambda: self.renderizar(libros, cacheadas=True), repeticiones)
+
+        resultado = {
+            'libros': options['libros'],
+            'sin_cache_ms': sin_cache,
+            'tarjetas_en_frio_ms': en_frio,
+            'tarjetas_en_caliente_ms': en_caliente,
+            'aceleracion': round(sin_cache / en_caliente, 1),
+            'carga_plantillas': self.medir_carga(repeticiones),
+        }
+        self.stdout.write(json.dumps(resultado, indent=2))
+
+    def renderizar(self, libros: list[Libro], cacheadas: bool) -> str:
+        """
+        Renderiza la página del catálogo como `ListarLibrosView`, con o sin la caché de tarjetas.
+        """
+        tarjeta = get_template(ListarLibrosView.tarjeta_template_name)
+        renderizar_tarjeta = lambda libro: tarjeta.render({'libro': libro})
+        if cacheadas:
+            html = fragmentos_libros('bench-tarjeta', libros, renderizar_tarjeta)
+        else:
+            html = [renderizar_tarjeta(libro) for libro in libros]
+        contexto = {
+            'libros': libros, 'tarjetas': [mark_safe(fragmento) for fragmento in html],
+            'orden': 'titulo', 'ordenes': [], 'busqueda': '', 'page_obj': None,
+        }
+        return render_to_string('books/listar_libros.html', contexto, request=RequestFactory().get('/'))
+
+    def medir(self, funcion, repeticiones: int, antes=None) -> float:
+        """
+        Mediana en ms de `repeticiones` ejecuciones de `funcion`, llamando a `antes` previamente.
+        """
+        tiempos = []
+        for _ in range(repeticiones):
+            if antes:
+                antes()
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return round(statistics.median(tiempos), 3)
+
+    def medir_carga(self, repeticiones: int) -> dict:
+        """
+        Tiempo de obtener las plantillas de la página con los cargadores sin caché
+        (se leen y compilan en cada petición) y con los configurados en `TEMPLATES`.
+        """
+        configurado = engines['django'].engine
+        sin_cache = Engine(
+            dirs=configurado.dirs,
+            loaders=['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader'],
+            libraries=configurado.libraries,
+        )
+        cargar = lambda motor: [motor.get_template(nombre) for nombre in PLANTILLAS]
+        cargar(configurado)
+        sin_cache_ms = self.medir(lambda: cargar(sin_cache), repeticiones)
+        cacheado_ms = self.medir(lambda: cargar(configurado), repeticiones)
+        return {'sin_cache_ms': sin_cache_ms, 'cacheado_ms': cacheado_ms}
@@ -0,0 +1,93 @@
+"""
+Comando de gestión para medir la serialización de páginas grandes del catálogo.
+Uso: python manage.py bench_serializacion --filas 10000 --repeticiones 5
+Compara el camino clásico (instancias de `Libro` + `LibroSerializer` + `JSONRenderer`)
+con el que usa `/api/libros/` (`values()` + `JSONRapidoRenderer`), separando el tiempo
+de consulta, de serialización y de renderizado, y el pico de memoria de cada uno.
+"""
+import json
+import statistics
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from books.models import Libro
+from books.renderers import JSONRapidoRenderer
+from books.serializers import LibroSerializer
+
+CAMPOS = tuple(LibroSerializer.Meta.fields)
+
+
+def serializador_drf(queryset):
+    filas = list(queryset)
+    yield 'consulta'
+    datos = LibroSerializer(filas, many=True).data
+    yield 'serializacion'
+    JSONRenderer().render(datos)
+    yield 'renderizado'
+
+
+def valores_orjson(queryset):
+    filas = list(queryset.values(*CAMPOS))
+    yield 'consulta'
+    datos = [{campo: fila[campo] for campo in CAMPOS} for fila in filas]
+    yield 'serializacion'
+    JSONRapidoRenderer().render(datos)
+    yield 'renderizado'
+
+
+CAMINOS = {'serializador_drf': serializador_drf, 'valores_orjson': valores_orjson}
+
+
+class Command(BaseCommand):
+    help = 'Compara el tiempo y la memoria de serializar una página grande con LibroSerializer y con values() + orjson.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filas', type=int, default=10_000,
+                            help='Filas de la página a serializar.')
+        parser.add_argument('--repeticiones', type=int, default=5,
+                            help='Repeticiones de cada camino (se muestra la mediana).')
+
+    def handle(self, *args, **options):
+        if Libro.objects.count() < options['filas']:
+            raise CommandError(f'Hacen falta {options["filas"]} libros; ejecuta antes seed_biblioteca.')
+        queryset = Libro.objects.order_by('titulo', 'id')[:options['filas']]
+        resultado = {'filas': options['filas']}
+        for nombre, camino in CAMINOS.items():
+            tiempos = [self.medir_tiempos(camino, queryset) for _ in range(options['repeticiones'])]
+            fases = {fase: round(statistics.median(t[fase] for t in tiempos), 2) for fase in tiempos[0]}
+            resultado[nombre] = {
+                **{f'{fase}_ms': ms for fase, ms in fases.items()},
+                'total_ms': round(sum(fases.values()), 2),
+                'memoria_pico_kb': self.medir_memoria(camino, queryset),
+            }
+        drf, rapido = resultado['serializador_drf'], resultado['valores_orjson']
+        resultado['aceleracion'] = round(drf['total_ms'] / rapido['total_ms'], 1)
+        self.stdout.write(json.dumps(resultado, indent=2))
+
+    def medir_tiempos(self, camino, queryset) -> dict[str, float]:
+        """
+        Ejecuta `camino` y devuelve la duración en ms de cada una de sus fases.
+        """
+        tiempos = {}
+        inicio = time.perf_counter()
+        for fase in camino(queryset.all()):
+            ahora = time.perf_counter()
+            tiempos[fase] = (ahora - inicio) * 1000
+            inicio = ahora
+        return tiempos
+
+    def medir_memoria(self, camino, queryset) -> int:
+        """
+        Pico de memoria reservada (KiB) durante una ejecución completa de `camino`.
+        Se mide aparte porque tracemalloc ralentiza la ejecución.
+        """
+        tracemalloc.start()
+        try:
+            for _ in camino(queryset.all()):
+                pass
+            return tracemalloc.get_traced_memory()[1] // 1024
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,16 @@
+"""
+Comando de gestión para exportar el catálogo de libros.
+Uso: python manage.py export_libros --formato jsonl --salida catalogo.jsonl
+El resultado puede volver a cargarse con `import_libros`.
+"""
+from books.models import Libro
+
+from ._exportacion import ComandoExportacion
+
+
+class Command(ComandoExportacion):
+    help = 'Exporta el catálogo de libros a CSV o JSONL en streaming.'
+    campos = ['id', 'titulo', 'autor', 'ano_publicacion', 'stock']
+
+    def get_queryset(self):
+        return Libro.objects.order_by('id')
@@ -0,0 +1,157 @@
+"""
+Comando de gestión para importar el catálogo de libros desde CSV o JSONL.
+Uso: python manage.py import_libros catalogo.csv --lote 2000
+     cat catalogo.jsonl | python manage.py import_libros - --formato jsonl
+"""
+import csv
+import json
+import re
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from books.autores import asignar_autores
+from books.cache import invalidar_libros
+from books.models import Libro
+from books.serializers import LibroSerializer
+
+CAMPOS_ACTUALIZABLES = ['titulo', 'autor', 'autor_normalizado', 'ano_publicacion', 'stock', 'actualizado']
+
+
+class Command(BaseCommand):
+    help = (
+        'Importa libros desde un archivo CSV o JSONL (o la entrada estándar con "-"). '
+        'Las filas con "id" actualizan el libro existente; el resto se insertan.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del archivo, o "-" para leer de la entrada estándar.')
+        parser.add_argument('--formato', choices=['csv', 'jsonl'],
+                            help='Formato de entrada (por defecto, según la extensión del archivo).')
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Filas por cada INSERT ... ON CONFLICT.')
+        parser.add_argument('--desde-linea', type=int, default=0,
+                            help='Omite las primeras N filas de datos (para reanudar una importación).')
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or self.inferir_formato(options['archivo'])
+        archivo = sys.stdin if options['archivo'] == '-' else open(options['archivo'], encoding='utf-8', newline='')
+        inicio = time.perf_counter()
+        procesadas = importadas = errores = 0
+        linea = options['desde_linea']
+        try:
+            filas = islice(self.leer_filas(archivo, formato), options['desde_linea'], None)
+            while lote := list(islice(filas, options['lote'])):
+                validos = []
+                for fila in lote:
+                    linea += 1
+                    libro = self.validar(fila, linea)
+                    if libro is None:
+                        errores += 1
+                    else:
+                        validos.append(libro)
+                self.guardar(validos)
+                procesadas += len(lote)
+                importadas += len(validos)
+                # La última línea confirmada permite reanudar con --desde-linea tras un fallo.
+                self.stderr.write(f'Línea {linea} confirmada ({importadas} libros importados).')
+        finally:
+            if archivo is not sys.stdin:
+                archivo.close()
+
+        duracion = time.perf_counter() - inicio
+        ritmo = procesadas / duracion if duracion else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'{importadas} libros importados, {errores} filas con errores, '
+            f'{procesadas} filas en {duracion:.1f}s ({ritmo:.0f} filas/s).'
+        ))
+
+    def inferir_formato(self, archivo: str) -> str:
+        """
+        Deduce el formato a partir de la extensión del archivo.
+        """
+        if archivo.endswith('.jsonl'):
+            return 'jsonl'
+        if archivo.endswith('.csv'):
+            return 'csv'
+        raise CommandError('No se puede deducir el formato; indica --formato csv o --formato jsonl.')
+
+    def leer_filas(self, archivo, formato: str):
+        """
+        Genera los diccionarios de cada fila sin cargar el archivo completo en memoria.
+        """
+        if formato == 'csv':
+            yield from csv.DictReader(archivo)
+        else:
+            for texto in archivo:
+                if texto.strip():
+                    yield json.loads(texto)
+
+    def validar(self, fila: dict, linea: int) -> Libro | None:
+        """
+        Valida la fila con las reglas de `LibroSerializer` y devuelve el libro a guardar.
+        """
+        serializer = LibroSerializer(data=fila)
+        if not serializer.is_valid():
+            self.stderr.write(self.style.ERROR(f'Línea {linea}: {dict(serializer.errors)}'))
+            return None
+        try:
+            pk = self.leer_id(fila.get('id'))
+        except ValueError:
+            self.stderr.write(self.style.ERROR(f"Línea {linea}: {{'id': ['Debe ser un entero positivo.']}}"))
+            return None
+        return Libro(pk=pk, **serializer.validated_data)
+
+    def leer_id(self, valor) -> int | None:
+        """
+        Devuelve el id de la fila, o None si no tiene. Solo admite enteros positivos
+        (un número de JSON sin decimales o un texto de solo dígitos): cualquier otro
+        valor, como "12.7" o 12.0, lanza ValueError en lugar de truncarse a otro libro.
+        """
+        if valor is None or valor == '':
+            return None
+        if isinstance(valor, str) and re.fullmatch(r'\s*[0-9]+\s*', valor):
+            valor = int(valor)
+        # type() y no isinstance(): True también es un int.
+        if type(valor) is not int or valor < 1:
+            raise ValueError(f'Id no válido: {valor!r}')
+        return valor
+
+    @transaction.atomic
+    def guardar(self, libros: list[Libro]) -> None:
+        """
+        Inserta o actualiza (por id) los libros del lote en la misma transacción.
+        Los autores del lote se resuelven (o crean) de una vez antes de insertar.
+        Tras los libros con id explícito se ajusta la secuencia de ids, de modo que
+        los libros sin id (de este lote o de los siguientes) no choquen con ellos
+        aunque la importación se interrumpa más adelante.
+        """
+        asignar_autores(libros)
+        con_id = [libro for libro in libros if libro.pk is not None]
+        sin_id = [libro for libro in libros if libro.pk is None]
+        if con_id:
+            Libro.objects.bulk_create(
+                con_id,
+                update_conflicts=True,
+                unique_fields=['id'],
+                update_fields=CAMPOS_ACTUALIZABLES,
+            )
+            self.reiniciar_secuencia()
+        if sin_id:
+            Libro.objects.bulk_create(sin_id)
+        # bulk_create no emite señales: se invalida la caché de forma explícita.
+        transaction.on_commit(lambda: invalidar_libros([libro.pk for libro in con_id]))
+
+    def reiniciar_secuencia(self) -> None:
+        """
+        Ajusta la secuencia de ids tras insertar libros con id explícito.
+        """
+        sentencias = connection.ops.sequence_reset_sql(no_style(), [Libro])
+        if sentencias:
+            with connection.cursor() as cursor:
+                for sentencia in sentencias:
+                    cursor.execute(sentencia)
@@ -0,0 +1,23 @@
+"""
+Comando de gestión para recalcular los contadores de préstamos desnormalizados.
+Uso: python manage.py reconciliar_contadores --lote 1000
+Pensado para ejecutarse periódicamente o tras modificar préstamos a mano.
+"""
+from django.core.management.base import BaseCommand
+
+from books.contadores import reconciliar_libros, reconciliar_usuarios
+
+
+class Command(BaseCommand):
+    help = 'Recalcula los contadores de préstamos de libros y usuarios y corrige los desviados.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Filas recalculadas por transacción.')
+
+    def handle(self, *args, **options):
+        libros = reconciliar_libros(options['lote'])
+        usuarios = reconciliar_usuarios(options['lote'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Contadores corregidos: {libros} libros y {usuarios} usuarios.'
+        ))
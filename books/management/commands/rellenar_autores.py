@@ -0,0 +1,25 @@
+"""
+Comando de gestión para asignar el autor normalizado a los libros que no lo tienen.
+Uso: python manage.py rellenar_autores --lote 1000
+La migración 0013 rellena los libros existentes; este comando completa los que
+hayan creado, durante el despliegue, las instancias que aún ejecutaban el código anterior.
+"""
+from django.core.management.base import BaseCommand
+
+from books.autores import rellenar_autores
+from books.cache import invalidar_catalogo
+
+
+class Command(BaseCommand):
+    help = 'Asigna por lotes el autor normalizado a los libros que aún no lo tienen.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Libros actualizados por transacción.')
+
+    def handle(self, *args, **options):
+        actualizados = rellenar_autores(options['lote'])
+        if actualizados:
+            # Las actualizaciones por lotes no emiten señales.
+            invalidar_catalogo()
+        self.stdout.write(self.style.SUCCESS(f'{actualizados} libros con su autor asignado.'))
@@ -0,0 +1,46 @@
+"""
+Comando de gestión que simula una réplica con retraso para probar el enrutado en local.
+Uso: python manage.py simular_replica --retraso 2
+Con DATABASE_URL=sqlite:///db.sqlite3 y DATABASE_REPLICA_URLS=sqlite:///replica.sqlite3,
+copia la base de datos principal sobre la réplica cada `--retraso` segundos, de modo
+que la réplica muestra siempre los datos de hace hasta `--retraso` segundos, como
+una réplica real que va por detrás. Con `--una-vez` hace una sola copia y termina.
+Para PostgreSQL, el equivalente es una réplica en streaming con `recovery_min_apply_delay`.
+"""
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = 'Copia periódicamente la base de datos SQLite principal sobre sus réplicas para simular su retraso.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retraso', type=float, default=2.0,
+                            help='Segundos entre copias (retraso máximo de la réplica).')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Hace una sola copia y termina.')
+
+    def handle(self, *args, **options):
+        alias = [DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS]
+        if len(alias) == 1:
+            raise CommandError('No hay réplicas configuradas; define DATABASE_REPLICA_URLS.')
+        if any(connections[nombre].vendor != 'sqlite' for nombre in alias):
+            raise CommandError('La simulación solo admite bases de datos SQLite.')
+        principal, *replicas = [connections[nombre].settings_dict['NAME'] for nombre in alias]
+
+        while True:
+            inicio = time.perf_counter()
+            with closing(sqlite3.connect(principal)) as origen:
+                for replica in replicas:
+                    # La API de copia de SQLite produce una instantánea coherente aunque haya escrituras.
+                    with closing(sqlite3.connect(replica)) as destino:
+                        origen.backup(destino)
+            self.stdout.write(f'Réplicas actualizadas en {(time.perf_counter() - inicio) * 1000:.0f} ms.')
+            if options['una_vez']:
+                return
+            time.sleep(options['retraso'])
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:57
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.utils import timezone
+
+
+def cerrar_prestamos_duplicados(apps, schema_editor):
+    """
+    Deja un solo préstamo activo por (usuario, libro) antes de crear la restricción
+    única: la carrera que esta migración corrige pudo duplicar préstamos. Se conserva
+    el más reciente; los demás se cierran y su ejemplar vuelve al stock del libro.
+    """
+    Prestamo = apps.get_model('books', 'Prestamo')
+    Libro = apps.get_model('books', 'Libro')
+    alias = schema_editor.connection.alias
+    activos = Prestamo.objects.using(alias).filter(activo=True)
+    duplicados = (
+        activos.values('usuario_id', 'libro_id').order_by()
+        .annotate(total=Count('id')).filter(total__gt=1)
+    )
+    ahora = timezone.now()
+    for grupo in duplicados:
+        ids = list(
+            activos.filter(usuario_id=grupo['usuario_id'], libro_id=grupo['libro_id'])
+            .order_by('-fecha_prestamo', '-id').values_list('id', flat=True)
+        )
+        sobrantes = ids[1:]
+        Prestamo.objects.using(alias).filter(pk__in=sobrantes).update(activo=False, fecha_devolucion=ahora)
+        Libro.objects.using(alias).filter(pk=grupo['libro_id']).update(stock=F('stock') + len(sobrantes))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0002_alter_prestamo_unique_together'),
+    ]
+
+    operations = [
+        migrations.RunPython(cerrar_prestamos_duplicados, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='prestamo',
+            constraint=models.UniqueConstraint(condition=models.Q(('activo', True)), fields=('usuario', 'libro'), name='prestamo_activo_unico'),
+        ),
+    ]
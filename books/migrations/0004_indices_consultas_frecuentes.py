@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 11:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0003_prestamo_activo_unico'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['id'], name='libro_en_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['usuario', '-fecha_prestamo'], name='prestamo_usuario_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:00
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# Trigger que mantiene 'busqueda' al insertar o modificar el título o el autor.
+# El título pesa más ('A') que el autor ('B') al calcular el ranking.
+CREAR_BUSQUEDA_SQL = """
+CREATE OR REPLACE FUNCTION books_libro_busqueda_trigger() RETURNS trigger AS $$
+BEGIN
+    NEW.busqueda :=
+        setweight(to_tsvector('spanish', coalesce(NEW.titulo, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(NEW.autor, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER books_libro_busqueda_actualizar
+    BEFORE INSERT OR UPDATE OF titulo, autor ON books_libro
+    FOR EACH ROW EXECUTE FUNCTION books_libro_busqueda_trigger();
+
+UPDATE books_libro SET titulo = titulo;
+
+CREATE INDEX libro_busqueda_gin_idx ON books_libro USING gin (busqueda);
+CREATE INDEX libro_titulo_trgm_idx ON books_libro USING gin (titulo gin_trgm_ops);
+CREATE INDEX libro_autor_trgm_idx ON books_libro USING gin (autor gin_trgm_ops);
+"""
+
+ELIMINAR_BUSQUEDA_SQL = """
+DROP INDEX IF EXISTS libro_autor_trgm_idx;
+DROP INDEX IF EXISTS libro_titulo_trgm_idx;
+DROP INDEX IF EXISTS libro_busqueda_gin_idx;
+DROP TRIGGER IF EXISTS books_libro_busqueda_actualizar ON books_libro;
+DROP FUNCTION IF EXISTS books_libro_busqueda_trigger();
+"""
+
+
+def crear_busqueda(apps, schema_editor):
+    """
+    Crea el trigger y los índices GIN de búsqueda (solo en PostgreSQL).
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREAR_BUSQUEDA_SQL)
+
+
+def eliminar_busqueda(apps, schema_editor):
+    """
+    Revierte `crear_busqueda`.
+    """
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(ELIMINAR_BUSQUEDA_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_indices_paginacion_catalogo'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='libro',
+            name='busqueda',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(crear_busqueda, eliminar_busqueda),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0006_busqueda_libros'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+    ]
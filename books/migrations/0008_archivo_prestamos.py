@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_libro_actualizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PrestamoArchivado',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha_prestamo', models.DateTimeField()),
+                ('fecha_devolucion', models.DateTimeField(blank=True, null=True)),
+                ('activo', models.BooleanField(default=False)),
+                ('archivado', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'préstamo archivado',
+                'verbose_name_plural': 'préstamos archivados',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(condition=models.Q(('activo', False)), fields=['fecha_devolucion', 'id'], name='prestamo_devuelto_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='prestamoarchivado',
+            name='libro',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='books.libro'),
+        ),
+        migrations.AddField(
+            model_name='prestamoarchivado',
+            name='usuario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='prestamoarchivado',
+            index=models.Index(fields=['usuario', '-fecha_prestamo'], name='archivado_usuario_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:07
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def rellenar_contadores(apps, schema_editor):
+    """
+    Calcula los contadores iniciales a partir del historial con un UPDATE por tabla.
+    """
+    Libro = apps.get_model('books', 'Libro')
+    Usuario = apps.get_model('books', 'Usuario')
+    Prestamo = apps.get_model('books', 'Prestamo')
+    PrestamoArchivado = apps.get_model('books', 'PrestamoArchivado')
+
+    def conteo(modelo, campo, **filtros):
+        subconsulta = (
+            modelo.objects.filter(**{campo: OuterRef('pk')}, **filtros)
+            .order_by().values(campo).annotate(n=Count('id')).values('n')
+        )
+        return Coalesce(Subquery(subconsulta), 0)
+
+    Libro.objects.update(
+        prestamos_activos=conteo(Prestamo, 'libro', activo=True),
+        total_prestamos=conteo(Prestamo, 'libro') + conteo(PrestamoArchivado, 'libro'),
+    )
+    Usuario.objects.update(prestamos_activos=conteo(Prestamo, 'usuario', activo=True))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('books', '0008_archivo_prestamos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='prestamos_activos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='total_prestamos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='usuario',
+            name='prestamos_activos',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(rellenar_contadores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['-total_prestamos', 'id'], name='libro_total_prestamos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['-prestamos_activos', 'id'], name='libro_activos_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(fields=['-prestamos_activos', 'id'], name='usuario_activos_idx'),
+        ),
+    ]
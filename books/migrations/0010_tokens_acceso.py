@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_contadores_prestamos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenAcceso',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resumen', models.CharField(editable=False, max_length=64, unique=True)),
+                ('prefijo', models.CharField(editable=False, max_length=8)),
+                ('nombre', models.CharField(blank=True, max_length=100)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('expira', models.DateTimeField()),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'token de acceso',
+                'verbose_name_plural': 'tokens de acceso',
+            },
+        ),
+    ]
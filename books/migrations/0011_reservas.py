@@ -0,0 +1,30 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_tokens_acceso'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('atendida', models.DateTimeField(blank=True, null=True)),
+                ('activa', models.BooleanField(default=True)),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='books.libro')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('activa', True)), fields=['libro', 'creada', 'id'], name='reserva_cola_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('activa', True)), fields=('usuario', 'libro'), name='reserva_activa_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_reservas'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prestamo',
+            index=models.Index(fields=['fecha_prestamo', 'id'], name='prestamo_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='prestamoarchivado',
+            index=models.Index(fields=['fecha_prestamo', 'id'], name='archivado_fecha_idx'),
+        ),
+    ]
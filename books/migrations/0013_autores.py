@@ -0,0 +1,126 @@
+# Generated by Django 5.2.4 on 2026-10-18 12:45
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.utils import timezone
+
+INDICE_AUTOR = models.Index(fields=['autor_normalizado', 'id'], name='libro_autor_normalizado_idx')
+TAMANO_LOTE = 1000
+
+
+def normalizar_autor(nombre):
+    """
+    Copia de `books.models.normalizar_autor` en el momento de esta migración.
+    """
+    sin_tildes = ''.join(
+        caracter for caracter in unicodedata.normalize('NFKD', nombre)
+        if not unicodedata.combining(caracter)
+    )
+    return ' '.join(re.sub(r'[^\w]+', ' ', sin_tildes.casefold()).split())
+
+
+def rellenar(apps, schema_editor):
+    """
+    Asigna su autor a los libros existentes por lotes de `TAMANO_LOTE` libros
+    por orden de id, creando los autores que falten. Cada lote es una transacción
+    corta que solo bloquea sus filas, así que el catálogo admite escrituras mientras tanto.
+    """
+    Libro = apps.get_model('books', 'Libro')
+    Autor = apps.get_model('books', 'Autor')
+    alias = schema_editor.connection.alias
+    ultimo = 0
+    while True:
+        with transaction.atomic(using=alias):
+            libros = list(
+                Libro.objects.using(alias).select_for_update()
+                .filter(pk__gt=ultimo, autor_normalizado__isnull=True)
+                .order_by('pk').only('id', 'autor')[:TAMANO_LOTE]
+            )
+            if not libros:
+                return
+            ultimo = libros[-1].pk
+            pendientes = {}
+            for libro in libros:
+                clave = normalizar_autor(libro.autor)
+                if clave:
+                    pendientes.setdefault(clave, libro.autor.strip())
+            autores = Autor.objects.using(alias)
+            existentes = set(autores.filter(clave__in=pendientes).values_list('clave', flat=True))
+            autores.bulk_create(
+                [Autor(nombre=nombre, clave=clave) for clave, nombre in pendientes.items() if clave not in existentes],
+                ignore_conflicts=True,
+            )
+            por_clave = {autor.clave: autor for autor in autores.filter(clave__in=pendientes)}
+
+            asignados, renombrados, ahora = [], [], timezone.now()
+            for libro in libros:
+                autor = por_clave.get(normalizar_autor(libro.autor))
+                if autor is None:
+                    continue
+                libro.autor_normalizado = autor
+                asignados.append(libro)
+                # Los libros cuyo nombre cambia a la grafía del autor se marcan como
+                # modificados para invalidar sus tarjetas y validadores HTTP.
+                if libro.autor != autor.nombre:
+                    libro.autor, libro.actualizado = autor.nombre, ahora
+                    renombrados.append(libro)
+            Libro.objects.using(alias).bulk_update(asignados, ['autor_normalizado'])
+            if renombrados:
+                Libro.objects.using(alias).bulk_update(renombrados, ['autor', 'actualizado'])
+
+
+def crear_indice(apps, schema_editor):
+    """
+    Crea el índice por autor tras el relleno. En PostgreSQL se crea con
+    CONCURRENTLY para no bloquear las escrituras en la tabla de libros.
+    """
+    libro = apps.get_model('books', 'Libro')
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.add_index(libro, INDICE_AUTOR, concurrently=True)
+    else:
+        schema_editor.add_index(libro, INDICE_AUTOR)
+
+
+def eliminar_indice(apps, schema_editor):
+    """
+    Revierte `crear_indice`.
+    """
+    schema_editor.remove_index(apps.get_model('books', 'Libro'), INDICE_AUTOR)
+
+
+class Migration(migrations.Migration):
+    # Sin transacción global: cada lote del relleno se confirma por separado y
+    # CREATE INDEX CONCURRENTLY no puede ejecutarse dentro de una transacción.
+    atomic = False
+
+    dependencies = [
+        ('books', '0012_indices_admin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Autor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(max_length=100)),
+                ('clave', models.CharField(editable=False, max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name_plural': 'autores',
+                'ordering': ['nombre'],
+            },
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='autor_normalizado',
+            field=models.ForeignKey(blank=True, db_index=False, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='libros', to='books.autor'),
+        ),
+        migrations.RunPython(rellenar, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(crear_indice, eliminar_indice)],
+            state_operations=[migrations.AddIndex(model_name='libro', index=INDICE_AUTOR)],
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.4 on 2026-10-18 18:20
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Elimina 'libro_en_stock_idx', un índice parcial sobre (id) que el catálogo no
+    usa: sus páginas se ordenan por título, autor o año y se leen con los índices
+    (columna, id) de la migración 0005, descartando al recorrerlos los libros sin stock.
+    """
+
+    dependencies = [
+        ('books', '0013_autores'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='libro',
+            name='libro_en_stock_idx',
+        ),
+    ]
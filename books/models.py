@@ -1,5 +1,9 @@
+import re
+import unicodedata
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 
 class Usuario(AbstractUser):
     """
@@ -11,6 +15,13 @@ class Usuario(AbstractUser):
         ('admin', 'Administrador'),
     ]
     rol = models.CharField(max_length=10, choices=ROLES, default='regular')
+    # Contador mantenido por el servicio de préstamos (ver `books.contadores`).
+    prestamos_activos = models.IntegerField(default=0)
+    
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(fields=['-prestamos_activos', 'id'], name='usuario_activos_idx'),
+        ]
     
     def get_rol_display(self) -> str:
         """
@@ -24,17 +35,81 @@ class Usuario(AbstractUser):
         """
         return self.username
 
+def normalizar_autor(nombre: str) -> str:
+    """
+    Clave de un autor: sin tildes, en minúsculas y sin signos de puntuación ni
+    espacios repetidos, de modo que "J.R.R. Tolkien" y "j. r. r. tolkien" coinciden.
+    """
+    sin_tildes = ''.join(
+        caracter for caracter in unicodedata.normalize('NFKD', nombre)
+        if not unicodedata.combining(caracter)
+    )
+    return ' '.join(re.sub(r'[^\w]+', ' ', sin_tildes.casefold()).split())
+
+class Autor(models.Model):
+    """
+    Autor de libros, identificado por su nombre normalizado (`clave`).
+    El nombre es la grafía con la que se muestra y se copia en `Libro.autor`; la
+    clave se fija al crearlo, así que corregir la grafía no separa sus libros.
+    """
+    nombre = models.CharField(max_length=100)
+    clave = models.CharField(max_length=100, unique=True, editable=False)
+    
+    class Meta:
+        verbose_name_plural = 'autores'
+        ordering = ['nombre']
+    
+    def save(self, *args, **kwargs):
+        if not self.clave:
+            self.clave = normalizar_autor(self.nombre)
+        super().save(*args, **kwargs)
+    
+    def __str__(self) -> str:
+        return self.nombre
+
 class Libro(models.Model):
     """
     Modelo para representar un libro en la biblioteca.
     """
     titulo = models.CharField(max_length=200)
+    # Nombre del autor tal y como se muestra: copia de `Autor.nombre`, que se asigna
+    # al guardar (ver `books.autores`). Se conserva en el libro para la búsqueda de
+    # texto completo y para ordenar el catálogo por autor con un índice.
     autor = models.CharField(max_length=100)
+    # Autor normalizado: los filtros y las facetas por autor usan esta clave entera.
+    # Admite NULL para rellenarla por lotes sin bloquear la tabla (migración 0013).
+    autor_normalizado = models.ForeignKey(
+        Autor, on_delete=models.PROTECT, related_name='libros',
+        null=True, blank=True, editable=False, db_index=False,
+    )
     ano_publicacion = models.IntegerField() 
     stock = models.IntegerField(default=0)
+    # Fecha de la última modificación (incluidos los cambios de stock). Sirve como
+    # validador HTTP (ETag/Last-Modified) del libro y, con su máximo, del catálogo.
+    actualizado = models.DateTimeField(auto_now=True, db_index=True)
+    # Contadores mantenidos por el servicio de préstamos (ver `books.contadores`).
+    total_prestamos = models.IntegerField(default=0)
+    prestamos_activos = models.IntegerField(default=0)
+    # Vector de búsqueda de texto completo (título y autor). En PostgreSQL lo mantiene
+    # un trigger de la base de datos; en otros motores queda vacío y no se utiliza.
+    busqueda = SearchVectorField(null=True, editable=False)
     # Relación muchos a muchos con Usuario a través del modelo Prestamo
     usuarios_prestamo = models.ManyToManyField(Usuario, through='Prestamo', blank=True)
     
+    class Meta:
+        indexes = [
+            # Índices para la paginación por cursor: (columna de orden, id). El catálogo
+            # público los recorre en orden y descarta los libros sin stock.
+            models.Index(fields=['titulo', 'id'], name='libro_titulo_id_idx'),
+            models.Index(fields=['autor', 'id'], name='libro_autor_id_idx'),
+            # Libros de un autor (filtro y faceta por autor).
+            models.Index(fields=['autor_normalizado', 'id'], name='libro_autor_normalizado_idx'),
+            models.Index(fields=['ano_publicacion', 'id'], name='libro_ano_id_idx'),
+            # Rankings de estadísticas (más prestados y más en uso).
+            models.Index(fields=['-total_prestamos', 'id'], name='libro_total_prestamos_idx'),
+            models.Index(fields=['-prestamos_activos', 'id'], name='libro_activos_idx'),
+        ]
+    
     def __str__(self) -> str:
         """
         Representación en cadena del objeto Libro.
@@ -55,4 +130,99 @@ class Prestamo(models.Model):
     class Meta:
         # No se define unique_together para permitir múltiples registros de préstamo
         # para el mismo usuario y libro a lo largo del tiempo, facilitando el historial.
-        pass
+        # En su lugar, una restricción única parcial garantiza a nivel de base de datos
+        # que un usuario no tenga dos préstamos activos del mismo libro.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['usuario', 'libro'],
+                condition=models.Q(activo=True),
+                name='prestamo_activo_unico',
+            ),
+        ]
+        indexes = [
+            # Historial de un usuario ordenado del préstamo más reciente al más antiguo (Mis Libros).
+            # Los préstamos activos por (usuario, libro) usan el índice parcial de 'prestamo_activo_unico'.
+            models.Index(fields=['usuario', '-fecha_prestamo'], name='prestamo_usuario_fecha_idx'),
+            # Listado del admin: orden por fecha y navegación por años, meses y días (date_hierarchy).
+            models.Index(fields=['fecha_prestamo', 'id'], name='prestamo_fecha_idx'),
+            # Préstamos devueltos por antigüedad, para moverlos al archivo por lotes.
+            models.Index(
+                fields=['fecha_devolucion', 'id'],
+                condition=models.Q(activo=False),
+                name='prestamo_devuelto_fecha_idx',
+            ),
+        ]
+
+class Reserva(models.Model):
+    """
+    Reserva de un libro sin stock. Las reservas activas de un libro forman una
+    cola FIFO (por fecha de creación e id): al devolver un ejemplar, la primera
+    se convierte en un préstamo en la misma transacción (ver `services.devolver_libro`).
+    """
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='reservas')
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='reservas')
+    creada = models.DateTimeField(auto_now_add=True)
+    atendida = models.DateTimeField(null=True, blank=True) # Momento en que se convirtió en préstamo
+    activa = models.BooleanField(default=True) # True mientras la reserva espera en la cola
+    
+    class Meta:
+        constraints = [
+            # Un usuario solo puede tener una reserva en espera por libro.
+            models.UniqueConstraint(
+                fields=['usuario', 'libro'],
+                condition=models.Q(activa=True),
+                name='reserva_activa_unica',
+            ),
+        ]
+        indexes = [
+            # Cola de cada libro: la primera reserva y la posición de una reserva
+            # se leen recorriendo este índice parcial.
+            models.Index(fields=['libro', 'creada', 'id'], condition=models.Q(activa=True), name='reserva_cola_idx'),
+        ]
+    
+    def __str__(self) -> str:
+        return f'{self.usuario} → {self.libro}'
+
+class PrestamoArchivado(models.Model):
+    """
+    Préstamo devuelto movido fuera de la tabla de préstamos por antigüedad.
+    Conserva el id y los datos del préstamo original para que el historial del
+    usuario pueda leerse igual desde ambas tablas (ver `books.archivo`).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE)
+    fecha_prestamo = models.DateTimeField()
+    fecha_devolucion = models.DateTimeField(null=True, blank=True)
+    activo = models.BooleanField(default=False) # Siempre False: solo se archivan préstamos devueltos
+    archivado = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name = 'préstamo archivado'
+        verbose_name_plural = 'préstamos archivados'
+        indexes = [
+            models.Index(fields=['usuario', '-fecha_prestamo'], name='archivado_usuario_fecha_idx'),
+            models.Index(fields=['fecha_prestamo', 'id'], name='archivado_fecha_idx'),
+        ]
+
+class TokenAcceso(models.Model):
+    """
+    Token de acceso a la API de un usuario.
+    Solo se guarda el resumen SHA-256 del token: el valor en claro se muestra una
+    única vez al emitirlo. Al ser un valor aleatorio de alta entropía, un resumen
+    rápido basta para protegerlo (a diferencia de una contraseña), y verificarlo
+    es una búsqueda por un índice único (ver `books.tokens`).
+    """
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='tokens')
+    resumen = models.CharField(max_length=64, unique=True, editable=False)
+    prefijo = models.CharField(max_length=8, editable=False) # Primeros caracteres del token, para identificarlo
+    nombre = models.CharField(max_length=100, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    expira = models.DateTimeField()
+    
+    class Meta:
+        verbose_name = 'token de acceso'
+        verbose_name_plural = 'tokens de acceso'
+    
+    def __str__(self) -> str:
+        return f'{self.prefijo}… ({self.usuario})'
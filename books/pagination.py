@@ -0,0 +1,229 @@
+"""
+Paginación por cursor (keyset) para el catálogo de libros.
+Cada página se obtiene filtrando a partir de la última fila vista según
+(columna de orden, id), de modo que nunca se usa OFFSET ni COUNT(*) y el coste
+de una página no depende de su posición dentro del catálogo. Los resultados de una
+búsqueda se paginan igual, por (relevancia, id).
+"""
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Columnas por las que se puede ordenar el catálogo (cada una tiene un índice (columna, id))
+# y tipo de sus valores en los cursores.
+TIPOS_ORDEN = {'titulo': str, 'autor': str, 'ano_publicacion': int}
+ORDENES_PERMITIDOS = tuple(TIPOS_ORDEN)
+ORDEN_POR_DEFECTO = 'titulo'
+# Orden de los resultados de una búsqueda: la anotación `rango` de `books.search`.
+ORDEN_RANKING = '-rango'
+# El historial de préstamos (ver `books.archivo`) guarda la fecha en formato ISO.
+TIPOS_CURSOR = {**TIPOS_ORDEN, 'rango': (int, float), 'fecha_prestamo': str}
+
+
+class CursorInvalido(ValueError):
+    """
+    El cursor recibido no se pudo decodificar o no corresponde al ordenamiento pedido.
+    """
+
+
+@dataclass
+class PaginaKeyset:
+    """
+    Resultado de paginar un queryset: filas de la página y cursores vecinos.
+    """
+    objetos: list
+    siguiente: str | None
+    anterior: str | None
+
+
+def normalizar_orden(orden: str | None) -> str:
+    """
+    Devuelve `orden` si es un ordenamiento permitido (admite prefijo '-'),
+    o el ordenamiento por defecto en caso contrario.
+    """
+    if orden and orden.lstrip('-') in ORDENES_PERMITIDOS:
+        return orden
+    return ORDEN_POR_DEFECTO
+
+
+def codificar_cursor(orden: str, valor, pk: int, retroceder: bool = False) -> str:
+    """
+    Codifica el ordenamiento, la posición (valor, pk) y la dirección de avance
+    en un cursor opaco.
+    """
+    datos = json.dumps([orden, valor, pk, retroceder], separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor: str, orden: str) -> tuple:
+    """
+    Decodifica un cursor generado por `codificar_cursor` para el ordenamiento
+    `orden`. Un cursor de otro ordenamiento (p. ej. al cambiar `ordering`
+    conservando `cursor`) o con un valor de otro tipo que la columna es inválido.
+    """
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        orden_cursor, valor, pk, retroceder = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+    except (binascii.Error, ValueError, TypeError):
+        raise CursorInvalido(cursor)
+    tipo = TIPOS_CURSOR[orden.lstrip('-')]
+    # `bool` es subclase de `int`, pero no es un año válido.
+    if (orden_cursor != orden or not isinstance(valor, tipo) or isinstance(valor, bool)
+            or not isinstance(pk, int) or isinstance(pk, bool) or not isinstance(retroceder, bool)):
+        raise CursorInvalido(cursor)
+    return valor, pk, retroceder
+
+
+def valor_de(fila, campo: str):
+    """
+    Valor de `campo` en una fila, ya sea una instancia o un diccionario de `values()`.
+    """
+    return fila[campo] if isinstance(fila, dict) else getattr(fila, campo)
+
+
+def paginar(queryset: QuerySet, orden: str, cursor: str | None, tamano: int) -> PaginaKeyset:
+    """
+    Devuelve la página de `tamano` filas de `queryset` que sigue (o precede) a `cursor`
+    según `orden`. Solo se lee una fila adicional para saber si hay más páginas.
+    Con un queryset de `values()`, las filas deben incluir la columna de orden y el id.
+    """
+    return _paginar(queryset, normalizar_orden(orden), cursor, tamano)
+
+
+def paginar_ranking(queryset: QuerySet, cursor: str | None, tamano: int) -> PaginaKeyset:
+    """
+    Como `paginar`, para un queryset de `books.search.buscar_libros`: las páginas
+    siguen el orden de relevancia y el cursor guarda el rango de la última fila.
+    El rango no está indexado, así que cada página vuelve a calcularlo sobre las
+    coincidencias, pero solo se leen `tamano` + 1 filas.
+    """
+    return _paginar(queryset, ORDEN_RANKING, cursor, tamano)
+
+
+def _paginar(queryset: QuerySet, orden: str, cursor: str | None, tamano: int) -> PaginaKeyset:
+    campo = orden.lstrip('-')
+    descendente = orden.startswith('-')
+    retroceder = False
+
+    if cursor:
+        valor, pk, retroceder = decodificar_cursor(cursor, orden)
+        # Se recorre en sentido inverso al pedir la página anterior.
+        hacia_mayores = descendente == retroceder
+        mayor, mayor_igual = ('gt', 'gte') if hacia_mayores else ('lt', 'lte')
+        # La primera condición acota el rango sobre el índice (campo, id); la segunda
+        # desempata las filas con el mismo valor de la columna de orden.
+        queryset = queryset.filter(
+            Q(**{f'{campo}__{mayor_igual}': valor}),
+            Q(**{f'{campo}__{mayor}': valor}) | Q(**{f'id__{mayor}': pk}),
+        )
+
+    invertido = descendente != retroceder
+    prefijo = '-' if invertido else ''
+    filas = list(queryset.order_by(f'{prefijo}{campo}', f'{prefijo}id')[:tamano + 1])
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+
+    if retroceder:
+        filas.reverse()
+        hay_siguiente, hay_anterior = True, hay_mas
+    else:
+        hay_siguiente, hay_anterior = hay_mas, cursor is not None
+
+    siguiente = anterior = None
+    if filas and hay_siguiente:
+        siguiente = codificar_cursor(orden, valor_de(filas[-1], campo), valor_de(filas[-1], 'id'))
+    if filas and hay_anterior:
+        anterior = codificar_cursor(
+            orden, valor_de(filas[0], campo), valor_de(filas[0], 'id'), retroceder=True
+        )
+    return PaginaKeyset(objetos=filas, siguiente=siguiente, anterior=anterior)
+
+
+class LibroKeysetPagination(BasePagination):
+    """
+    Paginación por cursor para la API de libros.
+    Parámetros: `ordering` (titulo, autor, ano_publicacion, con '-' opcional),
+    `cursor` y `page_size`. Con `q` (búsqueda) los resultados se ordenan por
+    relevancia y `ordering` se ignora.
+    """
+    page_size = 20
+    max_page_size = 100
+    ordering_query_param = 'ordering'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    search_query_param = 'q'
+
+    def get_page_size(self, request) -> int:
+        """
+        Devuelve el tamaño de página solicitado, limitado a `max_page_size`.
+        """
+        try:
+            tamano = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(tamano, 1), self.max_page_size)
+
+    def get_ordering(self, request) -> str:
+        """
+        Devuelve el ordenamiento de la página: por relevancia si se busca y, si no,
+        el indicado en `ordering`. Sus filas deben incluir la columna de orden.
+        """
+        if request.query_params.get(self.search_query_param, '').strip():
+            return ORDEN_RANKING
+        return normalizar_orden(request.query_params.get(self.ordering_query_param))
+
+    def paginate_queryset(self, queryset, request, view=None) -> list:
+        """
+        Devuelve las filas de la página solicitada.
+        """
+        self.request = request
+        orden = self.get_ordering(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        try:
+            if orden == ORDEN_RANKING:
+                self.pagina = paginar_ranking(queryset, cursor, self.get_page_size(request))
+            else:
+                self.pagina = paginar(queryset, orden, cursor, self.get_page_size(request))
+        except CursorInvalido:
+            raise ValidationError({self.cursor_query_param: ['Cursor inválido.']})
+        return self.pagina.objetos
+
+    def get_link(self, cursor: str | None) -> str | None:
+        """
+        Construye la URL absoluta de la página indicada por `cursor`.
+        """
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data) -> Response:
+        """
+        Envuelve los resultados con los enlaces a la página siguiente y anterior.
+        """
+        return Response({
+            'next': self.get_link(self.pagina.siguiente),
+            'previous': self.get_link(self.pagina.anterior),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema: dict) -> dict:
+        """
+        Describe la respuesta paginada para la generación de esquemas OpenAPI.
+        """
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
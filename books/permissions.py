@@ -27,3 +27,13 @@ class IsRegularUser(permissions.BasePermission):
         """
         # Requiere que el usuario esté autenticado y tenga el rol 'regular'.
         return request.user and request.user.is_authenticated and request.user.rol == 'regular'
+
+class IsAdminRole(permissions.BasePermission):
+    """
+    Permiso personalizado para permitir el acceso solo a usuarios autenticados con rol 'admin'.
+    """
+    def has_permission(self, request, view) -> bool:
+        """
+        Verifica si el usuario tiene permiso para realizar la acción solicitada.
+        """
+        return request.user and request.user.is_authenticated and request.user.rol == 'admin'
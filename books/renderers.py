@@ -0,0 +1,30 @@
+"""
+Renderizador JSON de la API basado en orjson.
+`JSONRenderer` de DRF codifica con `json.dumps` y un codificador escrito en Python;
+orjson produce la misma salida compacta en UTF-8 varias veces más rápido, lo que
+se nota en los listados grandes. Los tipos que orjson no conoce (fechas, Decimal,
+textos traducibles...) se delegan en el codificador de DRF, de modo que el formato
+de la respuesta no cambia.
+"""
+import orjson
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.renderers import JSONRenderer
+
+_codificador = JSONEncoder()
+
+
+class JSONRapidoRenderer(JSONRenderer):
+    """
+    `JSONRenderer` con orjson. Si el cliente pide la salida indentada
+    (`Accept: application/json; indent=4`) se usa el renderizador de DRF.
+    """
+    opciones = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        contenido = orjson.dumps(data, default=_codificador.default, option=self.opciones)
+        # Como DRF, se escapan U+2028 y U+2029, válidos en JSON pero no en JavaScript.
+        return contenido.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
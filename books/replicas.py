@@ -0,0 +1,130 @@
+"""
+Lecturas del catálogo en réplicas de solo lectura de la base de datos.
+Las vistas de lectura del catálogo (`ListarLibrosView`, `DetalleLibroView` y el GET
+de los libros en la API) llaman a `activar_replica` y, desde ese momento, sus
+consultas se dirigen a una de las réplicas de `DATABASE_REPLICAS`. El resto de
+vistas (préstamos, devoluciones, reservas, `mis-libros`, el admin...) y todas las
+escrituras usan siempre la base de datos principal.
+
+Una réplica va unos instantes por detrás de la principal. Para que un usuario vea
+sus propios cambios, `ReplicasMiddleware` fija sus lecturas a la principal durante
+`REPLICAS_FIJAR_SEGUNDOS` después de cada petición que modifica datos.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# Réplica a la que se dirigen las lecturas de la petición en curso (None: la principal).
+_replica: ContextVar[str | None] = ContextVar('replica', default=None)
+
+METODOS_SEGUROS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _clave_fijacion(pk) -> str:
+    return f'replicas:fijado:{pk}'
+
+
+def replica_actual() -> str | None:
+    """
+    Alias de la réplica que atiende las lecturas de la petición en curso, si hay una.
+    """
+    return _replica.get()
+
+
+def activar_replica(usuario) -> str | None:
+    """
+    Dirige las lecturas del resto de la petición a una réplica, salvo que no haya
+    réplicas configuradas o que `usuario` haya modificado datos hace poco.
+    Devuelve el alias elegido.
+    """
+    fijado = usuario is not None and usuario.is_authenticated and cache.get(_clave_fijacion(usuario.pk))
+    alias = random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS and not fijado else None
+    _replica.set(alias)
+    return alias
+
+
+async def aactivar_replica(usuario) -> str | None:
+    """
+    Versión asíncrona de `activar_replica` (ver `books.api_async`).
+    """
+    fijado = usuario is not None and usuario.is_authenticated and await cache.aget(_clave_fijacion(usuario.pk))
+    alias = random.choice(settings.DATABASE_REPLICAS) if settings.DATABASE_REPLICAS and not fijado else None
+    _replica.set(alias)
+    return alias
+
+
+def fijar_primaria(usuario) -> None:
+    """
+    Dirige a la principal las lecturas de `usuario` durante `REPLICAS_FIJAR_SEGUNDOS`,
+    para que vea sus cambios aunque las réplicas aún no los hayan recibido.
+    """
+    cache.set(_clave_fijacion(usuario.pk), True, timeout=settings.REPLICAS_FIJAR_SEGUNDOS)
+
+
+class ReplicaRouter:
+    """
+    Router de base de datos: las lecturas van a la réplica activada en la petición
+    en curso y todo lo demás (escrituras y migraciones) a la base de datos principal.
+    """
+    def db_for_read(self, model, **hints):
+        return _replica.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Las réplicas contienen los mismos datos que la principal.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas reciben el esquema por replicación.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicasMiddleware:
+    """
+    Limita la réplica activada a la petición que la activa y, tras cada petición
+    que modifica datos, fija a la principal las lecturas de su usuario.
+    Funciona con WSGI y con ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.asincrono = iscoroutinefunction(get_response)
+        if self.asincrono:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.asincrono:
+            return self.__acall__(request)
+        token = _replica.set(None)
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            _replica.reset(token)
+        if request.method not in METODOS_SEGUROS:
+            self.fijar(request)
+        return respuesta
+
+    async def __acall__(self, request):
+        token = _replica.set(None)
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+        if request.method not in METODOS_SEGUROS:
+            # `request.user` puede no estar resuelto aún y consultar la sesión.
+            await sync_to_async(self.fijar)(request)
+        return respuesta
+
+    def fijar(self, request) -> None:
+        # Las vistas de la API asignan a `request.user` el usuario autenticado por token.
+        usuario = getattr(request, 'user', None)
+        if usuario is not None and usuario.is_authenticated:
+            fijar_primaria(usuario)
@@ -0,0 +1,57 @@
+"""
+Búsqueda de libros por título y autor.
+En PostgreSQL combina la búsqueda de texto completo sobre `Libro.busqueda`
+(índice GIN) con similitud por trigramas para tolerar errores de escritura.
+En otros motores (p. ej. SQLite en pruebas) usa un filtro `icontains` portable.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, QuerySet, Value, When
+from django.db.models.functions import Greatest
+
+# Configuración de texto de PostgreSQL usada por el trigger de 'busqueda'.
+CONFIGURACION_TEXTO = 'spanish'
+
+
+def buscar_libros(queryset: QuerySet, texto: str) -> QuerySet:
+    """
+    Filtra `queryset` por `texto` y lo ordena por relevancia (anotación `rango`) y,
+    a igual relevancia, por id descendente, el orden que pagina `paginar_ranking`.
+    """
+    texto = texto.strip()
+    if not texto:
+        return queryset
+    if connection.vendor == 'postgresql':
+        return _buscar_postgresql(queryset, texto)
+    return _buscar_portable(queryset, texto)
+
+
+def _buscar_postgresql(queryset: QuerySet, texto: str) -> QuerySet:
+    """
+    Texto completo (`@@`) o similitud por trigramas (`%`), ambos servidos por índices GIN.
+    """
+    consulta = SearchQuery(texto, config=CONFIGURACION_TEXTO, search_type='websearch')
+    similitud = Greatest(TrigramSimilarity('titulo', texto), TrigramSimilarity('autor', texto))
+    return (
+        queryset
+        .filter(Q(busqueda=consulta) | Q(titulo__trigram_similar=texto) | Q(autor__trigram_similar=texto))
+        .annotate(rango=SearchRank(F('busqueda'), consulta) + similitud)
+        .order_by('-rango', '-id')
+    )
+
+
+def _buscar_portable(queryset: QuerySet, texto: str) -> QuerySet:
+    """
+    Cada palabra debe aparecer en el título o en el autor; las coincidencias
+    en el título completo se ordenan primero.
+    """
+    for palabra in texto.split():
+        queryset = queryset.filter(Q(titulo__icontains=palabra) | Q(autor__icontains=palabra))
+    rango = Case(
+        When(titulo__iexact=texto, then=Value(3.0)),
+        When(titulo__istartswith=texto, then=Value(2.0)),
+        When(titulo__icontains=texto, then=Value(1.0)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return queryset.annotate(rango=rango).order_by('-rango', '-id')
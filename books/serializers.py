@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Libro, Prestamo, Usuario
+from .models import Libro, Prestamo, Reserva, TokenAcceso, Usuario
+from .services import DEVOLVER, PRESTAR
 
 class LibroSerializer(serializers.ModelSerializer):
     """
@@ -23,6 +24,19 @@ class PrestamoSerializer(serializers.ModelSerializer):
         fields = ['id', 'libro', 'libro_id', 'fecha_prestamo', 'fecha_devolucion', 'activo']
         read_only_fields = ['fecha_prestamo', 'fecha_devolucion'] # Estos campos son gestionados automáticamente.
 
+class ReservaSerializer(serializers.ModelSerializer):
+    """
+    Serializador de una reserva en espera, con su posición en la cola del libro
+    (anotación `posicion` de `services.reservas_con_posicion`).
+    """
+    titulo = serializers.CharField(source='libro.titulo', read_only=True)
+    posicion = serializers.IntegerField(read_only=True)
+    
+    class Meta:
+        model = Reserva
+        fields = ['id', 'libro', 'titulo', 'creada', 'posicion']
+        read_only_fields = ['libro', 'creada']
+
 class UsuarioSerializer(serializers.ModelSerializer):
     """
     Serializador para el modelo Usuario.
@@ -31,3 +45,34 @@ class UsuarioSerializer(serializers.ModelSerializer):
     class Meta:
         model = Usuario
         fields = ['id', 'username', 'email', 'rol']
+
+class OperacionLoteSerializer(serializers.Serializer):
+    """
+    Serializador de una operación (préstamo o devolución) dentro de un lote.
+    """
+    libro_id = serializers.IntegerField()
+    accion = serializers.ChoiceField(choices=[PRESTAR, DEVOLVER])
+
+class LoteSerializer(serializers.Serializer):
+    """
+    Serializador de un lote de operaciones para el endpoint de préstamos por lote.
+    """
+    operaciones = OperacionLoteSerializer(many=True, allow_empty=False, max_length=50)
+
+class TokenAccesoSerializer(serializers.ModelSerializer):
+    """
+    Serializador de un token de acceso. Nunca incluye el token en claro.
+    """
+    class Meta:
+        model = TokenAcceso
+        fields = ['id', 'prefijo', 'nombre', 'creado', 'expira']
+
+class EmisionTokenSerializer(serializers.Serializer):
+    """
+    Serializador de la solicitud de un token. Las credenciales solo son necesarias
+    si la petición no está ya autenticada (p. ej. con una sesión).
+    """
+    username = serializers.CharField(required=False)
+    password = serializers.CharField(required=False, write_only=True, style={'input_type': 'password'})
+    nombre = serializers.CharField(required=False, allow_blank=True, max_length=100, default='')
+    dias = serializers.IntegerField(required=False, min_value=1, max_value=365)
@@ -0,0 +1,367 @@
+"""
+Servicio de préstamos y devoluciones de la aplicación 'books'.
+Centraliza la lógica usada por las vistas web y por la API para que ambas
+modifiquen el stock y los registros de préstamo de la misma forma.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, Exists, F, IntegerField, OuterRef, Q, QuerySet, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import invalidar_libro, invalidar_libros
+from .eventos import publicar_stock
+from .models import Libro, Prestamo, Reserva, Usuario
+
+
+class PrestamoError(Exception):
+    """
+    Error de negocio al prestar o devolver un libro.
+    El mensaje está pensado para mostrarse directamente al usuario.
+    """
+    mensaje = 'No se pudo completar la operación.'
+
+    def __init__(self, mensaje: str | None = None):
+        super().__init__(mensaje or self.mensaje)
+
+
+class SinStockError(PrestamoError):
+    """
+    El libro no tiene ejemplares disponibles.
+    """
+    mensaje = 'No hay stock disponible para este libro.'
+
+
+class PrestamoActivoError(PrestamoError):
+    """
+    El usuario ya tiene un préstamo activo del libro.
+    """
+    mensaje = 'Ya tienes este libro prestado. Por favor, devuélvelo antes de intentar prestarlo de nuevo.'
+
+
+class PrestamoNoEncontradoError(PrestamoError):
+    """
+    El usuario no tiene un préstamo activo del libro.
+    """
+    mensaje = 'Este libro no está prestado por ti o ya ha sido devuelto.'
+
+
+class LibroNoEncontradoError(PrestamoError):
+    """
+    El libro indicado no existe.
+    """
+    mensaje = 'El libro no existe.'
+
+
+class OperacionDuplicadaError(PrestamoError):
+    """
+    El mismo libro aparece en más de una operación de un lote.
+    """
+    mensaje = 'Este libro ya aparece en otra operación del lote.'
+
+
+class ReservaError(PrestamoError):
+    """
+    Error de negocio al reservar un libro o cancelar una reserva.
+    """
+
+
+class ReservaInnecesariaError(ReservaError):
+    """
+    El libro tiene stock: puede prestarse directamente.
+    """
+    mensaje = 'Este libro tiene ejemplares disponibles; puedes prestarlo directamente.'
+
+
+class ReservaDuplicadaError(ReservaError):
+    """
+    El usuario ya tiene una reserva en espera del libro.
+    """
+    mensaje = 'Ya tienes una reserva en espera para este libro.'
+
+
+class ReservaNoEncontradaError(ReservaError):
+    """
+    El usuario no tiene una reserva en espera del libro.
+    """
+    mensaje = 'No tienes una reserva en espera para este libro.'
+
+
+# Acciones admitidas en `procesar_lote`.
+PRESTAR = 'prestar'
+DEVOLVER = 'devolver'
+
+
+def prestar_libro(usuario: Usuario, libro: Libro) -> Prestamo:
+    """
+    Presta un ejemplar de `libro` a `usuario`.
+    El stock se descuenta con un UPDATE condicional (stock > 0), que también
+    actualiza los contadores del libro, y el préstamo se inserta en la misma
+    transacción, por lo que dos peticiones concurrentes nunca pueden dejar el
+    stock en negativo. La restricción única parcial sobre los
+    préstamos activos impide prestar dos veces el mismo libro al mismo usuario.
+    La caché del libro se invalida, y el stock nuevo se publica a los navegadores
+    que lo siguen (ver `books.eventos`), cuando la transacción se confirma.
+    """
+    try:
+        with transaction.atomic():
+            actualizados = Libro.objects.filter(pk=libro.pk, stock__gt=0).update(
+                stock=F('stock') - 1,
+                total_prestamos=F('total_prestamos') + 1,
+                prestamos_activos=F('prestamos_activos') + 1,
+                actualizado=timezone.now(),
+            )
+            if not actualizados:
+                raise SinStockError()
+            prestamo = Prestamo.objects.create(usuario=usuario, libro=libro, activo=True)
+            Usuario.objects.filter(pk=usuario.pk).update(prestamos_activos=F('prestamos_activos') + 1)
+            transaction.on_commit(lambda: invalidar_libro(libro.pk))
+            publicar_stock([libro.pk])
+    except IntegrityError:
+        # La restricción 'prestamo_activo_unico' rechazó el préstamo duplicado; la
+        # transacción ya se deshizo, incluido el descuento de stock.
+        raise PrestamoActivoError()
+    return prestamo
+
+
+def devolver_libro(usuario: Usuario, libro: Libro) -> Reserva | None:
+    """
+    Registra la devolución del préstamo activo de `libro` por parte de `usuario`.
+    Cierra el préstamo, repone el stock y ajusta los contadores en una única transacción corta.
+    Si el libro tiene reservas en espera, el ejemplar devuelto se presta en la misma
+    transacción a la primera de la cola, que se devuelve (None si la cola está vacía).
+    """
+    with transaction.atomic():
+        cerrados = Prestamo.objects.filter(usuario=usuario, libro=libro, activo=True).update(
+            activo=False,
+            fecha_devolucion=timezone.now(),
+        )
+        if not cerrados:
+            raise PrestamoNoEncontradoError()
+        # El UPDATE del libro va antes de leer la cola: bloquea la fila igual que
+        # `reservar_libro`, de modo que una reserva creada a la vez se ve aquí o
+        # encuentra el stock repuesto, y nunca queda en espera con ejemplares libres.
+        Libro.objects.filter(pk=libro.pk).update(
+            stock=F('stock') + 1,
+            prestamos_activos=F('prestamos_activos') - 1,
+            actualizado=timezone.now(),
+        )
+        usuarios = {usuario.pk: -1}
+        reserva = _reservas_en_cola([libro.pk]).first()
+        if reserva is not None:
+            _sumar(usuarios, _atender_reservas([reserva]))
+            Libro.objects.filter(pk=libro.pk).update(
+                stock=F('stock') - 1,
+                prestamos_activos=F('prestamos_activos') + 1,
+                total_prestamos=F('total_prestamos') + 1,
+            )
+        _ajustar_prestamos_usuarios(usuarios)
+        transaction.on_commit(lambda: invalidar_libro(libro.pk))
+        publicar_stock([libro.pk])
+    return reserva
+
+
+def reservar_libro(usuario: Usuario, libro: Libro) -> Reserva:
+    """
+    Pone a `usuario` en la cola de espera de `libro`, que debe estar sin stock.
+    La fila del libro se bloquea mientras se comprueba el stock para que una
+    devolución simultánea no pueda reponerlo sin ver la reserva nueva.
+    """
+    try:
+        with transaction.atomic():
+            stock = Libro.objects.select_for_update().filter(pk=libro.pk).values_list('stock', flat=True).first()
+            if stock is None:
+                raise LibroNoEncontradoError()
+            if stock > 0:
+                raise ReservaInnecesariaError()
+            if Prestamo.objects.filter(usuario=usuario, libro=libro, activo=True).exists():
+                raise PrestamoActivoError()
+            return Reserva.objects.create(usuario=usuario, libro=libro)
+    except IntegrityError:
+        # La restricción 'reserva_activa_unica' rechazó la segunda reserva en espera.
+        raise ReservaDuplicadaError()
+
+
+def cancelar_reserva(usuario: Usuario, libro: Libro) -> None:
+    """
+    Retira a `usuario` de la cola de espera de `libro`.
+    """
+    borradas, _ = Reserva.objects.filter(usuario=usuario, libro=libro, activa=True).delete()
+    if not borradas:
+        raise ReservaNoEncontradaError()
+
+
+def reservas_con_posicion(usuario: Usuario) -> QuerySet:
+    """
+    Reservas en espera de `usuario`, con el título del libro y la posición de cada
+    una en su cola (anotación `posicion`, empezando en 1), en una sola consulta.
+    """
+    delante = (
+        Reserva.objects
+        .filter(libro=OuterRef('libro'), activa=True)
+        .filter(Q(creada__lt=OuterRef('creada')) | Q(creada=OuterRef('creada'), id__lt=OuterRef('id')))
+        .order_by()
+        .values('libro')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return (
+        Reserva.objects
+        .filter(usuario=usuario, activa=True)
+        .select_related('libro')
+        .only('id', 'creada', 'libro__id', 'libro__titulo')
+        .annotate(posicion=Coalesce(Subquery(delante), 0) + 1)
+        .order_by('creada', 'id')
+    )
+
+
+def _reservas_en_cola(libro_ids: list[int]) -> QuerySet:
+    """
+    Reservas en espera de los libros indicados, en orden de llegada, bloqueadas con
+    `SELECT ... FOR UPDATE SKIP LOCKED`: dos transacciones que atienden la misma
+    cola se reparten las reservas en lugar de esperar la una por la otra. Se omiten
+    las de usuarios que ya tienen un préstamo activo del libro.
+    """
+    con_prestamo = Prestamo.objects.filter(usuario=OuterRef('usuario'), libro=OuterRef('libro'), activo=True)
+    return (
+        Reserva.objects
+        .select_for_update(skip_locked=True)
+        .filter(libro_id__in=libro_ids, activa=True)
+        .exclude(Exists(con_prestamo))
+        .order_by('libro_id', 'creada', 'id')
+    )
+
+
+def _atender_reservas(reservas: list[Reserva]) -> dict[int, int]:
+    """
+    Convierte `reservas` en préstamos y devuelve, por usuario, cuántos préstamos
+    activos gana. Los contadores de los usuarios (ver `_ajustar_prestamos_usuarios`),
+    el stock y los contadores del libro los ajusta quien llama.
+    """
+    ahora = timezone.now()
+    Prestamo.objects.bulk_create(Prestamo(usuario_id=r.usuario_id, libro_id=r.libro_id) for r in reservas)
+    Reserva.objects.filter(pk__in=[r.pk for r in reservas]).update(activa=False, atendida=ahora)
+    por_usuario = {}
+    for reserva in reservas:
+        por_usuario[reserva.usuario_id] = por_usuario.get(reserva.usuario_id, 0) + 1
+    return por_usuario
+
+
+def _sumar(variaciones: dict[int, int], otras: dict[int, int]) -> None:
+    """
+    Acumula en `variaciones` las variaciones por usuario de `otras`.
+    """
+    for pk, n in otras.items():
+        variaciones[pk] = variaciones.get(pk, 0) + n
+
+
+def _ajustar_prestamos_usuarios(variaciones: dict[int, int]) -> None:
+    """
+    Suma a los préstamos activos de cada usuario su variación con un único UPDATE.
+    Quien devuelve y los titulares de las reservas atendidas se actualizan en la
+    misma sentencia, que bloquea sus filas por orden de id: dos devoluciones
+    cruzadas (cada usuario devuelve un libro que el otro tiene reservado) no pueden
+    bloquearlas en orden inverso e interbloquearse.
+    """
+    variaciones = {pk: n for pk, n in variaciones.items() if n}
+    if not variaciones:
+        return
+    Usuario.objects.filter(pk__in=variaciones).update(prestamos_activos=F('prestamos_activos') + Case(
+        *(When(pk=pk, then=Value(n)) for pk, n in variaciones.items()),
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+def procesar_lote(usuario: Usuario, operaciones: list[dict]) -> list[dict]:
+    """
+    Ejecuta un lote de préstamos y devoluciones de `usuario` en una sola transacción.
+    Cada operación es un diccionario con `libro_id` y `accion` ('prestar' o 'devolver').
+    Devuelve, en el mismo orden, el resultado de cada operación; las que fallan no
+    impiden aplicar las demás.
+
+    Los libros implicados se bloquean en orden de id, de modo que dos lotes
+    concurrentes nunca se esperan mutuamente (sin interbloqueos). El número de
+    consultas no depende del tamaño del lote: los préstamos se insertan con un
+    único INSERT, las devoluciones se cierran con un único UPDATE y el stock de
+    todos los libros se ajusta con un único UPDATE ... CASE relativo al valor actual
+    (junto con sus contadores de préstamos; los de los usuarios, con otro UPDATE).
+    Como en `devolver_libro`, cada libro devuelto se presta a la primera reserva en
+    espera de su cola; todas las colas se leen con una sola consulta.
+    """
+    ids = sorted({operacion['libro_id'] for operacion in operaciones})
+    ahora = timezone.now()
+    with transaction.atomic():
+        libros = {
+            libro.pk: libro
+            for libro in Libro.objects.select_for_update().filter(pk__in=ids).order_by('pk').only('id', 'titulo', 'stock')
+        }
+        activos = set(
+            Prestamo.objects.filter(usuario=usuario, libro_id__in=ids, activo=True).values_list('libro_id', flat=True)
+        )
+
+        resultados, a_prestar, a_devolver = [], [], []
+        variaciones = {}
+        for operacion in operaciones:
+            libro_id, accion = operacion['libro_id'], operacion['accion']
+            libro = libros.get(libro_id)
+            try:
+                if libro is None:
+                    raise LibroNoEncontradoError()
+                if libro_id in variaciones:
+                    raise OperacionDuplicadaError()
+                if accion == PRESTAR:
+                    if libro_id in activos:
+                        raise PrestamoActivoError()
+                    if libro.stock <= 0:
+                        raise SinStockError()
+                    libro.stock -= 1
+                    variaciones[libro_id] = -1
+                    a_prestar.append(libro_id)
+                    mensaje = f'Has prestado "{libro.titulo}" exitosamente.'
+                else:
+                    if libro_id not in activos:
+                        raise PrestamoNoEncontradoError()
+                    libro.stock += 1
+                    variaciones[libro_id] = 1
+                    a_devolver.append(libro_id)
+                    mensaje = f'Has devuelto "{libro.titulo}" exitosamente.'
+            except PrestamoError as e:
+                resultados.append({'libro_id': libro_id, 'accion': accion, 'ok': False, 'mensaje': str(e)})
+            else:
+                resultados.append({'libro_id': libro_id, 'accion': accion, 'ok': True, 'mensaje': mensaje})
+
+        atendidas, usuarios = {}, {usuario.pk: len(a_prestar) - len(a_devolver)}
+        if a_prestar:
+            Prestamo.objects.bulk_create(Prestamo(usuario=usuario, libro_id=libro_id) for libro_id in a_prestar)
+        if a_devolver:
+            Prestamo.objects.filter(usuario=usuario, libro_id__in=a_devolver, activo=True).update(
+                activo=False,
+                fecha_devolucion=ahora,
+            )
+            # Cada ejemplar devuelto pasa a la primera reserva en espera de su libro, si la hay.
+            for reserva in _reservas_en_cola(a_devolver):
+                atendidas.setdefault(reserva.libro_id, reserva)
+            if atendidas:
+                _sumar(usuarios, _atender_reservas(list(atendidas.values())))
+                for libro_id in atendidas:
+                    variaciones[libro_id] -= 1
+        if variaciones:
+            def por_libro(valores):
+                return Case(
+                    *(When(pk=libro_id, then=Value(valor)) for libro_id, valor in valores.items()),
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+
+            # Un préstamo resta stock y suma un préstamo activo; una devolución, al revés.
+            # Una devolución atendida por una reserva no cambia ninguno de los dos.
+            Libro.objects.filter(pk__in=variaciones).update(
+                stock=F('stock') + por_libro(variaciones),
+                prestamos_activos=F('prestamos_activos') - por_libro(variaciones),
+                total_prestamos=F('total_prestamos') + por_libro(dict.fromkeys([*a_prestar, *atendidas], 1)),
+                actualizado=ahora,
+            )
+            _ajustar_prestamos_usuarios(usuarios)
+            transaction.on_commit(lambda: invalidar_libros(list(variaciones)))
+            publicar_stock(variaciones)
+    return resultados
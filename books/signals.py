@@ -0,0 +1,90 @@
+"""
+Receptores de señales de la aplicación 'books'.
+Mantienen la caché del catálogo y la de usuarios coherentes con los cambios
+hechos a través del ORM (incluido el panel de administración).
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .autores import asignar_autores
+from .cache import invalidar_libro, invalidar_libros, invalidar_usuario, registrar_baja
+from .eventos import publicar_stock
+from .instrumentacion import instalar_medicion
+from .models import Autor, Libro, Usuario
+
+
+@receiver(pre_save, sender=Libro)
+def asignar_autor_libro(sender, instance: Libro, raw: bool = False, update_fields=None, **kwargs) -> None:
+    """
+    Asigna al libro el autor normalizado que corresponde a su nombre de autor
+    (el que llega del formulario, la API o el admin).
+    """
+    if not raw and (update_fields is None or 'autor' in update_fields):
+        asignar_autores([instance])
+
+
+@receiver(post_save, sender=Libro)
+def invalidar_cache_libro(sender, instance: Libro, **kwargs) -> None:
+    """
+    Invalida la caché del libro y del catálogo al guardar un libro y publica su
+    stock, que puede haber cambiado (p. ej. al editarlo en el admin).
+    La invalidación espera a que se confirme la transacción: si no, una lectura
+    simultánea podría guardar en la clave nueva la fila aún sin confirmar.
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidar_libro(pk))
+    publicar_stock([pk])
+
+
+@receiver(post_delete, sender=Libro)
+def registrar_baja_libro(sender, instance: Libro, **kwargs) -> None:
+    """
+    Invalida la caché y registra la baja para los validadores HTTP del catálogo
+    cuando se confirma la transacción.
+    """
+    # Al terminar el borrado, Django deja `instance.pk` a None.
+    pk = instance.pk
+
+    def invalidar():
+        invalidar_libro(pk)
+        registrar_baja()
+
+    transaction.on_commit(invalidar)
+
+
+@receiver(post_save, sender=Usuario)
+@receiver(post_delete, sender=Usuario)
+def invalidar_cache_usuario(sender, instance: Usuario, **kwargs) -> None:
+    """
+    Descarta el usuario cacheado para las sesiones al modificarlo o eliminarlo,
+    cuando se confirma la transacción.
+    """
+    pk = instance.pk
+    transaction.on_commit(lambda: invalidar_usuario(pk))
+
+
+@receiver(post_save, sender=Autor)
+def propagar_nombre_autor(sender, instance: Autor, created: bool, raw: bool = False, **kwargs) -> None:
+    """
+    Copia la grafía del autor en sus libros al corregirla (p. ej. en el admin).
+    """
+    if created or raw:
+        return
+    pks = list(instance.libros.exclude(autor=instance.nombre).values_list('pk', flat=True))
+    if pks:
+        Libro.objects.filter(pk__in=pks).update(autor=instance.nombre, actualizado=timezone.now())
+        transaction.on_commit(lambda: invalidar_libros(pks))
+
+
+@receiver(connection_created)
+def instrumentar_conexion(sender, connection, **kwargs) -> None:
+    """
+    Instala la medición de consultas de `books.instrumentacion` en cada conexión
+    nueva, incluidas las de los hilos que ejecutan vistas síncronas bajo ASGI.
+    """
+    if settings.INSTRUMENTACION_ACTIVA:
+        instalar_medicion(connection)
@@ -1,3 +1,1884 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+
+from django.apps import apps as django_apps
+from django.contrib import admin
+from django.core.cache import cache
+from django.core.cache.backends.redis import RedisCache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from biblioteca.settings import renderizadores_api
+
+from . import api_urls, eventos, limites, services
+from . import urls as web_urls
+from .api_views import LibroListCreateView
+from .archivo import historial_usuario, paginar_historial
+from .authentication import TokenAutenticacion
+from .cache import clave_usuario, invalidar_libro
+from .autores import rellenar_autores
+from .models import Autor, Libro, Prestamo, PrestamoArchivado, Reserva, TokenAcceso, Usuario, normalizar_autor
+from .services import PrestamoActivoError, PrestamoNoEncontradoError, SinStockError
+from .instrumentacion import InstrumentacionMiddleware, metricas, percentil
+from .tokens import emitir_token, resumen_token, vaciar_cache
+from .pagination import ORDENES_PERMITIDOS, CursorInvalido, codificar_cursor, paginar
+from .renderers import JSONRapidoRenderer
+from .replicas import ReplicaRouter
+from .search import buscar_libros
+from .serializers import LibroSerializer
+from .views import ListarLibrosView, MisLibrosView
+
+
+def consultas_sql(ctx: CaptureQueriesContext) -> list[str]:
+    """
+    Devuelve las sentencias capturadas sin contar el control de transacciones
+    (BEGIN, SAVEPOINT, COMMIT...), que depende del tipo de TestCase.
+    """
+    control = ('BEGIN', 'SAVEPOINT', 'RELEASE', 'COMMIT', 'ROLLBACK')
+    return [q['sql'] for q in ctx.captured_queries if not q['sql'].upper().startswith(control)]
+
+
+class CatalogoTestCase(TestCase):
+    """
+    Caso base que vacía la caché del catálogo antes de cada prueba, ya que los
+    datos creados con bulk_create no invalidan la caché.
+    """
+    def setUp(self):
+        cache.clear()
+
+
+class ServicioPrestamosTests(TestCase):
+    """
+    Pruebas del servicio de préstamos compartido por las vistas web y la API.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=1)
+
+    def test_prestar_descuenta_stock_en_tres_consultas(self):
+        with CaptureQueriesContext(connection) as ctx:
+            services.prestar_libro(self.usuario, self.libro)
+        # UPDATE condicional del stock, INSERT del préstamo y UPDATE del contador del usuario.
+        self.assertEqual(len(consultas_sql(ctx)), 3)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock, 0)
+
+    def test_prestar_sin_stock(self):
+        otro = Usuario.objects.create_user('otro', password='clave')
+        services.prestar_libro(otro, self.libro)
+        with self.assertRaises(SinStockError):
+            services.prestar_libro(self.usuario, self.libro)
+        self.assertEqual(Prestamo.objects.filter(libro=self.libro).count(), 1)
+
+    def test_prestamo_duplicado_no_descuenta_stock(self):
+        self.libro.stock = 2
+        self.libro.save()
+        services.prestar_libro(self.usuario, self.libro)
+        with self.assertRaises(PrestamoActivoError):
+            services.prestar_libro(self.usuario, self.libro)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock, 1)
+
+    def test_devolver_repone_stock(self):
+        services.prestar_libro(self.usuario, self.libro)
+        with CaptureQueriesContext(connection) as ctx:
+            services.devolver_libro(self.usuario, self.libro)
+        # Préstamo, stock, contador del usuario y cola de reservas (vacía).
+        self.assertEqual(len(consultas_sql(ctx)), 4)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock, 1)
+        with self.assertRaises(PrestamoNoEncontradoError):
+            services.devolver_libro(self.usuario, self.libro)
+
+    def test_vistas_web_y_api_usan_el_servicio(self):
+        self.client.force_login(self.usuario)
+        self.client.post(reverse('books:prestar_libro', args=[self.libro.pk]))
+        respuesta = self.client.post(reverse('api:prestar-libro', args=[self.libro.pk]))
+        self.assertEqual(respuesta.status_code, 400)
+        respuesta = self.client.post(reverse('api:devolver-libro', args=[self.libro.pk]))
+        self.assertEqual(respuesta.status_code, 200)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.stock, 1)
+
+
+class ConcurrenciaPrestamosTests(TransactionTestCase):
+    """
+    Prueba de estrés: cientos de préstamos simultáneos sobre un mismo libro.
+    """
+    USUARIOS = 200
+    STOCK = 50
+
+    def test_prestamos_concurrentes_no_sobrevenden(self):
+        libro = Libro.objects.create(titulo='Popular', autor='Autor', ano_publicacion=2000, stock=self.STOCK)
+        usuarios = Usuario.objects.bulk_create(
+            Usuario(username=f'lector{i}') for i in range(self.USUARIOS)
+        )
+        consultas = []
+        bloqueo = threading.Lock()
+
+        def prestar(usuario):
+            try:
+                while True:
+                    try:
+                        with CaptureQueriesContext(connection) as ctx:
+                            services.prestar_libro(usuario, libro)
+                    except SinStockError:
+                        return False
+                    except OperationalError:
+                        # SQLite bloquea la base completa ante escrituras simultáneas; se reintenta.
+                        time.sleep(0.001)
+                        continue
+                    with bloqueo:
+                        consultas.append(len(consultas_sql(ctx)))
+                    return True
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=32) as executor:
+            resultados = list(executor.map(prestar, usuarios))
+
+        libro.refresh_from_db()
+        self.assertEqual(sum(resultados), self.STOCK)
+        self.assertEqual(libro.stock, 0)
+        self.assertEqual(Prestamo.objects.filter(libro=libro, activo=True).count(), self.STOCK)
+        consultas_por_prestamo = sum(consultas) / len(consultas)
+        self.assertLessEqual(consultas_por_prestamo, 3)
+
+
+class MigracionPrestamoActivoUnicoTests(TestCase):
+    """
+    La migración 0003 cierra los préstamos activos duplicados antes de crear la restricción.
+    """
+    def test_conserva_el_prestamo_mas_reciente_y_repone_el_stock(self):
+        migracion = import_module('books.migrations.0003_prestamo_activo_unico')
+        restriccion = next(r for r in Prestamo._meta.constraints if r.name == 'prestamo_activo_unico')
+        editor = connection.SchemaEditorClass(connection)
+        # Una base anterior a la restricción, con el préstamo duplicado por la carrera.
+        with connection.cursor() as cursor:
+            cursor.execute(str(restriccion.remove_sql(Prestamo, editor)))
+        usuario = Usuario.objects.create_user('lector')
+        libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=0)
+        prestamos = Prestamo.objects.bulk_create(Prestamo(usuario=usuario, libro=libro, activo=True) for _ in range(3))
+
+        migracion.cerrar_prestamos_duplicados(django_apps, editor)
+        with connection.cursor() as cursor:
+            cursor.execute(str(restriccion.create_sql(Prestamo, editor)))
+        self.assertEqual(list(Prestamo.objects.filter(activo=True).values_list('id', flat=True)), [prestamos[-1].pk])
+        self.assertEqual(Prestamo.objects.filter(activo=False, fecha_devolucion__isnull=False).count(), 2)
+        libro.refresh_from_db()
+        self.assertEqual(libro.stock, 2)
+
+
+class PlanesConsultaTests(TestCase):
+    """
+    Verifica con EXPLAIN que las consultas más frecuentes usan índices y no
+    recorren secuencialmente las tablas de libros y préstamos.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuarios = Usuario.objects.bulk_create(Usuario(username=f'lector{i}') for i in range(50))
+        cls.libros = Libro.objects.bulk_create(
+            Libro(titulo=f'Libro {i}', autor=f'Autor {i % 40}', ano_publicacion=1900 + i % 120, stock=i % 3)
+            for i in range(2000)
+        )
+        Prestamo.objects.bulk_create(
+            Prestamo(usuario=cls.usuarios[i % 50], libro=cls.libros[i], activo=i % 4 == 0)
+            for i in range(2000)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def assertUsaIndices(self, queryset, *indices: str):
+        """
+        Falla si el plan de `queryset` no usa cada uno de los `indices` o si
+        recorre alguna tabla sin índice.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Con pocos datos el planificador prefiere el recorrido secuencial;
+                # se desactiva para comprobar qué índice elige en su lugar.
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            secuencial = 'Seq Scan' in plan
+            usados = set(re.findall(r'Index (?:Only )?Scan(?: Backward)? using (\w+)', plan))
+        else:
+            secuencial = re.search(r'SCAN \w+\b(?! USING)', plan) is not None
+            usados = set(re.findall(r'USING (?:COVERING )?INDEX (\w+)', plan))
+        mensaje = f'\n{queryset.query}\n{plan}'
+        self.assertFalse(secuencial, f'Recorrido secuencial en:{mensaje}')
+        for indice in indices:
+            self.assertIn(indice, usados, f'No se usa {indice} en:{mensaje}')
+
+    def test_prestamo_activo_por_usuario_y_libro(self):
+        self.assertUsaIndices(
+            Prestamo.objects.filter(usuario=self.usuarios[0], libro=self.libros[0], activo=True),
+            'prestamo_activo_unico',
+        )
+
+    def queryset_de_vista(self, vista_clase, url: str):
+        """
+        Devuelve el queryset que `vista_clase` construye para una petición GET a `url`.
+        """
+        peticion = RequestFactory().get(url)
+        peticion.user = self.usuarios[0]
+        vista = vista_clase()
+        vista.setup(peticion)
+        return vista.get_queryset()
+
+    def test_mis_libros(self):
+        self.assertUsaIndices(
+            self.queryset_de_vista(MisLibrosView, reverse('books:mis_libros')),
+            'prestamo_usuario_fecha_idx',
+            'archivado_usuario_fecha_idx',
+        )
+
+    def test_listar_libros_en_stock(self):
+        indices = {
+            'titulo': 'libro_titulo_id_idx',
+            'autor': 'libro_autor_id_idx',
+            'ano_publicacion': 'libro_ano_id_idx',
+        }
+        queryset = self.queryset_de_vista(ListarLibrosView, reverse('books:listar_libros'))
+        for orden in ORDENES_PERMITIDOS:
+            with self.subTest(orden=orden):
+                # La consulta de una página, como la construye `paginar`.
+                pagina = queryset.order_by(orden, 'id')[:ListarLibrosView.paginate_by + 1]
+                self.assertUsaIndices(pagina, indices[orden])
+
+
+class PaginacionKeysetTests(CatalogoTestCase):
+    """
+    Pruebas de la paginación por cursor del catálogo (API y vista web).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        # Autores y años repetidos para ejercitar el desempate por id.
+        Libro.objects.bulk_create(
+            Libro(titulo=f'Libro {i:02d}', autor=f'Autor {i % 3}', ano_publicacion=2000 + i % 4, stock=i % 5)
+            for i in range(23)
+        )
+
+    def recorrer_api(self, orden: str) -> list[int]:
+        """
+        Recorre todas las páginas de la API hacia delante y devuelve los ids vistos.
+        """
+        ids, url = [], f"{reverse('api:libro-list-create')}?ordering={orden}&page_size=5"
+        while url:
+            datos = self.client.get(url).json()
+            ids += [libro['id'] for libro in datos['results']]
+            url = datos['next']
+        return ids
+
+    def test_api_recorre_cada_ordenamiento_sin_repetir_ni_omitir(self):
+        for orden in ('titulo', 'autor', '-autor', 'ano_publicacion', '-ano_publicacion'):
+            prefijo = '-' if orden.startswith('-') else ''
+            esperado = list(Libro.objects.order_by(orden, f'{prefijo}id').values_list('id', flat=True))
+            with self.subTest(orden=orden):
+                self.assertEqual(self.recorrer_api(orden), esperado)
+
+    def test_pagina_anterior_devuelve_la_misma_pagina(self):
+        url = f"{reverse('api:libro-list-create')}?ordering=autor&page_size=5"
+        primera = self.client.get(url).json()
+        segunda = self.client.get(primera['next']).json()
+        tercera = self.client.get(segunda['next']).json()
+        self.assertEqual(self.client.get(tercera['previous']).json()['results'], segunda['results'])
+        self.assertEqual(self.client.get(segunda['previous']).json()['results'], primera['results'])
+        self.assertIsNone(primera['previous'])
+
+    def test_sin_offset_ni_count(self):
+        pagina = paginar(Libro.objects.all(), 'titulo', None, 5)
+        with CaptureQueriesContext(connection) as ctx:
+            paginar(Libro.objects.all(), 'titulo', pagina.siguiente, 5)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        sql = ctx.captured_queries[0]['sql'].upper()
+        self.assertNotIn('OFFSET', sql)
+        self.assertNotIn('COUNT(', sql)
+
+    def test_vista_web_pagina_solo_libros_en_stock(self):
+        respuesta = self.client.get(reverse('books:listar_libros'), {'ordering': '-ano_publicacion'})
+        libros = list(respuesta.context['libros'])
+        self.assertTrue(all(libro.stock > 0 for libro in libros))
+        self.assertEqual(respuesta.context['orden'], '-ano_publicacion')
+        self.assertIsNone(respuesta.context['page_obj'].siguiente)
+
+    def test_cursor_invalido(self):
+        self.assertEqual(self.client.get(reverse('api:libro-list-create'), {'cursor': '@@'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('books:listar_libros'), {'cursor': '@@'}).status_code, 400)
+
+    def test_cursor_de_otro_ordenamiento(self):
+        # Un cursor de títulos reutilizado al ordenar por año no llega a la consulta.
+        siguiente = paginar(Libro.objects.all(), 'titulo', None, 5).siguiente
+        for url in (reverse('api:libro-list-create'), reverse('books:listar_libros')):
+            for orden in ('ano_publicacion', '-titulo'):
+                with self.subTest(url=url, orden=orden):
+                    respuesta = self.client.get(url, {'ordering': orden, 'cursor': siguiente})
+                    self.assertEqual(respuesta.status_code, 400)
+        # Ni un cursor manipulado con un valor de otro tipo que la columna.
+        manipulado = codificar_cursor('ano_publicacion', 'Libro 04', 5)
+        with self.assertRaises(CursorInvalido):
+            paginar(Libro.objects.all(), 'ano_publicacion', manipulado, 5)
+
+
+class BusquedaLibrosTests(CatalogoTestCase):
+    """
+    Pruebas de la búsqueda por título y autor (API y vista web).
+    En SQLite se ejercita la implementación portable de `buscar_libros`.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        Libro.objects.create(titulo='Cien años de soledad', autor='Gabriel García Márquez', ano_publicacion=1967, stock=2)
+        Libro.objects.create(titulo='El amor en los tiempos del cólera', autor='Gabriel García Márquez', ano_publicacion=1985, stock=0)
+        Libro.objects.create(titulo='Soledad', autor='Otra Autora', ano_publicacion=2001, stock=1)
+        Libro.objects.create(titulo='Rayuela', autor='Julio Cortázar', ano_publicacion=1963, stock=1)
+
+    def test_api_busca_y_ordena_por_relevancia(self):
+        datos = self.client.get(reverse('api:libro-list-create'), {'q': 'soledad'}).json()
+        self.assertEqual([libro['titulo'] for libro in datos['results']], ['Soledad', 'Cien años de soledad'])
+        self.assertIsNone(datos['next'])
+
+    def test_api_pagina_los_resultados_de_la_busqueda(self):
+        Libro.objects.bulk_create(
+            Libro(titulo=f'Soledad {i}', autor='Autor', ano_publicacion=2000, stock=1) for i in range(5)
+        )
+        esperado = list(buscar_libros(Libro.objects.all(), 'soledad').values_list('titulo', flat=True))
+        titulos, paginas = [], []
+        url = f"{reverse('api:libro-list-create')}?q=soledad&page_size=2"
+        while url:
+            paginas.append(self.client.get(url).json())
+            titulos += [libro['titulo'] for libro in paginas[-1]['results']]
+            url = paginas[-1]['next']
+        self.assertEqual(len(esperado), 7)
+        self.assertEqual(titulos, esperado)
+        self.assertEqual(self.client.get(paginas[2]['previous']).json()['results'], paginas[1]['results'])
+        # El cursor de una búsqueda no sirve para el listado sin búsqueda.
+        cursor = paginas[0]['next'].split('cursor=')[1]
+        self.assertEqual(self.client.get(reverse('api:libro-list-create'), {'cursor': cursor}).status_code, 400)
+
+    def test_api_busca_por_autor(self):
+        datos = self.client.get(reverse('api:libro-list-create'), {'q': 'garcía márquez'}).json()
+        self.assertEqual(len(datos['results']), 2)
+
+    def test_vista_web_busca_solo_en_stock(self):
+        respuesta = self.client.get(reverse('books:listar_libros'), {'q': 'gabriel'})
+        self.assertEqual([libro.titulo for libro in respuesta.context['libros']], ['Cien años de soledad'])
+        self.assertContains(respuesta, 'value="gabriel"')
+
+
+class CacheCatalogoTests(CatalogoTestCase):
+    """
+    Pruebas de la caché versionada de listados y detalles del catálogo.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.libro = Libro.objects.create(titulo='Ficciones', autor='Borges', ano_publicacion=1944, stock=3)
+
+    def test_lecturas_repetidas_no_consultan_la_base(self):
+        urls = [
+            reverse('api:libro-list-create'),
+            reverse('api:libro-detail', args=[self.libro.pk]),
+            reverse('books:listar_libros'),
+            reverse('books:detalle_libro', args=[self.libro.pk]),
+        ]
+        for url in urls:
+            self.client.get(url)
+            with self.subTest(url=url), self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_prestamo_invalida_listado_y_detalle(self):
+        detalle = reverse('api:libro-detail', args=[self.libro.pk])
+        listado = reverse('api:libro-list-create')
+        self.client.get(detalle)
+        self.client.get(listado)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.prestar_libro(self.usuario, self.libro)
+        self.assertEqual(self.client.get(detalle).json()['stock'], 2)
+        self.assertEqual(self.client.get(listado).json()['results'][0]['stock'], 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.devolver_libro(self.usuario, self.libro)
+        self.assertEqual(self.client.get(detalle).json()['stock'], 3)
+
+    def test_guardar_y_eliminar_invalidan(self):
+        pagina = reverse('books:detalle_libro', args=[self.libro.pk])
+        self.client.get(pagina)
+        self.libro.titulo = 'Ficciones (edición revisada)'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.libro.save()
+        self.assertContains(self.client.get(pagina), 'edición revisada')
+        self.client.get(reverse('books:listar_libros'))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.libro.delete()
+        self.assertNotContains(self.client.get(reverse('books:listar_libros')), 'Ficciones')
+
+    def test_invalidacion_al_confirmar_la_transaccion(self):
+        # Antes de confirmarse, una lectura simultánea no debe poder guardar la fila
+        # sin confirmar en la clave nueva: la versión solo cambia al confirmar.
+        pagina = reverse('books:detalle_libro', args=[self.libro.pk])
+        self.client.get(pagina)
+        self.libro.titulo = 'Ficciones (edición revisada)'
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.libro.save()
+            self.assertNotContains(self.client.get(pagina), 'edición revisada')
+        for callback in callbacks:
+            callback()
+        self.assertContains(self.client.get(pagina), 'edición revisada')
+
+    def test_listado_reutiliza_las_tarjetas_de_los_libros_sin_cambios(self):
+        Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=1)
+        url = reverse('books:listar_libros')
+        tarjetas = lambda respuesta: [t.name for t in respuesta.templates].count(ListarLibrosView.tarjeta_template_name)
+        self.assertEqual(tarjetas(self.client.get(url)), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.prestar_libro(self.usuario, self.libro)
+        # El catálogo cambia, pero solo se renderiza de nuevo la tarjeta del libro prestado.
+        respuesta = self.client.get(url)
+        self.assertEqual(tarjetas(respuesta), 1)
+        self.assertContains(respuesta, f'data-stock-libro="{self.libro.pk}">2</span>')
+        self.assertContains(respuesta, 'Rayuela')
+
+
+class PeticionesCondicionalesTests(CatalogoTestCase):
+    """
+    Pruebas de ETag / Last-Modified en la API de libros.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.libro = Libro.objects.create(titulo='Pedro Páramo', autor='Rulfo', ano_publicacion=1955, stock=2)
+        cls.otro = Libro.objects.create(titulo='El llano en llamas', autor='Rulfo', ano_publicacion=1953, stock=1)
+
+    def assertNoModificado(self, url: str, **cabeceras):
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(url, headers=cabeceras)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta.content, b'')
+
+    def test_detalle_304_e_invalidacion_tras_prestamo(self):
+        url = reverse('api:libro-detail', args=[self.libro.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertNoModificado(url, if_none_match=etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.prestar_libro(self.usuario, self.libro)
+        respuesta = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['stock'], 1)
+        self.assertNotEqual(respuesta['ETag'], etag)
+
+    def test_detalle_if_modified_since(self):
+        url = reverse('api:libro-detail', args=[self.libro.pk])
+        self.assertNoModificado(url, if_modified_since=self.client.get(url)['Last-Modified'])
+
+    def test_listado_304_e_invalidacion_tras_edicion_y_borrado(self):
+        url = reverse('api:libro-list-create')
+        etag = self.client.get(url)['ETag']
+        self.assertNoModificado(url, if_none_match=etag)
+        self.otro.titulo = 'El llano en llamas (2.ª ed.)'
+        self.otro.save()
+        respuesta = self.client.get(url, headers={'if-none-match': etag})
+        self.assertEqual(respuesta.status_code, 200)
+        etag = respuesta['ETag']
+        self.otro.delete()
+        self.assertEqual(self.client.get(url, headers={'if-none-match': etag}).status_code, 200)
+
+    def test_cada_pagina_tiene_su_etag(self):
+        url = reverse('api:libro-list-create')
+        self.assertNotEqual(self.client.get(url)['ETag'], self.client.get(url, {'ordering': 'autor'})['ETag'])
+
+
+class ImportacionExportacionTests(CatalogoTestCase):
+    """
+    Pruebas de los comandos import_libros, export_libros y export_prestamos.
+    """
+    def importar(self, contenido: str, sufijo: str = '.csv', *args) -> str:
+        with tempfile.NamedTemporaryFile('w', suffix=sufijo, delete=False, encoding='utf-8') as archivo:
+            archivo.write(contenido)
+        self.addCleanup(os.remove, archivo.name)
+        salida = io.StringIO()
+        call_command('import_libros', archivo.name, *args, stdout=salida, stderr=io.StringIO())
+        return salida.getvalue()
+
+    def test_importa_csv_por_lotes_y_actualiza_por_id(self):
+        existente = Libro.objects.create(titulo='Viejo', autor='A', ano_publicacion=1900, stock=1)
+        contenido = (
+            'id,titulo,autor,ano_publicacion,stock\n'
+            f'{existente.pk},Nuevo,A,1901,5\n'
+            ',Aura,Carlos Fuentes,1962,2\n'
+            ',Sin año,X,,1\n'
+            ',La tregua,Mario Benedetti,1960,3\n'
+        )
+        resumen = self.importar(contenido, '.csv', '--lote', '2')
+        self.assertIn('3 libros importados, 1 filas con errores', resumen)
+        existente.refresh_from_db()
+        self.assertEqual((existente.titulo, existente.stock), ('Nuevo', 5))
+        self.assertEqual(Libro.objects.count(), 3)
+
+    def test_id_no_numerico_es_un_error_de_la_fila(self):
+        contenido = (
+            'id,titulo,autor,ano_publicacion,stock\n'
+            'abc,Aura,Carlos Fuentes,1962,2\n'
+            '-3,Pedro Páramo,Juan Rulfo,1955,1\n'
+            '12.7,Ficciones,Jorge Luis Borges,1944,1\n'
+            '100,La tregua,Mario Benedetti,1960,3\n'
+            ',Rayuela,Julio Cortázar,1963,1\n'
+        )
+        self.assertIn('2 libros importados, 3 filas con errores', self.importar(contenido))
+        self.assertGreater(Libro.objects.get(titulo='Rayuela').pk, 100)
+        self.assertFalse(Libro.objects.filter(pk=12).exists())
+
+    def test_id_no_entero_en_jsonl_es_un_error_de_la_fila(self):
+        fila = {'titulo': 'Aura', 'autor': 'B', 'ano_publicacion': 1962, 'stock': 1}
+        contenido = ''.join(
+            json.dumps({**fila, 'id': pk}) + '\n' for pk in [12.7, 12.0, True, '12', 13]
+        )
+        self.assertIn('2 libros importados, 3 filas con errores', self.importar(contenido, '.jsonl'))
+        self.assertEqual(list(Libro.objects.order_by('id').values_list('id', flat=True)), [12, 13])
+
+    def test_secuencia_ajustada_en_cada_lote(self):
+        # El segundo lote falla al leerse, pero la secuencia ya se ajustó tras el primero.
+        contenido = json.dumps({'id': 100, 'titulo': 'Aura', 'autor': 'B', 'ano_publicacion': 1962, 'stock': 1}) + '\n{roto\n'
+        with self.assertRaises(json.JSONDecodeError):
+            self.importar(contenido, '.jsonl', '--lote', '1')
+        self.assertTrue(Libro.objects.filter(pk=100).exists())
+        libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=1)
+        self.assertGreater(libro.pk, 100)
+
+    def test_importa_jsonl_desde_stdin_y_reanuda(self):
+        filas = [{'titulo': f'Libro {i}', 'autor': 'B', 'ano_publicacion': 2000, 'stock': 1} for i in range(5)]
+        entrada = io.StringIO(''.join(json.dumps(fila) + '\n' for fila in filas))
+        with mock.patch('sys.stdin', entrada):
+            call_command('import_libros', '-', '--formato', 'jsonl', '--desde-linea', '3',
+                         stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(list(Libro.objects.order_by('id').values_list('titulo', flat=True)), ['Libro 3', 'Libro 4'])
+
+    def test_exportacion_e_importacion_de_ida_y_vuelta(self):
+        Libro.objects.create(titulo='Ñandú, "comillas"', autor='C', ano_publicacion=1999, stock=4)
+        salida = io.StringIO()
+        call_command('export_libros', '--formato', 'csv', '--bloque', '1', stdout=salida, stderr=io.StringIO())
+        Libro.objects.update(titulo='Cambiado')
+        self.importar(salida.getvalue())
+        self.assertEqual(Libro.objects.get().titulo, 'Ñandú, "comillas"')
+
+    def test_exporta_prestamos_en_jsonl(self):
+        usuario = Usuario.objects.create_user('lector', password='clave')
+        libro = Libro.objects.create(titulo='Aura', autor='Fuentes', ano_publicacion=1962, stock=1)
+        services.prestar_libro(usuario, libro)
+        salida = io.StringIO()
+        call_command('export_prestamos', '--formato', 'jsonl', stdout=salida, stderr=io.StringIO())
+        fila = json.loads(salida.getvalue())
+        self.assertEqual((fila['usuario__username'], fila['libro_id'], fila['activo']), ('lector', libro.pk, True))
+
+
+class PrestamosPorLoteTests(CatalogoTestCase):
+    """
+    Pruebas del endpoint de préstamos y devoluciones por lote.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.libros = [
+            Libro.objects.create(titulo=f'Libro {i}', autor='A', ano_publicacion=2000, stock=1)
+            for i in range(4)
+        ]
+        cls.libros[3].stock = 0
+        cls.libros[3].save()
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.usuario)
+
+    def enviar(self, operaciones):
+        return self.client.post(reverse('api:prestamos-batch'), {'operaciones': operaciones}, content_type='application/json')
+
+    def test_resultados_por_operacion(self):
+        services.prestar_libro(self.usuario, self.libros[0])
+        operaciones = [
+            {'libro_id': self.libros[0].pk, 'accion': 'devolver'},
+            {'libro_id': self.libros[1].pk, 'accion': 'prestar'},
+            {'libro_id': self.libros[2].pk, 'accion': 'devolver'},
+            {'libro_id': self.libros[3].pk, 'accion': 'prestar'},
+            {'libro_id': self.libros[1].pk, 'accion': 'devolver'},
+            {'libro_id': 999999, 'accion': 'prestar'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True):
+            resultados = self.enviar(operaciones).json()['resultados']
+        self.assertEqual([r['ok'] for r in resultados], [True, True, False, False, False, False])
+        self.assertEqual(resultados[3]['mensaje'], SinStockError.mensaje)
+        stocks = dict(Libro.objects.values_list('id', 'stock'))
+        self.assertEqual([stocks[libro.pk] for libro in self.libros], [1, 0, 1, 0])
+        self.assertEqual(
+            list(Prestamo.objects.filter(activo=True).values_list('libro_id', flat=True)), [self.libros[1].pk]
+        )
+
+    def test_numero_de_consultas_constante(self):
+        operaciones = [{'libro_id': libro.pk, 'accion': 'prestar'} for libro in self.libros[:3]]
+        with CaptureQueriesContext(connection) as ctx:
+            services.procesar_lote(self.usuario, operaciones)
+        # SELECT ... FOR UPDATE, préstamos activos, INSERT de préstamos, UPDATE del stock
+        # y UPDATE del contador del usuario.
+        self.assertEqual(len(consultas_sql(ctx)), 5)
+
+    def test_valida_el_cuerpo(self):
+        self.assertEqual(self.enviar([]).status_code, 400)
+        self.assertEqual(self.enviar([{'libro_id': self.libros[0].pk, 'accion': 'vender'}]).status_code, 400)
+
+
+class ArchivoPrestamosTests(TestCase):
+    """
+    Pruebas del archivo de préstamos devueltos y de la lectura combinada del historial.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.libros = [Libro.objects.create(titulo=f'Libro {i}', autor='A', ano_publicacion=2000, stock=5) for i in range(3)]
+        hace_dos_anos = timezone.now() - timedelta(days=730)
+        for i, libro in enumerate(cls.libros):
+            services.prestar_libro(cls.usuario, libro)
+            if i < 2:
+                services.devolver_libro(cls.usuario, libro)
+        # Los dos primeros préstamos se devolvieron hace dos años.
+        Prestamo.objects.filter(libro__in=cls.libros[:2]).update(
+            fecha_prestamo=hace_dos_anos, fecha_devolucion=hace_dos_anos + timedelta(days=7)
+        )
+        services.prestar_libro(cls.usuario, cls.libros[0])
+
+    def test_archiva_solo_devueltos_antiguos_por_lotes(self):
+        salida = io.StringIO()
+        call_command('archivar_prestamos', '--dias', '365', '--lote', '1', stdout=salida)
+        self.assertIn('2 préstamos archivados en 2 lotes', salida.getvalue())
+        self.assertEqual(PrestamoArchivado.objects.count(), 2)
+        self.assertEqual(Prestamo.objects.count(), 2)
+        self.assertFalse(Prestamo.objects.filter(activo=False).exists())
+
+    def test_mis_libros_lee_ambas_tablas(self):
+        call_command('archivar_prestamos', stdout=io.StringIO())
+        self.client.force_login(self.usuario)
+        prestamos = list(self.client.get(reverse('books:mis_libros')).context['prestamos'])
+        self.assertEqual(len(prestamos), 4)
+        self.assertEqual([p['activo'] for p in prestamos], [True, True, False, False])
+        self.assertEqual({p['titulo'] for p in prestamos[2:]}, {'Libro 0', 'Libro 1'})
+
+    def test_historial_paginado_por_cursor(self):
+        call_command('archivar_prestamos', stdout=io.StringIO())
+        esperado = [p['id'] for p in historial_usuario(self.usuario)]
+        ids, cursor = [], None
+        while True:
+            pagina = paginar_historial(self.usuario, cursor, 1)
+            ids += [p['id'] for p in pagina.objetos]
+            if pagina.siguiente is None:
+                break
+            cursor = pagina.siguiente
+        self.assertEqual(ids, esperado)
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('books:mis_libros'), {'cursor': 'x'}).status_code, 400)
+
+    def test_exportacion_incluye_los_archivados(self):
+        call_command('archivar_prestamos', stdout=io.StringIO())
+        salida = io.StringIO()
+        call_command('export_prestamos', '--formato', 'jsonl', '--bloque', '1', stdout=salida, stderr=io.StringIO())
+        filas = [json.loads(linea) for linea in salida.getvalue().splitlines()]
+        self.assertEqual(len(filas), 4)
+        self.assertEqual(sorted((f['en_archivo'], f['activo']) for f in filas),
+                         [(False, True), (False, True), (True, False), (True, False)])
+
+
+class ContadoresPrestamosTests(CatalogoTestCase):
+    """
+    Pruebas de los contadores de préstamos desnormalizados, su reconciliación y
+    el endpoint de estadísticas.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.admin = Usuario.objects.create_user('admin', password='clave', rol='admin')
+        cls.libros = [
+            Libro.objects.create(titulo=f'Libro {i}', autor='A', ano_publicacion=2000, stock=2)
+            for i in range(3)
+        ]
+
+    def contadores(self):
+        return list(Libro.objects.order_by('pk').values_list('total_prestamos', 'prestamos_activos'))
+
+    def test_servicio_mantiene_los_contadores(self):
+        services.prestar_libro(self.usuario, self.libros[0])
+        services.devolver_libro(self.usuario, self.libros[0])
+        services.procesar_lote(self.usuario, [
+            {'libro_id': self.libros[0].pk, 'accion': 'prestar'},
+            {'libro_id': self.libros[1].pk, 'accion': 'prestar'},
+        ])
+        services.procesar_lote(self.usuario, [{'libro_id': self.libros[1].pk, 'accion': 'devolver'}])
+        self.assertEqual(self.contadores(), [(2, 1), (1, 0), (0, 0)])
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.prestamos_activos, 1)
+
+    def test_reconciliacion_corrige_desviaciones(self):
+        services.prestar_libro(self.usuario, self.libros[0])
+        services.prestar_libro(self.usuario, self.libros[1])
+        Libro.objects.filter(pk=self.libros[0].pk).update(total_prestamos=7, prestamos_activos=0)
+        Usuario.objects.filter(pk=self.usuario.pk).update(prestamos_activos=5)
+        salida = io.StringIO()
+        call_command('reconciliar_contadores', '--lote', '2', stdout=salida)
+        self.assertIn('1 libros y 1 usuarios', salida.getvalue())
+        self.assertEqual(self.contadores(), [(1, 1), (1, 1), (0, 0)])
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.prestamos_activos, 2)
+
+    def test_estadisticas(self):
+        otro = Usuario.objects.create_user('otro', password='clave')
+        services.prestar_libro(self.usuario, self.libros[1])
+        services.prestar_libro(otro, self.libros[1])
+        services.prestar_libro(self.usuario, self.libros[2])
+        services.devolver_libro(self.usuario, self.libros[2])
+        datos = self.client.get(reverse('api:estadisticas'), {'n': 2}).json()
+        self.assertEqual([libro['id'] for libro in datos['mas_prestados']], [self.libros[1].pk, self.libros[2].pk])
+        self.assertEqual([(libro['id'], libro['uso']) for libro in datos['mas_en_uso']], [(self.libros[1].pk, 1.0)])
+        self.assertNotIn('usuarios', datos)
+
+        self.client.force_login(self.admin)
+        datos = self.client.get(reverse('api:estadisticas')).json()
+        self.assertEqual([u['username'] for u in datos['usuarios']], ['lector', 'otro'])
+        self.assertEqual(self.client.get(reverse('api:estadisticas'), {'n': 'x'}).status_code, 400)
+
+
+class InstrumentacionTests(CatalogoTestCase):
+    """
+    Pruebas del middleware de instrumentación y del endpoint de métricas por ruta.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_user('admin', password='clave', rol='admin')
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=1)
+
+    def setUp(self):
+        super().setUp()
+        metricas.reiniciar()
+
+    @override_settings(INSTRUMENTACION_CABECERA=True)
+    def test_cabecera_server_timing(self):
+        respuesta = self.client.get(reverse('api:libro-detail', args=[self.libro.pk]))
+        cabecera = respuesta.headers['Server-Timing']
+        self.assertRegex(cabecera, r'^db;dur=[\d.]+;desc="consultas=1", app;dur=[\d.]+, total;dur=[\d.]+$')
+
+    @override_settings(INSTRUMENTACION_CABECERA=False)
+    def test_sin_cabecera_server_timing(self):
+        respuesta = self.client.get(reverse('api:libro-detail', args=[self.libro.pk]))
+        self.assertNotIn('Server-Timing', respuesta.headers)
+        # La petición se sigue midiendo para las métricas por ruta.
+        self.assertEqual(metricas.resumen()['GET api/libros/<int:pk>/']['peticiones'], 1)
+
+    @override_settings(INSTRUMENTACION_CABECERA=True)
+    def test_cuenta_las_consultas_de_vistas_sincronas_bajo_asgi(self):
+        # Bajo ASGI, las vistas síncronas se ejecutan en otro hilo, con otras conexiones.
+        respuesta = async_to_sync(self.async_client.get)(reverse('api:libro-detail', args=[self.libro.pk]))
+        self.assertIn('desc="consultas=1"', respuesta.headers['Server-Timing'])
+        cache.clear()
+        respuesta = async_to_sync(self.async_client.get)(reverse('api:async-libro-detail', args=[self.libro.pk]))
+        self.assertIn('desc="consultas=1"', respuesta.headers['Server-Timing'])
+
+    def test_registra_peticiones_lentas_y_repetidas(self):
+        with override_settings(INSTRUMENTACION_UMBRAL_LENTO_MS=0):
+            with self.assertLogs('books.instrumentacion', 'WARNING') as logs:
+                self.client.get(reverse('api:libro-list-create'))
+        registro = json.loads(logs.output[0].split(':', 2)[2])
+        self.assertEqual((registro['evento'], registro['ruta']), ('peticion_lenta', 'GET api/libros/'))
+
+        def vista_con_n_mas_uno(request):
+            for libro_id in [self.libro.pk] * 5:
+                Libro.objects.get(pk=libro_id)
+            return HttpResponse()
+
+        middleware = InstrumentacionMiddleware(vista_con_n_mas_uno)
+        with self.assertLogs('books.instrumentacion', 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+        registro = json.loads(logs.output[0].split(':', 2)[2])
+        self.assertEqual(registro['evento'], 'consultas_repetidas')
+        self.assertEqual(registro['repetidas'][0]['veces'], 5)
+
+    def test_metricas_por_ruta_solo_admin(self):
+        for _ in range(3):
+            self.client.get(reverse('api:libro-detail', args=[self.libro.pk]))
+        url = reverse('api:metricas')
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.admin)
+        rutas = self.client.get(url).json()['rutas']
+        detalle = rutas['GET api/libros/<int:pk>/']
+        self.assertEqual(detalle['peticiones'], 3)
+        self.assertEqual(set(detalle['total_ms']), {'p50', 'p95', 'p99'})
+        self.assertEqual(self.client.delete(url).status_code, 204)
+
+    def test_percentil_rango_mas_cercano(self):
+        valores = list(range(1, 101))
+        self.assertEqual([percentil(valores, p) for p in (50, 95, 99)], [50, 95, 99])
+        self.assertEqual(percentil([7], 99), 7)
+
+
+class GeneracionYMedicionTests(TransactionTestCase):
+    """
+    Pruebas de los comandos seed_biblioteca, bench_biblioteca y bench_asgi con volúmenes pequeños.
+    """
+    def test_seed_genera_datos_coherentes(self):
+        call_command('seed_biblioteca', '--usuarios', '20', '--libros', '50', '--prestamos', '400',
+                     '--activos', '0.3', '--lote', '64', stdout=io.StringIO())
+        self.assertEqual(Usuario.objects.count(), 20)
+        self.assertEqual(Libro.objects.count(), 50)
+        self.assertEqual(Prestamo.objects.count(), 400)
+        # Los contadores y el stock generados coinciden con los préstamos insertados.
+        salida = io.StringIO()
+        call_command('reconciliar_contadores', stdout=salida)
+        self.assertIn('0 libros y 0 usuarios', salida.getvalue())
+        self.assertFalse(Libro.objects.filter(stock__lt=0).exists())
+        self.assertFalse(Prestamo.objects.filter(activo=False, fecha_devolucion__lt=F('fecha_prestamo')).exists())
+        # La distribución está sesgada: el libro más prestado acumula muchos más préstamos que la media.
+        mas_prestado = Libro.objects.order_by('-total_prestamos').first()
+        self.assertGreater(mas_prestado.total_prestamos, 400 / 50 * 3)
+
+    def test_bench_devuelve_json_por_escenario(self):
+        call_command('seed_biblioteca', '--usuarios', '4', '--libros', '30', '--prestamos', '50', stdout=io.StringIO())
+        salida = io.StringIO()
+        # Un solo hilo: la base SQLite en memoria de las pruebas no admite escrituras concurrentes.
+        call_command('bench_biblioteca', '--hilos', '1', '--peticiones', '40', '--calentamiento', '2',
+                     '--etiqueta', 'prueba', stdout=salida)
+        resultado = json.loads(salida.getvalue())
+        self.assertEqual(resultado['etiqueta'], 'prueba')
+        self.assertGreater(resultado['total']['rps'], 0)
+        self.assertLessEqual(set(resultado['escenarios']), {
+            'catalogo', 'catalogo_api', 'detalle', 'busqueda', 'prestar', 'devolver', 'mis_libros',
+        })
+        for escenario in resultado['escenarios'].values():
+            self.assertLessEqual(escenario['p50_ms'], escenario['p99_ms'])
+            self.assertIsNotNone(escenario['consultas_media'])
+            self.assertNotIn('500', escenario['estados'])
+
+    def test_bench_asgi_compara_un_worker_de_cada_tipo(self):
+        call_command('seed_biblioteca', '--usuarios', '2', '--libros', '5', '--prestamos', '0', stdout=io.StringIO())
+        salida = io.StringIO()
+        call_command('bench_asgi', '--peticiones', '6', '--concurrencia', '2', '--latencia-ms', '0',
+                     '--escenarios', 'detalle', stdout=salida)
+        resultado = json.loads(salida.getvalue())['detalle']
+        for servidor in ('wsgi_un_worker', 'asgi_un_worker'):
+            self.assertEqual(resultado[servidor]['estados'], {'200': 6})
+
+
+class PresupuestoConsultasTests(CatalogoTestCase):
+    """
+    Presupuesto de consultas SQL de cada vista web y de cada endpoint de la API.
+    Cada petición se mide con la caché vacía sobre dos volúmenes de datos: el número
+    de consultas debe ser el mismo en ambos (sin N+1) y no superar el presupuesto
+    declarado. Si se supera, el fallo muestra el SQL capturado.
+    """
+    TAMANOS = (3, 30)
+
+    # Nombre del caso: presupuesto de consultas (sesión y usuario incluidos).
+    PRESUPUESTOS = {
+        'web:listar_libros': 4,
+        'web:listar_libros?q': 4,
+        'web:detalle_libro': 1,
+        'web:crear_libro': 2,
+        'web:editar_libro': 3,
+        'web:prestar_libro': 6,
+        'web:devolver_libro': 7,
+        'web:reservar_libro': 7,
+        'web:mis_libros': 3,
+        'web:login': 0,
+        'web:logout': 4,
+        'api:libro-list-create': 2,
+        'api:libro-list-create?q': 2,
+        'api:libro-list-create?autor': 2,
+        'api:libro-facetas': 3,
+        'api:libro-list-create POST': 4,
+        'api:libro-detail': 1,
+        'api:libro-detail PUT': 5,
+        'api:libro-detail DELETE': 7,
+        'api:prestar-libro': 6,
+        'api:devolver-libro': 7,
+        'api:reservar-libro': 7,
+        'api:reservas': 3,
+        'api:devolver-libro con reserva': 10,
+        'api:prestamos-batch': 9,
+        'api:estadisticas': 2,
+        'api:estadisticas admin': 5,
+        'api:metricas': 2,
+        'api:tokens': 3,
+        'api:tokens POST': 3,
+        'api:token-revocar': 4,
+        'api:async-libro-list-create': 2,
+        'api:async-libro-detail': 1,
+        'api:async-prestar-libro': 7,
+        'api:async-devolver-libro': 8,
+    }
+    # Rutas que no se miden, con el motivo.
+    SIN_PRESUPUESTO = {
+        # Flujo de larga duración: consulta el stock al conectar y después solo recibe eventos.
+        'api:eventos-stock',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.admin = Usuario.objects.create_user('admin', password='clave', rol='admin')
+
+    def poblar(self, cantidad: int) -> None:
+        """
+        Completa el catálogo hasta `cantidad` libros, cada uno con un préstamo del
+        lector (activo, devuelto o archivado) y otro de un usuario distinto, y con
+        una reserva en espera de cada uno.
+        """
+        for i in range(Libro.objects.count(), cantidad):
+            libro = Libro.objects.create(titulo=f'Libro {i}', autor=f'Autor {i}', ano_publicacion=2000, stock=3)
+            otro = Usuario.objects.create_user(f'otro{i}')
+            services.prestar_libro(otro, libro)
+            services.prestar_libro(self.usuario, libro)
+            if i % 3:
+                services.devolver_libro(self.usuario, libro)
+            if i % 3 == 2:
+                call_command('archivar_prestamos', '--dias', '-1', stdout=io.StringIO())
+            Reserva.objects.create(usuario=otro, libro=libro)
+            Reserva.objects.create(usuario=self.usuario, libro=libro)
+
+    def casos(self) -> dict:
+        """
+        Devuelve, por caso, el usuario que hace la petición y una función que la realiza.
+        Los datos que la petición modifica se preparan aquí, fuera de la medición.
+        """
+        libro = Libro.objects.order_by('pk').first()
+        prestables = [
+            Libro.objects.create(titulo=f'Nuevo {i}', autor='A', ano_publicacion=2000, stock=2) for i in range(6)
+        ]
+        for prestado in prestables[3:]:
+            services.prestar_libro(self.usuario, prestado)
+        nuevo = {'titulo': 'Nuevo', 'autor': 'A', 'ano_publicacion': 2001, 'stock': 1}
+        lote = {'operaciones': [
+            {'libro_id': prestables[0].pk, 'accion': 'prestar'},
+            {'libro_id': libro.pk, 'accion': 'prestar'},
+            {'libro_id': prestables[5].pk, 'accion': 'devolver'},
+        ]}
+        borrable = Libro.objects.create(titulo='Borrable', autor='A', ano_publicacion=2000, stock=1)
+        agotados = [
+            Libro.objects.create(titulo=f'Agotado {i}', autor='A', ano_publicacion=2000, stock=1) for i in range(2)
+        ]
+        services.prestar_libro(self.admin, agotados[0])
+        services.prestar_libro(self.usuario, agotados[1])
+        services.reservar_libro(self.admin, agotados[1])
+        reservable = Libro.objects.create(titulo='Reservable', autor='A', ano_publicacion=2000, stock=1)
+        services.prestar_libro(self.admin, reservable)
+        asincronos = [
+            Libro.objects.create(titulo=f'Asíncrono {i}', autor='A', ano_publicacion=2000, stock=2) for i in range(2)
+        ]
+        services.prestar_libro(self.usuario, asincronos[1])
+        _, token = emitir_token(self.usuario)
+        get, post = self.client.get, self.client.post
+        return {
+            'web:listar_libros': (None, lambda: get(reverse('books:listar_libros'))),
+            'web:listar_libros?q': (None, lambda: get(reverse('books:listar_libros'), {'q': 'libro'})),
+            'web:detalle_libro': (None, lambda: get(reverse('books:detalle_libro', args=[libro.pk]))),
+            'web:crear_libro': (self.admin, lambda: get(reverse('books:crear_libro'))),
+            'web:editar_libro': (self.admin, lambda: get(reverse('books:editar_libro', args=[libro.pk]))),
+            'web:prestar_libro': (self.usuario, lambda: post(reverse('books:prestar_libro', args=[prestables[1].pk]))),
+            'web:devolver_libro': (self.usuario, lambda: post(reverse('books:devolver_libro', args=[prestables[3].pk]))),
+            'web:reservar_libro': (self.usuario, lambda: post(reverse('books:reservar_libro', args=[reservable.pk]))),
+            'web:mis_libros': (self.usuario, lambda: get(reverse('books:mis_libros'))),
+            'web:login': (None, lambda: get(reverse('books:login'))),
+            'web:logout': (self.usuario, lambda: post(reverse('books:logout'))),
+            'api:libro-list-create': (None, lambda: get(reverse('api:libro-list-create'))),
+            'api:libro-list-create?q': (None, lambda: get(reverse('api:libro-list-create'), {'q': 'libro'})),
+            'api:libro-list-create?autor': (None, lambda: get(
+                reverse('api:libro-list-create'), {'autor': 'A', 'ano_desde': 1990, 'disponible': 'si'}
+            )),
+            'api:libro-facetas': (None, lambda: get(reverse('api:libro-facetas'), {'q': 'libro', 'ano_hasta': 2010})),
+            'api:libro-list-create POST': (self.admin, lambda: post(reverse('api:libro-list-create'), nuevo)),
+            'api:libro-detail': (None, lambda: get(reverse('api:libro-detail', args=[libro.pk]))),
+            'api:libro-detail PUT': (self.admin, lambda: self.client.put(
+                reverse('api:libro-detail', args=[libro.pk]), nuevo, content_type='application/json')),
+            'api:libro-detail DELETE': (self.admin, lambda: self.client.delete(
+                reverse('api:libro-detail', args=[borrable.pk]))),
+            'api:prestar-libro': (self.usuario, lambda: post(reverse('api:prestar-libro', args=[prestables[2].pk]))),
+            'api:devolver-libro': (self.usuario, lambda: post(reverse('api:devolver-libro', args=[prestables[4].pk]))),
+            'api:reservar-libro': (self.usuario, lambda: post(reverse('api:reservar-libro', args=[agotados[0].pk]))),
+            'api:reservas': (self.usuario, lambda: get(reverse('api:reservas'))),
+            'api:devolver-libro con reserva': (self.usuario, lambda: post(
+                reverse('api:devolver-libro', args=[agotados[1].pk]))),
+            'api:prestamos-batch': (self.usuario, lambda: post(
+                reverse('api:prestamos-batch'), lote, content_type='application/json')),
+            'api:estadisticas': (None, lambda: get(reverse('api:estadisticas'))),
+            'api:estadisticas admin': (self.admin, lambda: get(reverse('api:estadisticas'))),
+            'api:metricas': (self.admin, lambda: get(reverse('api:metricas'))),
+            'api:tokens': (self.usuario, lambda: get(reverse('api:tokens'))),
+            'api:tokens POST': (self.usuario, lambda: post(reverse('api:tokens'), {'nombre': 'script'})),
+            'api:token-revocar': (self.usuario, lambda: self.client.delete(reverse('api:token-revocar', args=[token.pk]))),
+            'api:async-libro-list-create': (None, lambda: get(reverse('api:async-libro-list-create'))),
+            'api:async-libro-detail': (None, lambda: get(reverse('api:async-libro-detail', args=[libro.pk]))),
+            'api:async-prestar-libro': (self.usuario, lambda: post(
+                reverse('api:async-prestar-libro', args=[asincronos[0].pk]))),
+            'api:async-devolver-libro': (self.usuario, lambda: post(
+                reverse('api:async-devolver-libro', args=[asincronos[1].pk]))),
+        }
+
+    def medir(self, nombre: str, usuario, peticion) -> list[str]:
+        self.client.logout()
+        if usuario is not None:
+            self.client.force_login(usuario)
+        cache.clear()
+        with CaptureQueriesContext(connection) as ctx:
+            respuesta = peticion()
+        self.assertLess(respuesta.status_code, 400, f'{nombre}: respuesta {respuesta.status_code}')
+        return consultas_sql(ctx)
+
+    def test_presupuesto_de_consultas_constante(self):
+        medidas = {}
+        for tamano in self.TAMANOS:
+            self.poblar(tamano)
+            casos = self.casos()
+            self.assertEqual(set(casos), set(self.PRESUPUESTOS))
+            for nombre, (usuario, peticion) in casos.items():
+                consultas = self.medir(nombre, usuario, peticion)
+                presupuesto = self.PRESUPUESTOS[nombre]
+                if len(consultas) > presupuesto:
+                    self.fail(
+                        f'{nombre} ({tamano} libros): {len(consultas)} consultas, presupuesto {presupuesto}.\n'
+                        + '\n'.join(f'  {i}. {sql}' for i, sql in enumerate(consultas, 1))
+                    )
+                medidas.setdefault(nombre, []).append(len(consultas))
+        variables = {nombre: n for nombre, n in medidas.items() if len(set(n)) > 1}
+        self.assertEqual(variables, {}, 'El número de consultas depende del volumen de datos.')
+
+    def test_todas_las_rutas_tienen_presupuesto(self):
+        rutas = {
+            f'{prefijo}:{patron.name}'
+            for prefijo, modulo in (('web', web_urls), ('api', api_urls)) for patron in modulo.urlpatterns
+        }
+        medidas = {re.split(r'[ ?]', nombre)[0] for nombre in self.PRESUPUESTOS}
+        self.assertEqual(rutas - medidas - self.SIN_PRESUPUESTO, set())
+
+
+class TokensAccesoTests(TestCase):
+    """
+    Pruebas de la emisión, verificación y revocación de tokens de acceso.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=2)
+
+    def setUp(self):
+        vaciar_cache()
+
+    def emitir(self, **datos):
+        datos = {'username': 'lector', 'password': 'clave', **datos}
+        return self.client.post(reverse('api:tokens'), datos).json()
+
+    def test_emitir_y_usar_token(self):
+        datos = self.emitir(nombre='script')
+        registro = TokenAcceso.objects.get(pk=datos['id'])
+        # En la base de datos solo se guarda el resumen del token.
+        self.assertEqual(registro.resumen, resumen_token(datos['token']))
+        self.assertNotIn(datos['token'], [registro.resumen, registro.prefijo])
+        respuesta = self.client.post(
+            reverse('api:prestar-libro', args=[self.libro.pk]), HTTP_AUTHORIZATION=f'Bearer {datos["token"]}'
+        )
+        self.assertEqual(respuesta.status_code, 201)
+
+    def test_credenciales_invalidas(self):
+        respuesta = self.client.post(reverse('api:tokens'), {'username': 'lector', 'password': 'otra'})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_verificacion_cacheada_sin_consultas(self):
+        token = self.emitir()['token']
+        peticion = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        autenticacion = TokenAutenticacion()
+        with self.assertNumQueries(1):
+            autenticacion.authenticate(Request(peticion))
+        with self.assertNumQueries(0):
+            usuario, _ = autenticacion.authenticate(Request(peticion))
+        self.assertEqual(usuario, self.usuario)
+
+    def test_token_revocado_o_expirado(self):
+        datos = self.emitir()
+        cabecera = {'HTTP_AUTHORIZATION': f'Bearer {datos["token"]}'}
+        url = reverse('api:prestar-libro', args=[self.libro.pk])
+        self.assertEqual(self.client.delete(reverse('api:token-revocar', args=[datos['id']]), **cabecera).status_code, 204)
+        self.assertEqual(self.client.post(url, **cabecera).status_code, 401)
+
+        datos = self.emitir()
+        TokenAcceso.objects.filter(pk=datos['id']).update(expira=timezone.now() - timedelta(seconds=1))
+        vaciar_cache()
+        self.assertEqual(self.client.post(url, HTTP_AUTHORIZATION=f'Bearer {datos["token"]}').status_code, 401)
+
+    def test_autenticacion_basica_desactivada(self):
+        basica = base64.b64encode(b'lector:clave').decode()
+        respuesta = self.client.post(
+            reverse('api:prestar-libro', args=[self.libro.pk]), HTTP_AUTHORIZATION=f'Basic {basica}'
+        )
+        self.assertEqual(respuesta.status_code, 401)
+
+
+class SesionesCacheadasTests(CatalogoTestCase):
+    """
+    Pruebas de las sesiones cacheadas y de la caché del usuario de la sesión.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.admin = Usuario.objects.create_superuser('admin', password='clave', rol='admin')
+        cls.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=1)
+
+    def test_lectura_autenticada_cacheada_sin_consultas(self):
+        self.client.force_login(self.usuario)
+        urls = [
+            reverse('api:libro-detail', args=[self.libro.pk]),
+            reverse('books:detalle_libro', args=[self.libro.pk]),
+            reverse('books:listar_libros'),
+        ]
+        for url in urls:
+            self.client.get(url)
+        for url in urls:
+            with self.subTest(url=url), self.assertNumQueries(0):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_cambio_de_rol_en_el_admin_invalida_el_usuario(self):
+        self.client.force_login(self.usuario)
+        url = reverse('books:crear_libro')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        admin = self.client_class()
+        admin.force_login(self.admin)
+        datos = {
+            'username': 'lector', 'rol': 'admin', 'is_active': 'on',
+            'date_joined_0': '2024-01-01', 'date_joined_1': '00:00:00',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = admin.post(reverse('admin:books_usuario_change', args=[self.usuario.pk]), datos)
+        self.assertEqual(respuesta.status_code, 302)
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_cambio_de_contrasena_cierra_la_sesion(self):
+        self.client.force_login(self.usuario)
+        url = reverse('books:mis_libros')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.usuario.set_password('nueva')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+    def test_lectura_simultanea_no_deja_cacheada_la_contrasena_anterior(self):
+        self.client.force_login(self.usuario)
+        url = reverse('books:mis_libros')
+        anterior = Usuario.objects.get(pk=self.usuario.pk)
+        self.usuario.set_password('nueva')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.usuario.save()
+            # Otra petición, que aún no ve el cambio sin confirmar, cachea el usuario anterior.
+            cache.set(clave_usuario(self.usuario.pk), anterior)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class ApiAsincronaTests(CatalogoTestCase):
+    """
+    Los endpoints de `books.api_async` deben responder igual que sus equivalentes síncronos.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.admin = Usuario.objects.create_user('admin', password='clave', rol='admin')
+        cls.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=1)
+
+    def setUp(self):
+        super().setUp()
+        vaciar_cache()
+        self.token = emitir_token(self.usuario)[0]
+
+    def pedir(self, metodo: str, nombre: str, args=(), headers=None):
+        """
+        Pide `nombre` a la API síncrona y `async-<nombre>` a la asíncrona.
+        """
+        sincrona = getattr(self.client, metodo)(reverse(f'api:{nombre}', args=args), headers=headers)
+        asincrona = async_to_sync(getattr(self.async_client, metodo))(
+            reverse(f'api:async-{nombre}', args=args), headers=headers
+        )
+        return sincrona, asincrona
+
+    def comparar(self, metodo: str, nombre: str, args=(), estado: int = 200, headers=None):
+        """
+        Comprueba que ambas versiones responden con `estado` y el mismo cuerpo.
+        """
+        sincrona, asincrona = self.pedir(metodo, nombre, args, headers)
+        self.assertEqual((sincrona.status_code, asincrona.status_code), (estado, estado))
+        self.assertEqual(asincrona.json(), sincrona.json())
+        return sincrona, asincrona
+
+    def test_listado_y_detalle(self):
+        for _ in range(2):  # Sin caché y con caché.
+            self.comparar('get', 'libro-list-create')
+            self.comparar('get', 'libro-detail', [self.libro.pk])
+        self.comparar('get', 'libro-detail', [0], estado=404)
+
+    def test_peticiones_condicionales(self):
+        for nombre, args in [('libro-list-create', ()), ('libro-detail', [self.libro.pk])]:
+            sincrona, asincrona = self.pedir('get', nombre, args)
+            # El ETag del listado depende de la URL, así que cada versión se valida con el suyo.
+            repetidas = self.pedir('get', nombre, args, headers={'if-none-match': sincrona['ETag']})[0], \
+                self.pedir('get', nombre, args, headers={'if-none-match': asincrona['ETag']})[1]
+            for version, original, repetida in zip(('sync', 'async'), (sincrona, asincrona), repetidas):
+                with self.subTest(nombre=nombre, version=version):
+                    self.assertEqual(repetida.status_code, 304)
+                    self.assertEqual(repetida['ETag'], original['ETag'])
+
+    def test_prestamo_y_devolucion(self):
+        cabecera = {'authorization': f'Bearer {self.token}'}
+        url = reverse('api:async-prestar-libro', args=[self.libro.pk])
+        respuesta = async_to_sync(self.async_client.post)(url, headers=cabecera)
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.json(), {'message': 'Has prestado "Rayuela" exitosamente.'})
+        # Sin stock: mismo error que la vista síncrona.
+        self.comparar('post', 'prestar-libro', [self.libro.pk], estado=400, headers=cabecera)
+        respuesta = async_to_sync(self.async_client.post)(
+            reverse('api:async-devolver-libro', args=[self.libro.pk]), headers=cabecera
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(Libro.objects.get(pk=self.libro.pk).stock, 1)
+
+    def test_autenticacion_y_permisos(self):
+        args = [self.libro.pk]
+        self.comparar('post', 'prestar-libro', args, estado=401)
+        self.comparar('post', 'prestar-libro', args, estado=401, headers={'authorization': 'Bearer invalido'})
+        self.comparar('post', 'prestar-libro', [0], estado=404, headers={'authorization': f'Bearer {self.token}'})
+        self.client.force_login(self.admin)
+        self.async_client.force_login(self.admin)
+        self.comparar('post', 'prestar-libro', args, estado=403)
+
+    def test_cadena_de_middleware_asincrona(self):
+        # Ningún middleware obliga a ejecutar la petición en un hilo.
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            manejador = ASGIHandler()
+        self.assertTrue(iscoroutinefunction(manejador._middleware_chain))
+
+
+class SerializacionRapidaTests(CatalogoTestCase):
+    """
+    Pruebas del listado con `values()`, los campos parciales (`fields`) y el renderizador con orjson.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        Libro.objects.bulk_create(
+            Libro(titulo=f'Libro {i:02d}', autor=f'Autor {i % 3}', ano_publicacion=1900 + i, stock=i % 4)
+            for i in range(25)
+        )
+
+    def test_listado_igual_que_el_serializador(self):
+        datos = self.client.get(reverse('api:libro-list-create'), {'ordering': '-autor'}).json()
+        esperados = Libro.objects.order_by('-autor', '-id')[:20]
+        self.assertEqual(datos['results'], LibroSerializer(esperados, many=True).data)
+
+    def test_campos_parciales_y_cursor(self):
+        url = reverse('api:libro-list-create')
+        vistos = []
+        parametros = {'fields': 'titulo,id', 'ordering': 'ano_publicacion', 'page_size': 10}
+        while url:
+            datos = self.client.get(url, parametros).json()
+            self.assertTrue(all(list(fila) == ['id', 'titulo'] for fila in datos['results']))
+            vistos += [fila['titulo'] for fila in datos['results']]
+            url, parametros = datos['next'], None
+        self.assertEqual(vistos, [f'Libro {i:02d}' for i in range(25)])
+
+    def test_campo_desconocido(self):
+        respuesta = self.client.get(reverse('api:libro-list-create'), {'fields': 'titulo,isbn'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertIn('isbn', respuesta.json()['fields'][0])
+
+    def test_renderizador_con_la_misma_salida_que_drf(self):
+        datos = {
+            'texto': 'Cortázar\u2028', 'fecha': timezone.now(), 'decimal': Decimal('1.50'),
+            'lista': [1, 2.5, None, True], 'anidado': {1: 'clave numérica'},
+        }
+        self.assertEqual(JSONRapidoRenderer().render(datos), JSONRenderer().render(datos))
+        self.assertEqual(
+            JSONRapidoRenderer().render(datos, 'application/json; indent=2'),
+            JSONRenderer().render(datos, 'application/json; indent=2'),
+        )
+
+    def test_api_navegable_solo_en_desarrollo(self):
+        # Las vistas de DRF fijan sus renderizadores al importarse, así que no basta
+        # con `override_settings`: se prueban las dos listas que puede dar la configuración.
+        for debug, estado in ((False, 406), (True, 200)):
+            renderizadores = [import_string(ruta) for ruta in renderizadores_api(debug)]
+            with self.subTest(debug=debug), \
+                    mock.patch.object(LibroListCreateView, 'renderer_classes', renderizadores):
+                respuesta = self.client.get(reverse('api:libro-list-create'), headers={'accept': 'text/html'})
+                self.assertEqual(respuesta.status_code, estado)
+
+
+class ReservasTests(CatalogoTestCase):
+    """
+    Pruebas de la cola de reservas de libros sin stock.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.lector = Usuario.objects.create_user('lector', password='clave')
+        cls.primero = Usuario.objects.create_user('primero', password='clave')
+        cls.segundo = Usuario.objects.create_user('segundo', password='clave')
+        cls.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=1)
+        services.prestar_libro(cls.lector, cls.libro)
+
+    def reservar(self, usuario, metodo: str = 'post'):
+        self.client.force_login(usuario)
+        return getattr(self.client, metodo)(reverse('api:reservar-libro', args=[self.libro.pk]))
+
+    def test_cola_fifo_con_posiciones(self):
+        self.assertEqual(self.reservar(self.primero).json()['posicion'], 1)
+        self.assertEqual(self.reservar(self.segundo).json()['posicion'], 2)
+        self.assertEqual(self.reservar(self.segundo).json()['error'], services.ReservaDuplicadaError.mensaje)
+        self.assertEqual(self.reservar(self.lector).json()['error'], services.PrestamoActivoError.mensaje)
+        # El primero abandona la cola y el segundo avanza.
+        self.assertEqual(self.reservar(self.primero, 'delete').status_code, 204)
+        self.assertEqual(self.reservar(self.primero, 'delete').status_code, 400)
+        self.assertEqual([r['posicion'] for r in self.client.get(reverse('api:reservas')).json()], [])
+        self.client.force_login(self.segundo)
+        self.assertEqual([r['posicion'] for r in self.client.get(reverse('api:reservas')).json()], [1])
+
+    def test_con_stock_no_se_reserva(self):
+        services.devolver_libro(self.lector, self.libro)
+        respuesta = self.reservar(self.primero)
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.json()['error'], services.ReservaInnecesariaError.mensaje)
+
+    def test_devolucion_presta_a_la_primera_reserva(self):
+        services.reservar_libro(self.primero, self.libro)
+        services.reservar_libro(self.segundo, self.libro)
+        atendida = services.devolver_libro(self.lector, self.libro)
+        self.assertEqual(atendida.usuario, self.primero)
+        self.libro.refresh_from_db()
+        self.assertEqual((self.libro.stock, self.libro.prestamos_activos, self.libro.total_prestamos), (0, 1, 2))
+        self.assertTrue(Prestamo.objects.filter(usuario=self.primero, libro=self.libro, activo=True).exists())
+        self.assertEqual(list(Reserva.objects.filter(activa=True).values_list('usuario', flat=True)), [self.segundo.pk])
+        self.assertEqual([r.posicion for r in services.reservas_con_posicion(self.segundo)], [1])
+        # Los contadores desnormalizados siguen cuadrando.
+        salida = io.StringIO()
+        call_command('reconciliar_contadores', stdout=salida)
+        self.assertIn('0 libros y 0 usuarios', salida.getvalue())
+
+    def test_devolucion_por_lote_atiende_la_cola(self):
+        services.reservar_libro(self.primero, self.libro)
+        services.procesar_lote(self.lector, [{'libro_id': self.libro.pk, 'accion': 'devolver'}])
+        self.libro.refresh_from_db()
+        self.assertEqual((self.libro.stock, self.libro.prestamos_activos, self.libro.total_prestamos), (0, 1, 2))
+        self.assertEqual(Usuario.objects.get(pk=self.primero.pk).prestamos_activos, 1)
+        self.assertFalse(Reserva.objects.filter(activa=True).exists())
+
+    def test_devoluciones_cruzadas_actualizan_los_usuarios_en_una_sentencia(self):
+        # Cada uno devuelve un libro que el otro tiene reservado. Si cada devolución
+        # actualizara primero a quien devuelve y después al titular de la reserva, dos
+        # devoluciones simultáneas bloquearían las mismas filas en orden inverso.
+        otro_libro = Libro.objects.create(titulo='Ficciones', autor='Borges', ano_publicacion=1944, stock=1)
+        services.prestar_libro(self.primero, otro_libro)
+        services.reservar_libro(self.primero, self.libro)
+        services.reservar_libro(self.lector, otro_libro)
+        for usuario, libro, titular in ((self.lector, self.libro, self.primero), (self.primero, otro_libro, self.lector)):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(services.devolver_libro(usuario, libro).usuario, titular)
+            actualizaciones = [sql for sql in consultas_sql(ctx) if sql.startswith('UPDATE "books_usuario"')]
+            self.assertEqual(len(actualizaciones), 1, actualizaciones)
+        self.assertEqual(
+            dict(Usuario.objects.filter(pk__in=[self.lector.pk, self.primero.pk]).values_list('username', 'prestamos_activos')),
+            {'lector': 1, 'primero': 1},
+        )
+        self.assertEqual(
+            set(Prestamo.objects.filter(activo=True).values_list('usuario__username', 'libro__titulo')),
+            {('primero', 'Rayuela'), ('lector', 'Ficciones')},
+        )
+
+    def test_reserva_desde_la_web(self):
+        self.client.force_login(self.primero)
+        url = reverse('books:detalle_libro', args=[self.libro.pk])
+        self.assertContains(self.client.get(url), reverse('books:reservar_libro', args=[self.libro.pk]))
+        respuesta = self.client.post(reverse('books:reservar_libro', args=[self.libro.pk]), follow=True)
+        self.assertContains(respuesta, 'posición 1')
+
+
+@override_settings(EVENTOS_AGRUPAR_SEGUNDOS=0.05, EVENTOS_LATIDO_SEGUNDOS=0.05)
+class EventosStockTests(CatalogoTestCase):
+    """
+    Pruebas del flujo Server-Sent Events con los cambios de stock.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.lector = Usuario.objects.create_user('lector', password='clave')
+        cls.otro = Usuario.objects.create_user('otro', password='clave')
+        cls.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=3)
+        cls.otro_libro = Libro.objects.create(titulo='Ficciones', autor='Borges', ano_publicacion=1944, stock=1)
+
+    def setUp(self):
+        super().setUp()
+        # Cada prueba empieza con una central sin suscripciones.
+        parche = mock.patch.object(eventos, '_central', eventos.CentralLocal())
+        parche.start()
+        self.addCleanup(parche.stop)
+
+    def prestar(self):
+        for usuario in (self.lector, self.otro):
+            with self.captureOnCommitCallbacks(execute=True):
+                services.prestar_libro(usuario, self.libro)
+
+    async def test_envia_el_stock_actual_y_agrupa_los_cambios(self):
+        respuesta = await self.async_client.get(
+            reverse('api:eventos-stock'), {'libros': f'{self.libro.pk},{self.otro_libro.pk}'}
+        )
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+        flujo = aiter(respuesta.streaming_content)
+        self.assertEqual(await anext(flujo), b'retry: 3000\n\n')
+        self.assertEqual(
+            await anext(flujo),
+            f'event: stock\ndata: {{"{self.libro.pk}":3,"{self.otro_libro.pk}":1}}\n\n'.encode(),
+        )
+        self.assertEqual(await anext(flujo), b': latido\n\n')
+        # Dos préstamos seguidos llegan como un único evento con el stock final.
+        await sync_to_async(self.prestar)()
+        self.assertEqual(await anext(flujo), f'event: stock\ndata: {{"{self.libro.pk}":1}}\n\n'.encode())
+        # Al desconectarse el cliente se retira la suscripción.
+        await self.desconectar(flujo)
+        self.assertFalse(eventos.obtener_central().interesa([self.libro.pk, self.otro_libro.pk]))
+
+    def test_parametro_libros_invalido(self):
+        url = reverse('api:eventos-stock')
+        for libros in ('', 'a,1', ','.join(str(pk) for pk in range(1, 102))):
+            respuesta = async_to_sync(self.async_client.get)(url, {'libros': libros})
+            self.assertEqual(respuesta.status_code, 400)
+
+    def test_sin_suscriptores_no_se_consulta_el_stock(self):
+        with self.assertNumQueries(0), self.captureOnCommitCallbacks(execute=True):
+            eventos.publicar_stock([self.libro.pk])
+
+    async def desconectar(self, flujo):
+        """
+        Cancela la espera del siguiente evento, como el servidor ASGI al desconectarse el cliente.
+        """
+        siguiente = asyncio.ensure_future(anext(flujo))
+        await asyncio.sleep(0)
+        siguiente.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await siguiente
+
+    @override_settings(EVENTOS_CONEXIONES_POR_CLIENTE=1)
+    async def test_limite_de_conexiones_abiertas_por_cliente(self):
+        url = reverse('api:eventos-stock')
+        respuesta = await self.async_client.get(url, {'libros': self.libro.pk})
+        flujo = aiter(respuesta.streaming_content)
+        await anext(flujo)
+        rechazada = await self.async_client.get(url, {'libros': self.otro_libro.pk})
+        self.assertEqual(rechazada.status_code, 429)
+        # Otro cliente no comparte el límite.
+        await self.async_client.aforce_login(self.lector)
+        otra = await self.async_client.get(url, {'libros': self.otro_libro.pk})
+        self.assertEqual(otra.status_code, 200)
+        otro_flujo = aiter(otra.streaming_content)
+        await anext(otro_flujo)
+        await self.desconectar(otro_flujo)
+        await self.async_client.alogout()
+        # Al cerrarse la primera conexión, el cliente puede abrir otra.
+        await self.desconectar(flujo)
+        respuesta = await self.async_client.get(url, {'libros': self.otro_libro.pk})
+        self.assertEqual(respuesta.status_code, 200)
+        flujo = aiter(respuesta.streaming_content)
+        await anext(flujo)
+        await self.desconectar(flujo)
+
+    @override_settings(LIMITE_IP=0)
+    def test_aplica_el_limite_por_coste(self):
+        respuesta = async_to_sync(self.async_client.get)(reverse('api:eventos-stock'), {'libros': self.libro.pk})
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertFalse(eventos.obtener_central().interesa([self.libro.pk]))
+
+    def test_rechazado_con_wsgi(self):
+        respuesta = self.client.get(reverse('api:eventos-stock'), {'libros': self.libro.pk})
+        self.assertEqual(respuesta.status_code, 501)
+
+
+class FiltrosCatalogoTests(CatalogoTestCase):
+    """
+    Pruebas de los filtros del catálogo y de sus facetas.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.ficciones = Libro.objects.create(titulo='Ficciones', autor='Borges', ano_publicacion=1944, stock=2)
+        Libro.objects.create(titulo='El Aleph', autor='Borges', ano_publicacion=1949, stock=0)
+        Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=1)
+        Libro.objects.create(titulo='Cien años de soledad', autor='García Márquez', ano_publicacion=1967, stock=0)
+
+    def titulos(self, **parametros) -> list[str]:
+        respuesta = self.client.get(reverse('api:libro-list-create'), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return [libro['titulo'] for libro in respuesta.json()['results']]
+
+    def test_filtros_de_la_api(self):
+        self.assertEqual(self.titulos(autor='Borges'), ['El Aleph', 'Ficciones'])
+        self.assertEqual(self.titulos(ano_desde=1945, ano_hasta=1965), ['El Aleph', 'Rayuela'])
+        self.assertEqual(self.titulos(disponible='no'), ['Cien años de soledad', 'El Aleph'])
+        self.assertEqual(self.titulos(autor='Borges', disponible='si'), ['Ficciones'])
+        for parametros in ({'ano_desde': 'mil'}, {'ano_desde': 2000, 'ano_hasta': 1990}, {'disponible': 'quizas'}):
+            with self.subTest(parametros=parametros):
+                self.assertEqual(self.client.get(reverse('api:libro-list-create'), parametros).status_code, 400)
+                self.assertEqual(self.client.get(reverse('books:listar_libros'), parametros).status_code, 400)
+
+    def test_facetas_ignoran_su_propio_filtro(self):
+        datos = self.client.get(reverse('api:libro-facetas'), {'autor': 'Borges'}).json()
+        self.assertEqual(datos['autores'], [
+            {'autor': 'Borges', 'total': 2}, {'autor': 'Cortázar', 'total': 1}, {'autor': 'García Márquez', 'total': 1},
+        ])
+        self.assertEqual(datos['decadas'], [{'decada': 1940, 'total': 2}])
+        self.assertEqual(datos['disponibilidad'], {'disponibles': 1, 'agotados': 1})
+
+    def test_facetas_cacheadas_e_invalidadas_con_el_catalogo(self):
+        url = reverse('api:libro-facetas')
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json()['disponibilidad'], {'disponibles': 2, 'agotados': 2})
+        with self.captureOnCommitCallbacks(execute=True):
+            services.prestar_libro(self.usuario, self.ficciones)
+            services.prestar_libro(Usuario.objects.create_user('otro'), self.ficciones)
+        self.assertEqual(self.client.get(url).json()['disponibilidad'], {'disponibles': 1, 'agotados': 3})
+
+    def test_catalogo_web_con_filtros_y_facetas(self):
+        url = reverse('books:listar_libros')
+        # Sin `disponible`, el catálogo web muestra solo los libros con stock.
+        respuesta = self.client.get(url)
+        self.assertContains(respuesta, 'Ficciones')
+        self.assertNotContains(respuesta, 'El Aleph')
+        self.assertContains(respuesta, '?autor=Borges')
+        respuesta = self.client.get(url, {'disponible': 'todos', 'ano_desde': 1940, 'ano_hasta': 1949})
+        self.assertEqual([libro.titulo for libro in respuesta.context['libros']], ['El Aleph', 'Ficciones'])
+        # Los enlaces de paginación y de orden conservan los filtros.
+        self.assertContains(respuesta, 'ano_desde=1940')
+
+
+class AutoresTests(CatalogoTestCase):
+    """
+    Pruebas de los autores normalizados y de su relleno por lotes.
+    """
+    def test_grafias_de_un_autor_comparten_registro(self):
+        self.assertEqual(normalizar_autor('  J.R.R.  Tolkien '), normalizar_autor('j. r. r. tolkien'))
+        self.assertEqual(normalizar_autor('García Márquez'), 'garcia marquez')
+        primero = Libro.objects.create(titulo='Cien años de soledad', autor='García Márquez', ano_publicacion=1967)
+        segundo = Libro.objects.create(titulo='El otoño del patriarca', autor='garcia marquez', ano_publicacion=1975)
+        self.assertEqual(Autor.objects.count(), 1)
+        self.assertEqual(primero.autor_normalizado_id, segundo.autor_normalizado_id)
+        # El libro muestra la grafía del autor, no la recibida.
+        self.assertEqual(segundo.autor, 'García Márquez')
+        self.assertEqual(
+            [libro['titulo'] for libro in self.client.get(reverse('api:libro-list-create'), {'autor': 'GARCIA MARQUEZ'}).json()['results']],
+            ['Cien años de soledad', 'El otoño del patriarca'],
+        )
+
+    def test_api_formularios_e_importacion_reciben_el_nombre(self):
+        admin = Usuario.objects.create_user('admin', password='clave', rol='admin')
+        self.client.force_login(admin)
+        respuesta = self.client.post(reverse('api:libro-list-create'), {
+            'titulo': 'Rayuela', 'autor': 'Julio Cortázar', 'ano_publicacion': 1963, 'stock': 1,
+        })
+        self.assertEqual(respuesta.json()['autor'], 'Julio Cortázar')
+        self.client.post(reverse('books:crear_libro'), {
+            'titulo': 'Bestiario', 'autor': 'julio cortazar', 'ano_publicacion': 1951, 'stock': 1,
+        })
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as archivo:
+            archivo.write('titulo,autor,ano_publicacion,stock\nFinal del juego,JULIO CORTÁZAR,1956,1\nAura,Carlos Fuentes,1962,1\n')
+        self.addCleanup(os.remove, archivo.name)
+        call_command('import_libros', archivo.name, stdout=io.StringIO(), stderr=io.StringIO())
+        cortazar = Autor.objects.get(clave='julio cortazar')
+        self.assertEqual(
+            sorted(cortazar.libros.values_list('titulo', flat=True)), ['Bestiario', 'Final del juego', 'Rayuela'],
+        )
+        self.assertEqual(set(Libro.objects.values_list('autor', flat=True)), {'Julio Cortázar', 'Carlos Fuentes'})
+
+    def test_relleno_por_lotes_de_los_libros_existentes(self):
+        for i in range(5):
+            Libro.objects.create(titulo=f'Libro {i}', autor='x', ano_publicacion=2000)
+        # Estado previo a la migración: nombres libres y sin autor normalizado.
+        hace_un_rato = timezone.now() - timedelta(hours=1)
+        for i, autor in enumerate(['Borges', 'borges', 'Cortázar', 'BORGES', '']):
+            Libro.objects.filter(titulo=f'Libro {i}').update(autor=autor, autor_normalizado=None, actualizado=hace_un_rato)
+        Autor.objects.all().delete()
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(rellenar_autores(tamano=2), 4)
+        # Tres lotes de dos libros y una última lectura vacía; cada lote usa como mucho
+        # ocho consultas (savepoint, lectura, autores, dos UPDATE y liberación).
+        self.assertLessEqual(len(consultas), 3 * 8 + 3)
+        self.assertEqual(dict(Libro.objects.values_list('titulo', 'autor')), {
+            'Libro 0': 'Borges', 'Libro 1': 'Borges', 'Libro 2': 'Cortázar', 'Libro 3': 'Borges', 'Libro 4': '',
+        })
+        # Solo los libros cuyo nombre cambia se marcan como modificados.
+        renombrados = Libro.objects.filter(actualizado__gt=hace_un_rato).values_list('titulo', flat=True)
+        self.assertEqual(sorted(renombrados), ['Libro 1', 'Libro 3'])
+        self.assertEqual(Autor.objects.count(), 2)
+        self.assertEqual(rellenar_autores(tamano=2), 0)
+
+    def test_corregir_la_grafia_del_autor_la_copia_en_sus_libros(self):
+        libro = Libro.objects.create(titulo='Ficciones', autor='borges', ano_publicacion=1944)
+        self.client.get(reverse('api:libro-detail', args=[libro.pk]))
+        autor = libro.autor_normalizado
+        autor.nombre = 'Jorge Luis Borges'
+        with self.captureOnCommitCallbacks(execute=True):
+            autor.save()
+        self.assertEqual(self.client.get(reverse('api:libro-detail', args=[libro.pk])).json()['autor'], 'Jorge Luis Borges')
+        # La clave no cambia: los nuevos libros con la grafía antigua siguen siendo suyos.
+        otro = Libro.objects.create(titulo='El Aleph', autor='Borges', ano_publicacion=1949)
+        self.assertEqual((otro.autor_normalizado_id, otro.autor), (autor.pk, 'Jorge Luis Borges'))
+
+
+class AdminGranVolumenTests(CatalogoTestCase):
+    """
+    Pruebas de los listados del admin para tablas grandes.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser('admin', password='clave', rol='admin')
+        cls.lector = Usuario.objects.create_user('lector', password='clave')
+        fechas = ['2023-12-31 23:30', '2024-03-05 10:00', '2024-03-20 10:00', '2024-07-10 10:00', '2025-01-02 10:00']
+        for i, fecha in enumerate(fechas):
+            libro = Libro.objects.create(titulo=f'Libro {i}', autor='Autor', ano_publicacion=1990 + i, stock=1)
+            prestamo = services.prestar_libro(cls.lector, libro)
+            Prestamo.objects.filter(pk=prestamo.pk).update(fecha_prestamo=f'{fecha}Z')
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.admin)
+
+    def test_listado_de_prestamos_sin_consultas_por_fila(self):
+        url = reverse('admin:books_prestamo_changelist')
+        # La primera petición de la sesión carga además el usuario.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as pocas:
+            self.client.get(url)
+        for i in range(10):
+            services.prestar_libro(self.lector, Libro.objects.create(titulo=f'Otro {i}', autor='A', ano_publicacion=2000, stock=1))
+        with CaptureQueriesContext(connection) as muchas:
+            respuesta = self.client.get(url)
+        self.assertContains(respuesta, 'Otro 9')
+        self.assertEqual(len(muchas), len(pocas))
+
+    def test_navegacion_por_fechas_indexada(self):
+        queryset = admin.site._registry[Prestamo].get_queryset(RequestFactory().get('/'))
+        nativo = Prestamo.objects.all()
+        for kind, filtro in (('year', {}), ('month', {'fecha_prestamo__year': 2024}),
+                             ('day', {'fecha_prestamo__year': 2024, 'fecha_prestamo__month': 3})):
+            with self.subTest(kind=kind):
+                # El rango y una única consulta con los EXISTS de todos los periodos.
+                with self.assertNumQueries(2):
+                    periodos = list(queryset.filter(**filtro).datetimes('fecha_prestamo', kind))
+                self.assertEqual(periodos, list(nativo.filter(**filtro).datetimes('fecha_prestamo', kind)))
+        respuesta = self.client.get(reverse('admin:books_prestamo_changelist'), {'fecha_prestamo__year': 2024})
+        self.assertContains(respuesta, 'fecha_prestamo__month=3')
+        self.assertNotContains(respuesta, 'fecha_prestamo__month=5')
+
+    def test_busqueda_por_usuario_o_libro(self):
+        url = reverse('admin:books_prestamo_changelist')
+        self.assertEqual(self.client.get(url, {'q': 'lector'}).context['cl'].result_count, 5)
+        self.assertEqual(self.client.get(url, {'q': 'lect'}).context['cl'].result_count, 0)
+        self.assertEqual(self.client.get(url, {'q': 'Libro 3'}).context['cl'].result_count, 1)
+
+    def test_formularios_con_autocompletado(self):
+        respuesta = self.client.get(reverse('admin:books_prestamo_add'))
+        self.assertContains(respuesta, 'class="admin-autocomplete"', count=2)
+        autocompletado = self.client.get(reverse('admin:autocomplete'), {
+            'app_label': 'books', 'model_name': 'prestamo', 'field_name': 'libro', 'term': 'Libro 2',
+        })
+        self.assertEqual([r['text'] for r in autocompletado.json()['results']], ['Libro 2'])
+
+    def test_filtro_por_decada_de_libros(self):
+        respuesta = self.client.get(reverse('admin:books_libro_changelist'), {'decada': 1990})
+        self.assertEqual(respuesta.context['cl'].result_count, 5)
+        self.assertContains(respuesta, '1990–1999')
+
+
+# La principal hace de réplica sin retraso: las pruebas comprueban a dónde envía el router cada lectura.
+@override_settings(DATABASE_REPLICAS=['default'])
+class ReplicasTests(CatalogoTestCase):
+    """
+    Pruebas del enrutado de las lecturas del catálogo a las réplicas.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.otro = Usuario.objects.create_user('otro', password='clave')
+        cls.libro = Libro.objects.create(titulo='Rayuela', autor='Cortázar', ano_publicacion=1963, stock=2)
+
+    def lecturas(self, peticion) -> set:
+        """
+        Ejecuta `peticion` y devuelve los destinos que el router eligió para sus lecturas
+        de libros y préstamos (las de la sesión y el usuario preceden a la elección).
+        """
+        destinos = set()
+        original = ReplicaRouter.db_for_read
+
+        def espia(router, model, **hints):
+            destino = original(router, model, **hints)
+            if model in (Libro, Prestamo):
+                destinos.add(destino)
+            return destino
+
+        with mock.patch.object(ReplicaRouter, 'db_for_read', espia):
+            self.assertEqual(peticion().status_code, 200)
+        return destinos
+
+    def test_lecturas_del_catalogo_en_la_replica(self):
+        self.client.force_login(self.usuario)
+        for url in (
+            reverse('books:listar_libros'),
+            reverse('books:detalle_libro', args=[self.libro.pk]),
+            reverse('api:libro-list-create'),
+            reverse('api:libro-detail', args=[self.libro.pk]),
+        ):
+            with self.subTest(url=url):
+                self.assertEqual(self.lecturas(lambda: self.client.get(url)), {'default'})
+        # Las demás vistas leen siempre de la principal.
+        services.prestar_libro(self.usuario, self.libro)
+        self.assertEqual(self.lecturas(lambda: self.client.get(reverse('books:mis_libros'))), {None})
+
+    def test_tras_escribir_el_usuario_lee_de_la_principal(self):
+        token = emitir_token(self.usuario)[0]
+        cabeceras = {'Authorization': f'Bearer {token}'}
+        detalle = reverse('api:libro-detail', args=[self.libro.pk])
+        self.client.post(reverse('api:prestar-libro', args=[self.libro.pk]), headers=cabeceras)
+        self.assertEqual(self.lecturas(lambda: self.client.get(detalle, headers=cabeceras)), {None})
+        # Los demás usuarios siguen leyendo de la réplica.
+        invalidar_libro(self.libro.pk)
+        self.client.force_login(self.otro)
+        self.assertEqual(self.lecturas(lambda: self.client.get(detalle)), {'default'})
+
+    def test_escritura_asincrona_fija_la_principal(self):
+        token = emitir_token(self.usuario)[0]
+        cabeceras = {'Authorization': f'Bearer {token}'}
+        async_to_sync(self.async_client.post)(reverse('api:async-prestar-libro', args=[self.libro.pk]), headers=cabeceras)
+        detalle = reverse('api:async-libro-detail', args=[self.libro.pk])
+        peticion = lambda: async_to_sync(self.async_client.get)(detalle, headers=cabeceras)
+        self.assertEqual(self.lecturas(peticion), {None})
+
+    def test_escrituras_y_migraciones_en_la_principal(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_write(Libro), 'default')
+        with override_settings(DATABASE_REPLICAS=['replica1']):
+            self.assertFalse(router.allow_migrate('replica1', 'books'))
+            self.assertTrue(router.allow_migrate('default', 'books'))
+
+
+@override_settings(LIMITE_VENTANA_SEGUNDOS=60, LIMITE_USUARIO=25, LIMITE_IP=3)
+class LimitePeticionesTests(CatalogoTestCase):
+    """
+    Pruebas del límite de peticiones por coste (con la caché en memoria local).
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user('lector', password='clave')
+        cls.libros = [
+            Libro.objects.create(titulo=f'Libro {i}', autor='A', ano_publicacion=2000, stock=1) for i in range(4)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        # Reloj del limitador al principio de una ventana.
+        self.reloj = mock.patch('books.limites.time', **{'time.return_value': 600.0}).start()
+        self.addCleanup(mock.patch.stopall)
+        self.cabeceras = {'Authorization': f'Bearer {emitir_token(self.usuario)[0]}'}
+
+    def prestar(self, libro, asincrona: bool = False):
+        if asincrona:
+            url = reverse('api:async-prestar-libro', args=[libro.pk])
+            return async_to_sync(self.async_client.post)(url, headers=self.cabeceras)
+        return self.client.post(reverse('api:prestar-libro', args=[libro.pk]), headers=self.cabeceras)
+
+    def test_prestamos_limitados_por_usuario_con_retry_after(self):
+        # Cada préstamo cuesta 10 unidades de las 25 del usuario.
+        self.assertEqual(self.prestar(self.libros[0]).status_code, 201)
+        # La versión asíncrona comparte el contador.
+        self.assertEqual(self.prestar(self.libros[1], asincrona=True).status_code, 201)
+        respuesta = self.prestar(self.libros[2])
+        self.assertEqual(respuesta.status_code, 429)
+        # Uso 30 (incluido el rechazo): en la siguiente ventana pesa 30 * (1 - 0.5) + 10 <= 25.
+        self.assertEqual(respuesta.headers['Retry-After'], '90')
+        self.assertFalse(Prestamo.objects.filter(libro=self.libros[2]).exists())
+        self.reloj.time.return_value = 690.0
+        self.assertEqual(self.prestar(self.libros[2]).status_code, 201)
+
+    def test_respuesta_asincrona_limitada(self):
+        self.assertEqual(self.prestar(self.libros[0]).status_code, 201)
+        self.assertEqual(self.prestar(self.libros[1]).status_code, 201)
+        respuesta = self.prestar(self.libros[2], asincrona=True)
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta.headers['Retry-After'], '90')
+        self.assertIn('detail', respuesta.json())
+
+    def test_lotes_cuestan_por_operacion(self):
+        url = reverse('api:prestamos-batch')
+        lote = lambda libros: {'operaciones': [{'libro_id': libro.pk, 'accion': 'prestar'} for libro in libros]}
+        # Cuatro operaciones cuestan 20 unidades, menos que dos préstamos sueltos.
+        respuesta = self.client.post(url, lote(self.libros), content_type='application/json', headers=self.cabeceras)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.prestar(self.libros[0]).status_code, 429)
+        respuesta = self.client.post(url, lote(self.libros[:2]), content_type='application/json', headers=self.cabeceras)
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(Prestamo.objects.count(), 4)
+
+    def test_lecturas_anonimas_limitadas_por_ip(self):
+        listado = reverse('api:libro-list-create')
+        asincrono = reverse('api:async-libro-list-create')
+        # La vista asíncrona delega en la síncrona al no estar cacheado: se cobra una vez.
+        self.assertEqual(async_to_sync(self.async_client.get)(asincrono).status_code, 200)
+        self.assertEqual(self.client.get(listado).status_code, 200)
+        self.assertEqual(self.client.get(listado).status_code, 200)
+        self.assertEqual(async_to_sync(self.async_client.get)(asincrono).status_code, 429)
+        self.assertEqual(self.client.get(listado).status_code, 429)
+        self.assertEqual(self.client.get(listado, REMOTE_ADDR='10.0.0.2').status_code, 200)
+        # Los usuarios autenticados tienen su propio límite.
+        self.assertEqual(self.client.get(listado, headers=self.cabeceras).status_code, 200)
+
+    def test_vistas_web_de_prestamo(self):
+        self.client.force_login(self.usuario)
+        for libro in self.libros[:2]:
+            self.assertEqual(self.client.post(reverse('books:prestar_libro', args=[libro.pk])).status_code, 302)
+        respuesta = self.client.post(reverse('books:prestar_libro', args=[self.libros[2].pk]))
+        self.assertEqual(respuesta.status_code, 429)
+        self.assertEqual(respuesta.headers['Retry-After'], '90')
+
+    def test_con_redis_una_sola_ida_y_vuelta(self):
+        redis = RedisCache('redis://localhost:6379/0', {})
+        cliente = mock.MagicMock()
+        pipeline = cliente.pipeline.return_value.__enter__.return_value
+        pipeline.execute.return_value = [True, 30, b'10']
+        with mock.patch.object(redis._cache, 'get_client', return_value=cliente) as get_client, \
+                mock.patch('books.limites.caches', {'default': redis}):
+            # Uso 30 en la ventana actual, 10 en la anterior (peso 1): supera el límite de 25.
+            self.assertEqual(limites.consumir('u1', 25, 10), 90)
+        get_client.assert_called_once_with(redis.make_and_validate_key('limite:u1:10'), write=True)
+        self.assertEqual(
+            [llamada[0] for llamada in pipeline.method_calls],
+            ['set', 'incrby', 'get', 'execute'],
+        )
+        pipeline.set.assert_called_once_with(redis.make_and_validate_key('limite:u1:10'), 0, ex=120, nx=True)
+        pipeline.get.assert_called_once_with(redis.make_and_validate_key('limite:u1:9'))
+        pipeline.execute.assert_called_once_with()
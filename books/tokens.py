@@ -0,0 +1,116 @@
+"""
+Emisión, verificación y revocación de tokens de acceso a la API.
+Verificar un token cuesta un resumen SHA-256 y una búsqueda por índice único,
+frente al PBKDF2 completo que ejecuta la autenticación básica en cada petición.
+Los usuarios resueltos se guardan además durante `TOKEN_CACHE_SEGUNDOS` en una
+caché del proceso, de modo que las peticiones seguidas con el mismo token no
+consultan la base de datos. Por eso una revocación hecha desde otro proceso
+tarda como máximo ese tiempo en aplicarse en los demás.
+"""
+import copy
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import TokenAcceso, Usuario
+
+# Número máximo de tokens resueltos que se conservan en la caché del proceso.
+MAXIMO_EN_CACHE = 10_000
+
+_cache = OrderedDict()
+_bloqueo = threading.Lock()
+
+
+def resumen_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def emitir_token(usuario: Usuario, nombre: str = '', dias: int | None = None) -> tuple[str, TokenAcceso]:
+    """
+    Crea un token para `usuario` válido durante `dias` (por defecto, `TOKEN_DURACION_DIAS`).
+    Devuelve el token en claro, que no vuelve a poder obtenerse, y su registro.
+    """
+    token = secrets.token_urlsafe(32)
+    registro = TokenAcceso.objects.create(
+        usuario=usuario,
+        resumen=resumen_token(token),
+        prefijo=token[:8],
+        nombre=nombre,
+        expira=timezone.now() + timedelta(days=dias or settings.TOKEN_DURACION_DIAS),
+    )
+    return token, registro
+
+
+def usuario_de_token(token: str) -> Usuario | None:
+    """
+    Devuelve el usuario activo dueño de `token`, o None si el token no existe o ha expirado.
+    """
+    resumen = resumen_token(token)
+    usuario = _desde_cache(resumen)
+    if usuario is None:
+        usuario = _guardar(resumen, _consulta_token(resumen).first())
+    return usuario
+
+
+async def ausuario_de_token(token: str) -> Usuario | None:
+    """
+    Versión asíncrona de `usuario_de_token` (ver `books.api_async`).
+    """
+    resumen = resumen_token(token)
+    usuario = _desde_cache(resumen)
+    if usuario is None:
+        usuario = _guardar(resumen, await _consulta_token(resumen).afirst())
+    return usuario
+
+
+def _consulta_token(resumen: str):
+    return TokenAcceso.objects.select_related('usuario').filter(
+        resumen=resumen, expira__gt=timezone.now(), usuario__is_active=True
+    )
+
+
+def _desde_cache(resumen: str) -> Usuario | None:
+    with _bloqueo:
+        entrada = _cache.get(resumen)
+    if entrada is None:
+        return None
+    usuario, expira, caduca = entrada
+    if time.monotonic() < caduca and timezone.now() < expira:
+        # Cada petición recibe su propia copia: las vistas pueden modificar request.user.
+        return copy.copy(usuario)
+    olvidar(resumen)
+    return None
+
+
+def _guardar(resumen: str, registro: TokenAcceso | None) -> Usuario | None:
+    if registro is None:
+        return None
+    with _bloqueo:
+        _cache[resumen] = (registro.usuario, registro.expira, time.monotonic() + settings.TOKEN_CACHE_SEGUNDOS)
+        if len(_cache) > MAXIMO_EN_CACHE:
+            _cache.popitem(last=False)
+    return copy.copy(registro.usuario)
+
+
+def revocar_token(registro: TokenAcceso) -> None:
+    """
+    Elimina el token y lo retira de la caché de este proceso.
+    """
+    olvidar(registro.resumen)
+    registro.delete()
+
+
+def olvidar(resumen: str) -> None:
+    with _bloqueo:
+        _cache.pop(resumen, None)
+
+
+def vaciar_cache() -> None:
+    with _bloqueo:
+        _cache.clear()
@@ -15,6 +15,7 @@ urlpatterns = [
     path('libro/<int:pk>/editar/', views.EditarLibroView.as_view(), name='editar_libro'),
     path('libro/<int:pk>/prestar/', views.PrestarLibroView.as_view(), name='prestar_libro'),
     path('libro/<int:pk>/devolver/', views.DevolverLibroView.as_view(), name='devolver_libro'),
+    path('libro/<int:pk>/reservar/', views.ReservarLibroView.as_view(), name='reservar_libro'),
     path('mis-libros/', views.MisLibrosView.as_view(), name='mis_libros'),
     path('login/', views.LoginView.as_view(), name='login'),
     path('logout/', LogoutView.as_view(next_page='books:listar_libros'), name='logout'),
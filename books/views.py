@@ -1,34 +1,125 @@
+import math
+
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, View
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
+from django.core.exceptions import BadRequest
+from django.http import HttpResponse
+from django.template.loader import get_template
+from django.utils.safestring import mark_safe
 from django.urls import reverse_lazy
-from django.utils import timezone
+from . import services
+from .archivo import HISTORIAL_POR_PAGINA, historial_usuario, paginar_historial
+from .cache import clave_detalle, clave_listado, fragmentos_libros, obtener_o_calcular
 from .models import Libro, Prestamo, Usuario
+from .filtros import FiltroInvalido, facetas, leer_filtros
 from .forms import LibroForm
+from .limites import PRESTAMO, consumir, identidad
+from .pagination import CursorInvalido, normalizar_orden, paginar, paginar_ranking
+from .replicas import activar_replica
+from .search import buscar_libros
+from .services import PrestamoError, PrestamoNoEncontradoError
 from django.contrib.auth.views import LoginView as DjangoLoginView
 
-class ListarLibrosView(ListView):
+class LecturaEnReplicaMixin:
+    """
+    Mixin para que las consultas de una vista de solo lectura se hagan en una réplica.
     """
-    Vista para listar todos los libros disponibles en la biblioteca (stock > 0).
+    def get(self, request, *args, **kwargs):
+        activar_replica(request.user)
+        return super().get(request, *args, **kwargs)
+
+class ListarLibrosView(LecturaEnReplicaMixin, ListView):
+    """
+    Vista para listar los libros de la biblioteca (por defecto, los que tienen stock).
+    Pagina por cursor (keyset), permite ordenar por título, autor o año, buscar
+    por título o autor con el parámetro `q` y filtrar por autor, años y
+    disponibilidad (ver `books.filtros`), mostrando las facetas de cada filtro.
+    La página se compone con la tarjeta cacheada de cada libro (`tarjeta_template_name`).
     """
     model = Libro
     template_name = 'books/listar_libros.html'
+    tarjeta_template_name = 'books/tarjeta_libro.html'
     context_object_name = 'libros'
+    paginate_by = 24
     
     def get_queryset(self):
         """
-        Devuelve solo los libros que tienen stock disponible.
+        Devuelve los libros que cumplen los filtros (sin `disponible`, solo los que
+        tienen stock), filtrados por la búsqueda `q` si se indica.
+        """
+        try:
+            self.filtros = leer_filtros(self.request.GET, disponible=True)
+        except FiltroInvalido as e:
+            raise BadRequest(str(e))
+        queryset = self.filtros.aplicar(Libro.objects.all())
+        self.busqueda = self.request.GET.get('q', '').strip()
+        return buscar_libros(queryset, self.busqueda) if self.busqueda else queryset
+    
+    def paginate_queryset(self, queryset, page_size: int):
+        """
+        Obtiene la página indicada por los parámetros `cursor` y `ordering`
+        sin usar OFFSET ni contar el total de libros. Las búsquedas se paginan
+        por relevancia.
+        """
+        orden = normalizar_orden(self.request.GET.get('ordering'))
+        cursor = self.request.GET.get('cursor')
+        self.orden = orden
+        
+        def calcular_pagina():
+            try:
+                if self.busqueda:
+                    return paginar_ranking(queryset, cursor, page_size)
+                return paginar(queryset, orden, cursor, page_size)
+            except CursorInvalido:
+                raise BadRequest('Cursor inválido.')
+        
+        # La página se guarda en la caché versionada del catálogo.
+        clave = clave_listado('web-lista', orden, cursor, self.busqueda, self.filtros, page_size)
+        pagina = obtener_o_calcular(clave, calcular_pagina)
+        return None, pagina, pagina.objetos, True
+    
+    def get_context_data(self, **kwargs):
+        """
+        Añade el ordenamiento activo, las opciones disponibles, los filtros con sus
+        facetas y las tarjetas de los libros al contexto.
         """
-        return Libro.objects.filter(stock__gt=0)
+        context = super().get_context_data(**kwargs)
+        # Cada tarjeta se cachea con la versión de su libro: al cambiar el catálogo
+        # solo se renderizan de nuevo las de los libros modificados.
+        tarjeta = get_template(self.tarjeta_template_name)
+        context['tarjetas'] = [
+            mark_safe(html) for html in
+            fragmentos_libros('web-tarjeta', context['libros'], lambda libro: tarjeta.render({'libro': libro}))
+        ]
+        context['orden'] = self.orden
+        context['busqueda'] = self.busqueda
+        context['filtros'] = self.filtros
+        context['facetas'] = facetas(self.filtros, self.busqueda)
+        context['ordenes'] = [
+            ('titulo', 'Título'),
+            ('autor', 'Autor'),
+            ('ano_publicacion', 'Año (más antiguos)'),
+            ('-ano_publicacion', 'Año (más recientes)'),
+        ]
+        return context
 
-class DetalleLibroView(DetailView):
+class DetalleLibroView(LecturaEnReplicaMixin, DetailView):
     """
     Vista para mostrar los detalles de un libro específico.
     """
     model = Libro
     template_name = 'books/detalle_libro.html'
     context_object_name = 'libro'
+    
+    def get_object(self, queryset=None):
+        """
+        Obtiene el libro desde la caché versionada cuando es posible.
+        """
+        obtener = super().get_object
+        return obtener_o_calcular(clave_detalle('web-detalle', self.kwargs['pk']), lambda: obtener(queryset))
 
 class EsAdminMixin(UserPassesTestMixin):
     """
@@ -60,7 +151,22 @@ class EditarLibroView(LoginRequiredMixin, EsAdminMixin, UpdateView):
     form_class = LibroForm
     success_url = reverse_lazy('books:listar_libros')
 
-class PrestarLibroView(LoginRequiredMixin, View):
+class LimitePrestamoMixin:
+    """
+    Mixin que aplica a los POST de una vista el límite por coste de los préstamos
+    (ver `books.limites`). Al superarlo responde 429 con `Retry-After`.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        if request.method == 'POST':
+            clave, limite = identidad(request, request.user)
+            espera = consumir(clave, limite, settings.LIMITE_COSTES[PRESTAMO])
+            if espera is not None:
+                respuesta = HttpResponse('Demasiadas peticiones. Inténtalo de nuevo en unos segundos.', status=429)
+                respuesta.headers['Retry-After'] = str(math.ceil(espera))
+                return respuesta
+        return super().dispatch(request, *args, **kwargs)
+
+class PrestarLibroView(LoginRequiredMixin, LimitePrestamoMixin, View):
     """
     Vista para que un usuario regular pueda prestar un libro.
     """
@@ -75,24 +181,39 @@ class PrestarLibroView(LoginRequiredMixin, View):
         
         libro = get_object_or_404(Libro, pk=pk)
         
-        # Verificar si el usuario ya tiene este libro prestado activamente
-        prestamo_activo = Prestamo.objects.filter(
-            usuario=request.user, 
-            libro=libro, 
-            activo=True
-        ).exists()
+        try:
+            services.prestar_libro(request.user, libro)
+            messages.success(request, f'Has prestado "{libro.titulo}" exitosamente.')
+        except PrestamoError as e:
+            messages.error(request, str(e))
         
-        if prestamo_activo:
-            messages.error(request, 'Ya tienes este libro prestado. Por favor, devuélvelo antes de intentar prestarlo de nuevo.')
+        return redirect('books:detalle_libro', pk=pk)
+
+class ReservarLibroView(LoginRequiredMixin, LimitePrestamoMixin, View):
+    """
+    Vista para que un usuario regular reserve un libro sin stock.
+    """
+    def post(self, request, pk: int):
+        """
+        Maneja la solicitud POST para unirse a la cola de espera de un libro.
+        Al devolverse un ejemplar, la primera reserva de la cola se convierte en préstamo.
+        """
+        if request.user.rol != 'regular':
+            messages.error(request, 'Solo usuarios regulares pueden reservar libros.')
             return redirect('books:detalle_libro', pk=pk)
         
-        if libro.stock > 0:
-            Prestamo.objects.create(usuario=request.user, libro=libro, activo=True)
-            libro.stock -= 1
-            libro.save()
-            messages.success(request, f'Has prestado "{libro.titulo}" exitosamente.')
-        else:
-            messages.error(request, 'No hay stock disponible para este libro.')
+        libro = get_object_or_404(Libro, pk=pk)
+        
+        try:
+            reserva = services.reservar_libro(request.user, libro)
+            posicion = services.reservas_con_posicion(request.user).get(pk=reserva.pk).posicion
+            messages.success(
+                request,
+                f'Has reservado "{libro.titulo}". Estás en la posición {posicion} de la cola; '
+                'el libro se te prestará automáticamente cuando se devuelva un ejemplar.'
+            )
+        except PrestamoError as e:
+            messages.error(request, str(e))
         
         return redirect('books:detalle_libro', pk=pk)
 
@@ -103,13 +224,25 @@ class MisLibrosView(LoginRequiredMixin, ListView):
     """
     template_name = 'books/mis_libros.html'
     context_object_name = 'prestamos'
+    paginate_by = HISTORIAL_POR_PAGINA
     
     def get_queryset(self):
         """
-        Devuelve todos los registros de préstamo (activos e inactivos)
+        Devuelve todos los registros de préstamo (activos, devueltos y archivados)
         asociados al usuario autenticado, ordenados por fecha de préstamo descendente.
         """
-        return Prestamo.objects.filter(usuario=self.request.user).order_by('-fecha_prestamo')
+        return historial_usuario(self.request.user)
+    
+    def paginate_queryset(self, queryset, page_size: int):
+        """
+        Obtiene la página indicada por el parámetro `cursor` sin usar OFFSET:
+        el historial combinado de ambas tablas se corta en cada una por su índice.
+        """
+        try:
+            pagina = paginar_historial(self.request.user, self.request.GET.get('cursor'), page_size)
+        except CursorInvalido:
+            raise BadRequest('Cursor inválido.')
+        return None, pagina, pagina.objetos, pagina.siguiente is not None
     
 class LoginView(DjangoLoginView):
     """
@@ -123,7 +256,7 @@ class LoginView(DjangoLoginView):
         """
         return reverse_lazy('books:listar_libros')
     
-class DevolverLibroView(LoginRequiredMixin, View):
+class DevolverLibroView(LoginRequiredMixin, LimitePrestamoMixin, View):
     """
     Vista para que un usuario regular pueda devolver un libro.
     """
@@ -139,24 +272,11 @@ class DevolverLibroView(LoginRequiredMixin, View):
         libro = get_object_or_404(Libro, pk=pk)
         
         try:
-            # Busca el préstamo ACTIVO que el usuario tiene para este libro
-            prestamo = Prestamo.objects.get(
-                usuario=request.user, 
-                libro=libro, 
-                activo=True
-            )
-            
-            prestamo.fecha_devolucion = timezone.now()
-            prestamo.activo = False # Marca el préstamo como inactivo
-            prestamo.save()
-            
-            libro.stock += 1
-            libro.save()
-            
+            services.devolver_libro(request.user, libro)
             messages.success(request, f'Has devuelto "{libro.titulo}" exitosamente.')
-        except Prestamo.DoesNotExist:
+        except PrestamoNoEncontradoError as e:
             # Si no se encuentra un préstamo activo, el libro no está prestado o ya ha sido devuelto.
-            messages.info(request, 'Este libro no está prestado por ti o ya ha sido devuelto.')
+            messages.info(request, str(e))
         except Exception as e:
             # Captura cualquier otro error inesperado durante el proceso de devolución.
             messages.error(request, f'Ocurrió un error inesperado al intentar devolver el libro: {e}')